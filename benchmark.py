@@ -0,0 +1,419 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from detector import load_detector
+from image_io import PREVIEW_SIZE, PreviewPyramid, make_preview
+from instrumentation import Instrumentation
+from renderer import render_faces, render_ids
+from steel_pipeline import annotate_defects, detect_defects
+from tracking import make_tracker
+
+PIPELINES = ("steel", "steel-detail", "face-image", "face-webcam")
+DEFAULT_RESOLUTIONS = ("640x480", "1920x1080", "4096x1024")
+
+
+class PeakRssSampler:
+    # Samples resident memory on a background thread to find the peak of one run
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        try:
+            import psutil
+
+            self.process = psutil.Process()
+        except ImportError:
+            self.process = None
+
+    def rss(self):
+        if self.process is not None:
+            return self.process.memory_info().rss
+        import resource
+
+        # Without psutil only the process-lifetime peak is available (KiB on Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def sample(self):
+        while not self.stop_event.is_set():
+            self.peak = max(self.peak, self.rss())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.peak = self.rss()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop_event.set()
+        self.thread.join()
+        self.peak = max(self.peak, self.rss())
+
+
+def parse_resolution(value):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def synthetic_frame(width, height, seed=0):
+    # Textured noise with a few bright and dark blobs so detectors and trackers have structure
+    rng = np.random.default_rng(seed)
+    frame = cv2.resize(
+        rng.integers(0, 255, (max(height // 8, 1), max(width // 8, 1), 3), dtype=np.uint8),
+        (width, height),
+        interpolation=cv2.INTER_LINEAR,
+    )
+    for _ in range(8):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        radius = int(rng.integers(5, max(min(width, height) // 10, 6)))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.circle(frame, center, radius, color, -1)
+    return frame
+
+
+def make_synthetic_inputs(directory, resolutions, frames):
+    images, videos = [], []
+    for resolution in resolutions:
+        width, height = parse_resolution(resolution)
+        image_path = os.path.join(directory, f"synthetic-{resolution}.png")
+        cv2.imwrite(image_path, synthetic_frame(width, height))
+        images.append(image_path)
+
+        # A short clip where the scene drifts sideways a few pixels per frame
+        video_path = os.path.join(directory, f"synthetic-{resolution}.avi")
+        writer = cv2.VideoWriter(
+            video_path, cv2.VideoWriter_fourcc(*"MJPG"), 30, (width, height)
+        )
+        base = synthetic_frame(width + frames * 4, height, seed=1)
+        for index in range(frames):
+            writer.write(np.ascontiguousarray(base[:, index * 4 : index * 4 + width]))
+        writer.release()
+        videos.append(video_path)
+    return images, videos
+
+
+def timed_preview(metrics, frame):
+    with metrics.stage("convert"):
+        return make_preview(frame, PREVIEW_SIZE)
+
+
+def run_image_pipeline(pipeline, model, metrics, image_path):
+    # Same stages as the GUI scripts, minus the Tk display
+    with metrics.stage("decode"):
+        frame = cv2.imread(image_path)
+
+    with metrics.stage("inference"):
+        if pipeline == "face-image":
+            results = model.infer(image=frame, confidence=0.5, iou_threshold=0.5)
+            predictions = results[0].predictions
+        else:
+            predictions, _ = detect_defects(model, frame)
+    metrics.record_detector(model)
+
+    if pipeline == "face-image":
+        with metrics.stage("render"):
+            render_faces(frame, predictions, thickness=10, font_scale=1.5)
+        timed_preview(metrics, frame)
+        metrics.frame()
+        return 1
+
+    # The steel GUIs draw on the levels of a preview pyramid, never on the frame
+    with metrics.stage("convert"):
+        pyramid = PreviewPyramid(frame)
+    with metrics.stage("render"):
+        if pipeline == "steel":
+            pyramid.annotate(annotate_defects, predictions)
+        else:
+            pyramid.annotate(
+                lambda image, boxes: render_ids(image, boxes, color=(238, 0, 0)), predictions
+            )
+        pyramid.view()
+    metrics.frame()
+    return 1
+
+
+def run_video_pipeline(model, metrics, video_path, detect_every_n, tracker_name):
+    # Webcam pipeline driven by a recorded video, run sequentially so stage times add up
+    tracker = make_tracker(tracker_name)
+    capture = cv2.VideoCapture(video_path)
+    frames = 0
+    while True:
+        with metrics.stage("read"):
+            ret, frame = capture.read()
+        if not ret:
+            break
+
+        if frames % detect_every_n == 0:
+            with metrics.stage("inference"):
+                results = model.infer(image=frame, confidence=0.5, iou_threshold=0.5)
+            metrics.record_detector(model)
+            with metrics.stage("track"):
+                predictions = tracker.update(frame, results[0].predictions)
+        else:
+            with metrics.stage("track"):
+                predictions = tracker.track(frame)
+
+        with metrics.stage("render"):
+            render_faces(frame, predictions, thickness=2, font_scale=0.6)
+        timed_preview(metrics, frame)
+        metrics.frame()
+        frames += 1
+    capture.release()
+    return frames
+
+
+def run_video_processes(pool, metrics, video_path):
+    # Webcam pipeline with detection in worker processes: frames are decoded
+    # straight into the shared ring and every frame is inferred, as soon as a
+    # worker is free, while this process builds the previews
+    pool.on_result = lambda predictions, timestamp, milliseconds: metrics.record(
+        "inference", milliseconds
+    )
+    ring = pool.ring
+    capture = cv2.VideoCapture(video_path)
+    frames = 0
+    while True:
+        slot = ring.writable()
+        with metrics.stage("read"):
+            ret, frame = capture.read(ring.view(slot))
+        if not ret:
+            ring.release(slot)
+            break
+        with metrics.stage("wait"):
+            while not pool.idle():
+                time.sleep(0.0005)
+        pool.submit(slot, time.perf_counter())
+        timed_preview(metrics, frame)
+        ring.release(slot)
+        metrics.frame()
+        frames += 1
+    while pool.in_flight:
+        time.sleep(0.0005)
+    capture.release()
+    return frames
+
+
+def start_processes(video_path, processes):
+    # Worker processes and their ring are started once per video, outside the timing
+    from frame_ring import FrameRing, ProcessInference, ring_slots
+
+    capture = cv2.VideoCapture(video_path)
+    ret, frame = capture.read()
+    capture.release()
+    if not ret:
+        raise ValueError(f"could not read {video_path}")
+    ring = FrameRing(ring_slots(processes), frame.shape)
+    pool = ProcessInference(ring, processes, None)
+    pool.start()
+    # Wait for every worker to load its model and answer once
+    pool.on_result = lambda *_: None
+    for _ in range(processes):
+        slot = ring.writable()
+        ring.view(slot)[...] = frame
+        pool.submit(slot, 0.0)
+        ring.release(slot)
+    while pool.in_flight:
+        if pool.error:
+            raise RuntimeError(pool.error)
+        time.sleep(0.01)
+    return pool
+
+
+def benchmark(
+    pipeline, model, source, warmup, iterations, detect_every_n, tracker_name, processes=0
+):
+    pool = None
+    if pipeline == "face-webcam" and processes:
+        pool = start_processes(source, processes)
+
+    def run_once(metrics):
+        if pool is not None:
+            return run_video_processes(pool, metrics, source)
+        if pipeline == "face-webcam":
+            return run_video_pipeline(model, metrics, source, detect_every_n, tracker_name)
+        return run_image_pipeline(pipeline, model, metrics, source)
+
+    try:
+        for _ in range(warmup):
+            run_once(Instrumentation(pipeline))
+
+        metrics = Instrumentation(pipeline, window=1_000_000)
+        items = 0
+        with PeakRssSampler() as memory:
+            start_time = time.perf_counter()
+            for _ in range(iterations):
+                items += run_once(metrics)
+            elapsed = time.perf_counter() - start_time
+    finally:
+        if pool is not None:
+            pool.stop()
+            pool.ring.unlink()
+
+    return {
+        "pipeline": pipeline,
+        "input": os.path.basename(source),
+        "processes": processes if pool is not None else 0,
+        "ring_mb": round(pool.ring.nbytes / 2**20, 1) if pool is not None else None,
+        "iterations": iterations,
+        "items": items,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_per_s": round(items / elapsed, 3) if elapsed > 0 else 0.0,
+        "peak_rss_mb": round(memory.peak / 2**20, 1),
+        "stages": metrics.summary()["stages"],
+    }
+
+
+def environment(model):
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "backend": type(model).__name__,
+        "model_id": getattr(model, "model_id", None),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def run(args):
+    model = load_detector(args.backend)
+    with tempfile.TemporaryDirectory() as directory:
+        images, videos = make_synthetic_inputs(directory, args.resolutions, args.video_frames)
+        images += args.images or []
+        videos += args.videos or []
+
+        runs = []
+        for pipeline in args.pipelines:
+            sources = videos if pipeline == "face-webcam" else images
+            for source in sources:
+                result = benchmark(
+                    pipeline,
+                    model,
+                    source,
+                    args.warmup,
+                    args.iterations,
+                    args.detect_every_n,
+                    args.tracker,
+                    args.processes,
+                )
+                runs.append(result)
+                stages = result["stages"]
+                print(
+                    f"{pipeline:13s} {result['input']:28s} "
+                    f"{result['throughput_per_s']:8.2f}/s  "
+                    f"inference p50 {stages.get('inference', {}).get('p50_ms', 0):7.1f}ms  "
+                    f"peak RSS {result['peak_rss_mb']:.0f}MB"
+                )
+
+    report = {"environment": environment(model), "runs": runs}
+    with open(args.output, "w") as report_file:
+        json.dump(report, report_file, indent=2)
+    print(f"Report written to {args.output}")
+    return 0
+
+
+def compare(args):
+    # Flags stage latencies or throughput that got worse by more than the threshold
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    with open(args.candidate) as candidate_file:
+        candidate = json.load(candidate_file)
+
+    def key(result):
+        return result["pipeline"], result["input"]
+
+    baseline_runs = {key(result): result for result in baseline["runs"]}
+    regressions = 0
+    for result in candidate["runs"]:
+        reference = baseline_runs.get(key(result))
+        if reference is None:
+            continue
+        print(f"{result['pipeline']} / {result['input']}")
+
+        rows = [
+            (
+                "throughput/s",
+                reference["throughput_per_s"],
+                result["throughput_per_s"],
+                False,
+            ),
+            ("peak RSS MB", reference["peak_rss_mb"], result["peak_rss_mb"], True),
+        ]
+        for stage, values in result["stages"].items():
+            for metric in ("p50_ms", "p95_ms", "p99_ms"):
+                old = reference["stages"].get(stage, {}).get(metric)
+                if old is not None:
+                    rows.append((f"{stage} {metric}", old, values[metric], True))
+
+        for name, old, new, lower_is_better in rows:
+            change = (new - old) / old * 100 if old else 0.0
+            worse = change > args.threshold if lower_is_better else change < -args.threshold
+            regressions += worse
+            marker = "  REGRESSION" if worse else ""
+            print(f"  {name:24s} {old:10.2f} -> {new:10.2f} ({change:+6.1f}%){marker}")
+
+    print(f"{regressions} regression(s) above {args.threshold:.0f}%")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Headless benchmark of the steel and face pipelines."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="benchmark the pipelines")
+    run_parser.add_argument(
+        "--pipelines", nargs="+", choices=PIPELINES, default=list(PIPELINES)
+    )
+    run_parser.add_argument(
+        "--resolutions",
+        nargs="+",
+        default=list(DEFAULT_RESOLUTIONS),
+        help="synthetic input sizes as WIDTHxHEIGHT",
+    )
+    run_parser.add_argument("--images", nargs="*", help="extra image files to benchmark")
+    run_parser.add_argument("--videos", nargs="*", help="recorded video files for face-webcam")
+    run_parser.add_argument("--video-frames", type=int, default=60)
+    run_parser.add_argument("--warmup", type=int, default=3)
+    run_parser.add_argument("--iterations", type=int, default=20)
+    run_parser.add_argument("--detect-every-n", type=int, default=1)
+    run_parser.add_argument("--tracker", choices=("iou", "flow"), default="iou")
+    run_parser.add_argument(
+        "--processes",
+        type=int,
+        default=0,
+        help="face-webcam: infer every frame in N worker processes reading a shared frame ring",
+    )
+    run_parser.add_argument(
+        "--backend", help="detector backend, defaults to DETECTOR_BACKEND"
+    )
+    run_parser.add_argument("--output", default="benchmark.json")
+
+    compare_parser = subparsers.add_parser("compare", help="compare two reports")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=10.0, help="allowed change in percent"
+    )
+
+    args = parser.parse_args()
+    if args.command == "run":
+        return run(args)
+    return compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
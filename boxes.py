@@ -0,0 +1,122 @@
+import numpy as np
+
+
+def xywh_to_xyxy(boxes):
+    # Convert center x/y, width, height rows into corner coordinates
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    half = boxes[:, 2:4] / 2
+    return np.concatenate([boxes[:, 0:2] - half, boxes[:, 0:2] + half], axis=1)
+
+
+def xyxy_to_xywh(boxes):
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    size = boxes[:, 2:4] - boxes[:, 0:2]
+    return np.concatenate([boxes[:, 0:2] + size / 2, size], axis=1)
+
+
+def box_area(boxes):
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(
+        boxes[:, 3] - boxes[:, 1], 0, None
+    )
+
+
+def iou_matrix(boxes_a, boxes_b):
+    # Pairwise IoU between two sets of xyxy boxes, shape (len(a), len(b))
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    union = box_area(boxes_a)[:, None] + box_area(boxes_b)[None, :] - intersection
+    return intersection / np.maximum(union, 1e-9)
+
+
+def overlap_matrix(boxes_a, boxes_b):
+    # Pairwise intersection over the smaller box, so a cut-off part of a box still
+    # matches the whole box
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    smaller = np.minimum(box_area(boxes_a)[:, None], box_area(boxes_b)[None, :])
+    return intersection / np.maximum(smaller, 1e-9)
+
+
+def nms(boxes, scores, iou_threshold, class_ids=None):
+    # Greedy non-maximum suppression, returns indices of kept boxes by score.
+    # With class_ids, boxes of different classes never suppress each other.
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+    if iou_threshold >= 1:
+        # IoU never exceeds 1, so nothing is suppressed (raw candidates)
+        return np.argsort(-scores, kind="stable")
+
+    if class_ids is not None:
+        # Shift each class into its own coordinate range so one pass handles all classes.
+        # The range spans min to max, since boxes may reach into negative coordinates.
+        offset = float(boxes.max() - boxes.min()) + 1
+        boxes = boxes + (np.asarray(class_ids, dtype=np.float64) * offset)[:, None]
+
+    areas = box_area(boxes)
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size > 0:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        top_left = np.maximum(boxes[best, :2], boxes[rest, :2])
+        bottom_right = np.minimum(boxes[best, 2:], boxes[rest, 2:])
+        intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=1)
+        iou = intersection / np.maximum(areas[best] + areas[rest] - intersection, 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def nms_matrix(iou, iou_threshold):
+    # Greedy NMS for boxes already sorted by descending score, given their IoU
+    # matrix; returns the keep mask. A box survives unless a surviving
+    # higher-scoring box overlaps it, which is solved by iterating whole-matrix
+    # products to a fixpoint (a few rounds) instead of looping over boxes.
+    overlaps = np.triu(np.asarray(iou) > iou_threshold, k=1).astype(np.float32)
+    keep = np.ones(len(overlaps), dtype=bool)
+    while True:
+        updated = keep.astype(np.float32) @ overlaps == 0
+        if np.array_equal(updated, keep):
+            return keep
+        keep = updated
+
+
+def fuse_boxes(boxes, scores, iou_threshold, class_ids=None):
+    # Weighted box fusion: every box joins the highest-scoring cluster it overlaps,
+    # each cluster becomes one score-weighted average box carrying the best score.
+    # Returns fused boxes, scores and the index of each cluster's leading box.
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+    if len(boxes) == 0:
+        return boxes, scores, np.empty(0, dtype=np.int64)
+
+    overlaps = iou_matrix(boxes, boxes) > iou_threshold
+    if class_ids is not None:
+        class_ids = np.asarray(class_ids)
+        overlaps &= class_ids[:, None] == class_ids[None, :]
+
+    cluster = np.full(len(boxes), -1, dtype=np.int64)
+    leaders = []
+    for index in np.argsort(-scores, kind="stable"):
+        if cluster[index] >= 0:
+            continue
+        members = overlaps[index] & (cluster < 0)
+        cluster[members] = len(leaders)
+        cluster[index] = len(leaders)
+        leaders.append(index)
+
+    weights = np.zeros(len(leaders), dtype=np.float32)
+    fused = np.zeros((len(leaders), 4), dtype=np.float32)
+    np.add.at(weights, cluster, scores)
+    np.add.at(fused, cluster, boxes * scores[:, None])
+    fused /= np.maximum(weights, 1e-9)[:, None]
+    leaders = np.asarray(leaders, dtype=np.int64)
+    return fused, scores[leaders], leaders
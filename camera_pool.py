@@ -0,0 +1,265 @@
+import glob
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from detector import infer_batch, make_predictions, predictions_to_arrays
+from frame_pipeline import FpsMeter, StageThread
+from image_io import downscale, preview_scale, scale_predictions
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+def open_frame_source(spec, fps=None, loop=False):
+    # A camera index ("0"), a video file, or a directory / glob of images in name
+    # order. Returns a read() function giving the next BGR frame (None at the end)
+    # and the frame rate to pace files at; cameras are paced by the device (None).
+    if spec.isdigit():
+        capture = cv2.VideoCapture(int(spec))
+        if not capture.isOpened():
+            raise ValueError(f"could not open camera {spec}")
+
+        def read_camera():
+            ret, frame = capture.read()
+            return frame if ret else None
+
+        return read_camera, None
+
+    if os.path.isdir(spec) or any(char in spec for char in "*?["):
+        pattern = os.path.join(spec, "*") if os.path.isdir(spec) else spec
+        paths = sorted(p for p in glob.glob(pattern) if p.lower().endswith(IMAGE_EXTENSIONS))
+        if not paths:
+            raise ValueError(f"no images in {spec}")
+        position = [0]
+
+        def read_image():
+            if position[0] == len(paths):
+                if not loop:
+                    return None
+                position[0] = 0
+            position[0] += 1
+            return cv2.imread(paths[position[0] - 1])
+
+        return read_image, fps or 10.0
+
+    capture = cv2.VideoCapture(spec)
+    if not capture.isOpened():
+        raise ValueError(f"could not open {spec}")
+
+    def read_video():
+        ret, frame = capture.read()
+        if not ret and loop:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = capture.read()
+        return frame if ret else None
+
+    return read_video, fps or capture.get(cv2.CAP_PROP_FPS) or 25.0
+
+
+class Source:
+    # Per-source state: at most one frame waiting for inference (a newer frame
+    # replaces it and counts as dropped) and the last inferred frame with its
+    # predictions, so memory per source stays constant
+
+    def __init__(self, name, read, fps=None, weight=1.0):
+        self.name = name
+        self.read = read
+        self.fps = fps
+        self.weight = weight
+        self.pending = None
+        self.served = 0.0
+        self.captured = 0
+        self.inferred = 0
+        self.dropped = 0
+        self.finished = False
+        self.result = None
+        self.result_version = 0
+        self.latency = 0.0
+        self.capture_fps = FpsMeter()
+        self.inference_fps = FpsMeter()
+
+    def stats(self):
+        return {
+            "source": self.name,
+            "weight": self.weight,
+            "captured": self.captured,
+            "inferred": self.inferred,
+            "dropped": self.dropped,
+            "capture_fps": round(self.capture_fps.fps, 2),
+            "inference_fps": round(self.inference_fps.fps, 2),
+            "latency_ms": round(self.latency, 1),
+        }
+
+
+class SourceScheduler:
+    # Hands waiting frames to the inference workers. Each pick goes to the source
+    # with the least service relative to its weight (served / weight), so sources
+    # share the workers fairly, or in proportion to their weights when saturated.
+
+    def __init__(self, sources):
+        self.sources = sources
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def put(self, source, frame, timestamp):
+        with self.condition:
+            if source.pending is not None:
+                source.dropped += 1
+            source.pending = (frame, timestamp)
+            source.captured += 1
+            source.capture_fps.tick(timestamp)
+            self.condition.notify()
+
+    def take(self, max_items=1, timeout=0.1):
+        # Up to max_items frames from different sources; empty on timeout or close()
+        with self.condition:
+            if not self.condition.wait_for(
+                lambda: self.closed or any(s.pending is not None for s in self.sources),
+                timeout=timeout,
+            ):
+                return []
+            waiting = [s for s in self.sources if s.pending is not None]
+            waiting.sort(key=lambda s: s.served / s.weight)
+            jobs = []
+            for source in waiting[:max_items]:
+                frame, timestamp = source.pending
+                source.pending = None
+                source.served += 1
+                jobs.append((source, frame, timestamp))
+            return jobs
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class CameraPool:
+    # Capture thread per source feeding one scheduler; a fixed pool of inference
+    # workers shares a single model and runs up to batch_size sources per forward
+    # pass. Adding a source adds a capture thread and two frames, never a model.
+
+    def __init__(self, model, sources, workers=2, batch_size=1, confidence=0.5, iou_threshold=0.5):
+        self.model = model
+        self.sources = sources
+        self.batch_size = batch_size
+        self.confidence = confidence
+        self.iou_threshold = iou_threshold
+        self.scheduler = SourceScheduler(sources)
+        self.inference_fps = FpsMeter()
+        self.lock = threading.Lock()
+        self.threads = [
+            StageThread(f"capture-{index}", self.capture_step(source))
+            for index, source in enumerate(sources)
+        ] + [StageThread(f"inference-{index}", self.inference_step) for index in range(workers)]
+
+    def capture_step(self, source):
+        next_time = [time.perf_counter()]
+
+        def step():
+            frame = source.read()
+            if frame is None:
+                source.finished = True
+                return False
+            self.scheduler.put(source, frame, time.perf_counter())
+            if source.fps:
+                # Files play back at their own frame rate, like a camera would deliver them
+                next_time[0] += 1 / source.fps
+                time.sleep(max(next_time[0] - time.perf_counter(), 0))
+
+        return step
+
+    def inference_step(self):
+        jobs = self.scheduler.take(self.batch_size)
+        if not jobs:
+            return
+        results = infer_batch(
+            self.model,
+            [frame for _, frame, _ in jobs],
+            confidence=self.confidence,
+            iou_threshold=self.iou_threshold,
+            batch_size=len(jobs),
+        )
+        # Prediction tuples whatever the backend returned, so the tiles can be scaled
+        # and drawn without backend-specific objects
+        predictions = [
+            make_predictions(*predictions_to_arrays(result.predictions)) for result in results
+        ]
+        now = time.perf_counter()
+        with self.lock:
+            for (source, frame, timestamp), source_predictions in zip(jobs, predictions):
+                source.result = (frame, source_predictions)
+                source.result_version += 1
+                source.inferred += 1
+                source.latency = (now - timestamp) * 1000
+                source.inference_fps.tick(now)
+                self.inference_fps.tick(now)
+
+    def latest(self, source):
+        with self.lock:
+            return source.result, source.result_version
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def finished(self):
+        return all(source.finished for source in self.sources)
+
+    def stop(self):
+        for thread in self.threads:
+            thread.stop()
+        self.scheduler.close()
+        for thread in self.threads:
+            thread.join(timeout=1)
+
+    def stats(self):
+        return {
+            "throughput_fps": round(self.inference_fps.fps, 2),
+            "sources": [source.stats() for source in self.sources],
+        }
+
+
+class Mosaic:
+    # Tiled display: one persistent canvas with a cell per source; only sources
+    # with a new result are redrawn
+
+    def __init__(self, count, tile_size=(320, 240)):
+        self.tile_size = tile_size
+        self.columns = int(np.ceil(np.sqrt(count)))
+        rows = int(np.ceil(count / self.columns))
+        self.canvas = np.full(
+            (rows * tile_size[1], self.columns * tile_size[0], 3), 64, dtype=np.uint8
+        )
+        self.versions = [0] * count
+
+    def update(self, index, source, result, version, render):
+        # render(tile, predictions) draws boxes already scaled to the tile
+        if version == self.versions[index] or result is None:
+            return False
+        self.versions[index] = version
+        frame, predictions = result
+        tile = downscale(frame, self.tile_size)
+        if tile is frame:
+            tile = frame.copy()
+        render(tile, scale_predictions(predictions, preview_scale(frame.shape, self.tile_size)))
+        cv2.putText(
+            tile,
+            f"{source.name[-24:]}  {source.inference_fps.fps:.1f}/{source.capture_fps.fps:.1f} fps"
+            f"  drop {source.dropped}",
+            (5, 15),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.4,
+            (255, 255, 255),
+            1,
+        )
+
+        x0 = (index % self.columns) * self.tile_size[0]
+        y0 = (index // self.columns) * self.tile_size[1]
+        cell = self.canvas[y0 : y0 + self.tile_size[1], x0 : x0 + self.tile_size[0]]
+        cell[:] = 64
+        cell[: tile.shape[0], : tile.shape[1]] = tile
+        return True
@@ -0,0 +1,91 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+# Skip inference while the camera image does not change. "diff" compares the mean
+# absolute difference of a 64x48 grey thumbnail (grey levels), "dhash" counts
+# differing bits of a 64-bit difference hash, "off" infers every frame that is due.
+# A frame is inferred anyway once MOTION_REFRESH_S seconds passed since the last one.
+MOTION_GATE = os.getenv("MOTION_GATE", "diff")
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", "0"))  # 0 = default of the method
+MOTION_REFRESH_S = float(os.getenv("MOTION_REFRESH_S", "2"))
+
+DEFAULT_THRESHOLDS = {"diff": 3.0, "dhash": 4}
+DIFF_SIZE = (64, 48)
+
+
+def thumbnail(frame, size):
+    # Area averaging over many pixels also suppresses sensor noise
+    small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+
+def dhash(frame):
+    # Whether each pixel of a 9x8 thumbnail is brighter than its left neighbour
+    small = thumbnail(frame, (9, 8)).astype(np.int16)
+    return small[:, 1:] > small[:, :-1]
+
+
+class ChangeGate:
+    # Compares each frame that is due for detection against the last frame that
+    # was inferred; should_infer() is False while the difference stays under the
+    # threshold and the refresh interval has not run out
+
+    def __init__(
+        self, method=MOTION_GATE, threshold=MOTION_THRESHOLD, refresh_s=MOTION_REFRESH_S
+    ):
+        self.method = method
+        self.threshold = threshold or DEFAULT_THRESHOLDS.get(method, 0)
+        self.refresh_s = refresh_s
+        self.enabled = method != "off"
+        self.reference = None
+        self.reference_time = 0.0
+        self.change = 0.0
+        self.inferred = 0
+        self.skipped = 0
+        self.forced = 0
+
+    def signature(self, frame):
+        if self.method == "dhash":
+            return dhash(frame)
+        return thumbnail(frame, DIFF_SIZE)
+
+    def difference(self, signature):
+        if self.method == "dhash":
+            return int(np.count_nonzero(signature != self.reference))
+        return float(cv2.absdiff(signature, self.reference).mean())
+
+    def should_infer(self, frame, now=None):
+        if not self.enabled:
+            self.inferred += 1
+            return True
+        now = time.perf_counter() if now is None else now
+        signature = self.signature(frame)
+        if self.reference is not None:
+            self.change = self.difference(signature)
+            if self.change < self.threshold:
+                if now - self.reference_time < self.refresh_s:
+                    self.skipped += 1
+                    return False
+                # Periodic refresh, so a missed change cannot stick forever
+                self.forced += 1
+        self.reference = signature
+        self.reference_time = now
+        self.inferred += 1
+        return True
+
+    def reset(self):
+        # Next frame is inferred, e.g. after switching the gate on or the tracker
+        self.reference = None
+
+    def format(self):
+        if not self.enabled:
+            return "Change gate off"
+        total = self.inferred + self.skipped
+        share = self.skipped / total * 100 if total else 0.0
+        return (
+            f"Skipped {self.skipped} unchanged frames ({share:.0f}%), "
+            f"change {self.change:.1f} / {self.threshold:g}, {self.forced} refreshes"
+        )
@@ -0,0 +1,238 @@
+import time
+
+import cv2
+import numpy as np
+
+from boxes import iou_matrix, overlap_matrix
+from detector import predictions_to_arrays
+
+# Frames are downscaled by this factor before phase correlation
+MOTION_SCALE = 0.25
+
+
+def motion_preview(frame, scale=MOTION_SCALE):
+    # Small float32 grayscale copy used to estimate the strip shift between frames
+    small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return small.astype(np.float32)
+
+
+def pixels_per_frame(line_speed, mm_per_pixel, fps):
+    # Line speed in m/min to strip travel in image rows per frame
+    return line_speed * 1000 / 60 / mm_per_pixel / fps
+
+
+class StripPositioner:
+    # Tracks how far the strip has travelled (in image rows) since the first frame,
+    # from phase correlation of consecutive previews or a fixed line speed.
+    # direction is where the strip content moves in the image: "up" means new
+    # strip enters at the bottom, "down" means it enters at the top.
+
+    def __init__(self, direction="up", rows_per_frame=None, method="phase", min_response=0.05):
+        self.direction = direction
+        self.rows_per_frame = rows_per_frame
+        self.method = method
+        self.min_response = min_response
+        self.offset = 0.0
+        self.shift = rows_per_frame or 0.0
+        self.previous = None
+        self.window = None
+        self.fallbacks = 0
+
+    def update(self, preview):
+        if self.previous is None:
+            self.previous = preview
+            return self.offset
+
+        if self.method == "speed":
+            self.shift = self.rows_per_frame
+        else:
+            if self.window is None or self.window.shape != preview.shape:
+                self.window = cv2.createHanningWindow(preview.shape[::-1], cv2.CV_32F)
+            (_, dy), response = cv2.phaseCorrelate(self.previous, preview, self.window)
+            shift = (-dy if self.direction == "up" else dy) / MOTION_SCALE
+            if response >= self.min_response and shift >= 0:
+                self.shift = shift
+            else:
+                # Featureless or ambiguous frames keep the line speed or the last shift
+                self.fallbacks += 1
+                if self.rows_per_frame:
+                    self.shift = self.rows_per_frame
+
+        self.previous = preview
+        self.offset += self.shift
+        return self.offset
+
+
+class CoilDefect:
+    # One physical defect in strip coordinates (xyxy, y along the coil in pixels)
+
+    def __init__(self, box, class_name, confidence, frame_index):
+        self.box = box
+        self.class_name = class_name
+        self.confidence = confidence
+        self.first_frame = frame_index
+        self.last_frame = frame_index
+        self.observations = 1
+
+    def merge(self, box, confidence, frame_index):
+        # The union keeps the full extent when one sighting was cut at a band edge
+        self.box = np.concatenate([np.minimum(self.box[:2], box[:2]), np.maximum(self.box[2:], box[2:])])
+        self.confidence = max(self.confidence, confidence)
+        self.last_frame = frame_index
+        self.observations += 1
+
+    def to_record(self, defect_id, mm_per_pixel=None):
+        x0, y0, x1, y1 = (float(value) for value in self.box)
+        record = {
+            "id": defect_id,
+            "class": self.class_name,
+            "confidence": round(float(self.confidence), 4),
+            "position_px": round((y0 + y1) / 2, 1),
+            "x_px": round((x0 + x1) / 2, 1),
+            "length_px": round(y1 - y0, 1),
+            "width_px": round(x1 - x0, 1),
+            "first_frame": self.first_frame,
+            "last_frame": self.last_frame,
+            "observations": self.observations,
+        }
+        if mm_per_pixel:
+            record["position_mm"] = round(record["position_px"] * mm_per_pixel, 1)
+            record["x_mm"] = round(record["x_px"] * mm_per_pixel, 1)
+            record["length_mm"] = round(record["length_px"] * mm_per_pixel, 1)
+            record["width_mm"] = round(record["width_px"] * mm_per_pixel, 1)
+        return record
+
+
+class CoilScanner:
+    # Runs the detector only on strip that has not been inferred yet (plus a margin
+    # so defects crossing the band edge are seen whole), maps boxes into strip
+    # coordinates and merges repeated sightings of the same defect
+
+    def __init__(
+        self,
+        detect,
+        positioner,
+        margin=64,
+        min_band=0.5,
+        iou_threshold=0.3,
+        overlap_threshold=0.6,
+    ):
+        self.detect = detect
+        self.positioner = positioner
+        self.margin = margin
+        self.min_band = min_band
+        self.iou_threshold = iou_threshold
+        self.overlap_threshold = overlap_threshold
+        self.inferred_until = 0.0
+        self.pending = None
+        self.active = []
+        self.finished = []
+        self.frames = 0
+        self.inferred_frames = 0
+        self.inferred_rows = 0
+        self.total_rows = 0
+        self.inference_ms = 0.0
+
+    def process(self, frame_index, frame, preview):
+        height = frame.shape[0]
+        offset = self.positioner.update(preview)
+        self.frames += 1
+        self.total_rows += height
+
+        # Wait until enough new strip has arrived to make one inference worthwhile
+        new_rows = offset + height - self.inferred_until
+        if self.inferred_frames == 0 or new_rows >= self.min_band * height:
+            self.infer_band(frame_index, frame, offset)
+            self.pending = None
+        else:
+            self.pending = (frame_index, frame, offset)
+
+    def finish(self):
+        # The tail of the coil is only in the last frame that was held back
+        if self.pending is not None:
+            self.infer_band(*self.pending)
+            self.pending = None
+        self.finished.extend(self.active)
+        self.active = []
+        return sorted(self.finished, key=lambda defect: defect.box[1])
+
+    def infer_band(self, frame_index, frame, offset):
+        height = frame.shape[0]
+        if self.inferred_frames == 0:
+            band_start = offset
+        else:
+            band_start = max(self.inferred_until - self.margin, offset)
+
+        # Strip position s maps to image row s - offset ("up") or offset + height - s ("down")
+        rows = int(round(offset + height - band_start))
+        if self.positioner.direction == "up":
+            row_start, row_end = height - rows, height
+        else:
+            row_start, row_end = 0, rows
+        row_start, row_end = max(row_start, 0), min(row_end, height)
+        if row_end <= row_start:
+            return
+
+        start_time = time.perf_counter()
+        predictions = self.detect(frame[row_start:row_end])
+        self.inference_ms += (time.perf_counter() - start_time) * 1000
+        self.inferred_frames += 1
+        self.inferred_rows += row_end - row_start
+        self.inferred_until = offset + height
+
+        boxes, scores, class_ids, class_names = predictions_to_arrays(predictions)
+        strip_boxes = boxes.copy()
+        if self.positioner.direction == "up":
+            strip_boxes[:, 1] = boxes[:, 1] + row_start + offset
+            strip_boxes[:, 3] = boxes[:, 3] + row_start + offset
+        else:
+            strip_boxes[:, 1] = offset + height - (boxes[:, 3] + row_start)
+            strip_boxes[:, 3] = offset + height - (boxes[:, 1] + row_start)
+        self.merge(strip_boxes, scores, [class_names[i] for i in class_ids], frame_index, band_start)
+
+    def merge(self, boxes, scores, names, frame_index, band_start):
+        # Defects that ended before this band's margin can no longer be seen again
+        still_active = []
+        for defect in self.active:
+            if defect.box[3] < band_start - self.margin:
+                self.finished.append(defect)
+            else:
+                still_active.append(defect)
+        self.active = still_active
+
+        if len(self.active) and len(boxes):
+            active_boxes = np.stack([defect.box for defect in self.active])
+            same = (iou_matrix(boxes, active_boxes) >= self.iou_threshold) | (
+                overlap_matrix(boxes, active_boxes) >= self.overlap_threshold
+            )
+            same &= np.array(names)[:, None] == np.array(
+                [defect.class_name for defect in self.active]
+            )[None, :]
+        else:
+            same = np.zeros((len(boxes), len(self.active)), dtype=bool)
+
+        for index in np.argsort(-scores, kind="stable"):
+            matches = np.flatnonzero(same[index])
+            if len(matches):
+                self.active[matches[0]].merge(boxes[index], float(scores[index]), frame_index)
+            else:
+                self.active.append(
+                    CoilDefect(boxes[index], names[index], float(scores[index]), frame_index)
+                )
+
+    @property
+    def coil_length(self):
+        return self.inferred_until
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "inferred_frames": self.inferred_frames,
+            "inferred_row_fraction": round(self.inferred_rows / self.total_rows, 3)
+            if self.total_rows
+            else 0.0,
+            "inference_ms": round(self.inference_ms, 1),
+            "motion_fallbacks": self.positioner.fallbacks,
+        }
@@ -0,0 +1,287 @@
+import argparse
+import json
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+ENABLED = os.getenv("DEFECT_STORE", "1") == "1"
+STORE_PATH = os.getenv("DEFECT_STORE_PATH", "defects.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    content_key TEXT NOT NULL,
+    model_id TEXT NOT NULL,
+    coil TEXT,
+    width INTEGER,
+    height INTEGER,
+    created REAL NOT NULL,
+    UNIQUE (content_key, model_id)
+);
+CREATE INDEX IF NOT EXISTS images_coil ON images (coil);
+CREATE INDEX IF NOT EXISTS images_created ON images (created);
+
+CREATE TABLE IF NOT EXISTS defects (
+    id INTEGER PRIMARY KEY,
+    image_id INTEGER NOT NULL REFERENCES images (id),
+    class TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    x0 REAL NOT NULL,
+    y0 REAL NOT NULL,
+    x1 REAL NOT NULL,
+    y1 REAL NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS defects_class_confidence ON defects (class, confidence);
+CREATE INDEX IF NOT EXISTS defects_confidence ON defects (confidence);
+CREATE INDEX IF NOT EXISTS defects_image ON defects (image_id);
+CREATE INDEX IF NOT EXISTS defects_created ON defects (created);
+
+-- Box coordinates, same rowid as defects
+CREATE VIRTUAL TABLE IF NOT EXISTS defects_rtree USING rtree (id, x0, x1, y0, y1);
+"""
+
+
+def connect(path=STORE_PATH):
+    connection = sqlite3.connect(path)
+    # WAL lets the CLI query while a GUI is writing
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA cache_size=-65536")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def parse_time(value):
+    # "7d", "12h", "30m", "45s" ago, or an ISO date/time
+    if value is None:
+        return None
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd])", value)
+    if match:
+        seconds = {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+        return time.time() - float(match.group(1)) * seconds
+    return time.mktime(time.strptime(value, "%Y-%m-%dT%H:%M:%S" if "T" in value else "%Y-%m-%d"))
+
+
+class DefectStore:
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self.connection = connect(path)
+        self.written = False
+
+    def write(self, items):
+        # One transaction for a whole batch of images; re-inspecting an image with
+        # the same model replaces its earlier defects
+        now = time.time()
+        with self.connection:
+            for image, predictions in items:
+                values = {"coil": None, "width": None, "height": None, "created": now, **image}
+                self.connection.execute(
+                    "INSERT INTO images (path, content_key, model_id, coil, width, height, created) "
+                    "VALUES (:path, :content_key, :model_id, :coil, :width, :height, :created) "
+                    "ON CONFLICT (content_key, model_id) DO UPDATE SET "
+                    "path = excluded.path, coil = excluded.coil, created = excluded.created",
+                    values,
+                )
+                # A SELECT instead of RETURNING, which needs SQLite 3.35
+                image_id = self.connection.execute(
+                    "SELECT id FROM images "
+                    "WHERE content_key = :content_key AND model_id = :model_id",
+                    values,
+                ).fetchone()[0]
+                self.connection.execute(
+                    "DELETE FROM defects_rtree WHERE id IN (SELECT id FROM defects WHERE image_id = ?)",
+                    (image_id,),
+                )
+                self.connection.execute("DELETE FROM defects WHERE image_id = ?", (image_id,))
+
+                first_id = self.connection.execute(
+                    "SELECT COALESCE(MAX(id), 0) + 1 FROM defects"
+                ).fetchone()[0]
+                rows = [
+                    (
+                        first_id + index,
+                        image_id,
+                        p.class_name,
+                        float(p.confidence),
+                        float(p.x - p.width / 2),
+                        float(p.y - p.height / 2),
+                        float(p.x + p.width / 2),
+                        float(p.y + p.height / 2),
+                        now,
+                    )
+                    for index, p in enumerate(predictions)
+                ]
+                self.connection.executemany(
+                    "INSERT INTO defects (id, image_id, class, confidence, x0, y0, x1, y1, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self.connection.executemany(
+                    "INSERT INTO defects_rtree (id, x0, x1, y0, y1) VALUES (?, ?, ?, ?, ?)",
+                    [(row[0], row[4], row[6], row[5], row[7]) for row in rows],
+                )
+        self.written = True
+
+    def query(
+        self,
+        class_name=None,
+        min_confidence=None,
+        max_confidence=None,
+        since=None,
+        until=None,
+        region=None,
+        coil=None,
+        image=None,
+        limit=1000,
+    ):
+        # region is (x0, y0, x1, y1) in image (or strip) pixels; boxes that intersect it match
+        tables = "defects d JOIN images i ON i.id = d.image_id"
+        conditions, parameters = [], []
+        if region is not None:
+            tables = "defects_rtree r JOIN defects d ON d.id = r.id JOIN images i ON i.id = d.image_id"
+            conditions += ["r.x1 >= ?", "r.x0 <= ?", "r.y1 >= ?", "r.y0 <= ?"]
+            parameters += [region[0], region[2], region[1], region[3]]
+        for condition, value in (
+            ("d.class = ?", class_name),
+            ("d.confidence >= ?", min_confidence),
+            ("d.confidence <= ?", max_confidence),
+            ("d.created >= ?", since),
+            ("d.created <= ?", until),
+            ("i.coil = ?", coil),
+            ("i.path = ?", image),
+        ):
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+
+        sql = (
+            "SELECT d.id, i.path, i.coil, d.class, d.confidence, d.x0, d.y0, d.x1, d.y1, d.created "
+            f"FROM {tables}"
+        )
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY d.created DESC LIMIT ?"
+        parameters.append(limit)
+
+        columns = ("id", "image", "coil", "class", "confidence", "x0", "y0", "x1", "y1", "created")
+        return [dict(zip(columns, row)) for row in self.connection.execute(sql, parameters)]
+
+    def stats(self):
+        images = self.connection.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+        classes = self.connection.execute(
+            "SELECT class, COUNT(*) FROM defects GROUP BY class ORDER BY COUNT(*) DESC"
+        ).fetchall()
+        return {"images": images, "defects": dict(classes)}
+
+    def close(self):
+        # Sampled planner statistics (cheap at any size) let queries pick the R-tree
+        # or the class index instead of scanning
+        if self.written:
+            if sqlite3.sqlite_version_info >= (3, 32, 0):
+                self.connection.execute("PRAGMA analysis_limit=1000")
+            self.connection.execute("ANALYZE")
+        self.connection.close()
+
+
+class StoreWriter:
+    # Background writer so the GUI never waits on disk; whatever has queued up
+    # since the last write goes into one transaction
+
+    def __init__(self, path=STORE_PATH, max_batch=64):
+        self.path = path
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.errors = 0
+        self.thread = threading.Thread(target=self.run, name="defect-store", daemon=True)
+        self.thread.start()
+
+    def submit(self, image, predictions):
+        # image: dict with path, content_key, model_id and optionally coil, width, height
+        self.queue.put((image, list(predictions)))
+
+    def run(self):
+        store = DefectStore(self.path)
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.put(None)
+                    break
+                batch.append(item)
+            try:
+                store.write(batch)
+            except sqlite3.Error as error:
+                self.errors += 1
+                print(f"defect store: {error}", file=sys.stderr)
+        store.close()
+
+    def close(self):
+        # Flushes everything submitted so far
+        self.queue.put(None)
+        self.thread.join()
+
+
+def load_store_writer():
+    return StoreWriter() if ENABLED else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the persisted defect detections.")
+    parser.add_argument("--path", default=STORE_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    query_parser = subparsers.add_parser("query", help="list matching defects as JSON lines")
+    query_parser.add_argument("--class", dest="class_name")
+    query_parser.add_argument("--min-confidence", type=float)
+    query_parser.add_argument("--max-confidence", type=float)
+    query_parser.add_argument("--since", help="e.g. 7d, 12h or 2024-05-01")
+    query_parser.add_argument("--until")
+    query_parser.add_argument(
+        "--region", nargs=4, type=float, metavar=("X0", "Y0", "X1", "Y1")
+    )
+    query_parser.add_argument("--coil")
+    query_parser.add_argument("--image")
+    query_parser.add_argument("--limit", type=int, default=1000)
+
+    subparsers.add_parser("stats", help="image count and defects per class")
+    args = parser.parse_args()
+
+    store = DefectStore(args.path)
+    if args.command == "stats":
+        print(json.dumps(store.stats(), indent=2))
+        return 0
+
+    start_time = time.perf_counter()
+    rows = store.query(
+        class_name=args.class_name,
+        min_confidence=args.min_confidence,
+        max_confidence=args.max_confidence,
+        since=parse_time(args.since),
+        until=parse_time(args.until),
+        region=args.region,
+        coil=args.coil,
+        image=args.image,
+        limit=args.limit,
+    )
+    query_time = (time.perf_counter() - start_time) * 1000
+    for row in rows:
+        print(json.dumps(row))
+    print(f"{len(rows)} defects in {query_time:.1f}ms", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+import tkinter as tk
+from tkinter import ttk
+
+import numpy as np
+
+ALL_CLASSES = "All classes"
+SORT_KEYS = {"ID": "ids", "Class": "class_ids", "Confidence": "confidences"}
+
+
+class DefectTable(ttk.Frame):
+    # Defect list over NumPy arrays: the Treeview only ever holds `rows` items whose
+    # values are swapped while scrolling, so thousands of detections cost the same
+    # as eight. Filtering and sorting work on index arrays.
+
+    def __init__(self, parent, rows=8, on_select=None):
+        super().__init__(parent)
+        self.rows = rows
+        self.on_select = on_select
+        self.offset = 0
+        self.selected = None
+        self.sort_column = "ID"
+        self.sort_descending = False
+
+        # Filter row: class and minimum confidence
+        filters = ttk.Frame(self)
+        filters.pack(fill="x")
+        self.class_var = tk.StringVar(value=ALL_CLASSES)
+        self.class_menu = ttk.OptionMenu(
+            filters, self.class_var, ALL_CLASSES, ALL_CLASSES, command=lambda _: self.refresh()
+        )
+        self.class_menu.pack(side="left")
+        ttk.Label(filters, text="Min confidence %").pack(side="left", padx=(10, 2))
+        self.confidence_var = tk.IntVar(value=0)
+        confidence_spinbox = ttk.Spinbox(
+            filters, from_=0, to=100, increment=5, width=4, textvariable=self.confidence_var
+        )
+        confidence_spinbox.pack(side="left")
+        self.confidence_var.trace_add("write", lambda *_: self.refresh())
+
+        body = ttk.Frame(self)
+        body.pack(fill="both", expand=True)
+        self.tree = ttk.Treeview(
+            body,
+            columns=("ID", "Class", "Confidence"),
+            show="headings",
+            height=rows,
+            selectmode="browse",
+        )
+        for column, width in (("ID", 50), ("Class", 150), ("Confidence", 100)):
+            self.tree.column(column, width=width, anchor="center")
+            self.tree.heading(column, text=column, command=lambda c=column: self.sort(c))
+        for row in range(rows):
+            self.tree.insert("", "end", iid=str(row), values=("", "", ""))
+        self.tree.pack(side="left", fill="both", expand=True)
+
+        self.scrollbar = ttk.Scrollbar(body, orient="vertical", command=self.yview)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.tree.bind("<<TreeviewSelect>>", self.select)
+        self.tree.bind("<MouseWheel>", lambda event: self.scroll(-3 if event.delta > 0 else 3))
+        self.tree.bind("<Button-4>", lambda _: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda _: self.scroll(3))
+        self.tree.bind("<Up>", lambda _: self.step_selection(-1))
+        self.tree.bind("<Down>", lambda _: self.step_selection(1))
+
+        self.status = ttk.Label(self, text="")
+        self.status.pack(anchor="w")
+        self.set_data(np.empty(0, np.int64), np.empty(0, np.float32), np.empty((0, 4)), [])
+
+    def set_data(self, class_ids, confidences, boxes, class_names):
+        # IDs are the 1-based positions drawn on the image
+        self.ids = np.arange(1, len(class_ids) + 1)
+        self.class_ids = np.asarray(class_ids)
+        self.confidences = np.asarray(confidences, dtype=np.float32)
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.class_names = list(class_names)
+        self.class_labels = np.array(self.class_names, dtype=object)
+        self.view = self.ids - 1
+        self.offset = 0
+        self.selected = None
+
+        menu = self.class_menu["menu"]
+        menu.delete(0, "end")
+        for name in [ALL_CLASSES] + sorted(self.class_names):
+            menu.add_command(label=name, command=lambda n=name: self.choose_class(n))
+        if self.class_var.get() not in self.class_names:
+            self.class_var.set(ALL_CLASSES)
+        self.refresh()
+
+    def choose_class(self, name):
+        self.class_var.set(name)
+        self.refresh()
+
+    def refresh(self):
+        # Recompute the visible index array from the filter and sort settings
+        mask = np.ones(len(self.ids), dtype=bool)
+        class_name = self.class_var.get()
+        if class_name != ALL_CLASSES and class_name in self.class_names:
+            mask &= self.class_ids == self.class_names.index(class_name)
+        try:
+            min_confidence = self.confidence_var.get() / 100
+        except tk.TclError:
+            min_confidence = 0.0
+        mask &= self.confidences >= min_confidence
+        view = np.flatnonzero(mask)
+
+        if self.sort_column == "Class":
+            keys = self.class_labels[self.class_ids[view]].astype(str)
+        else:
+            keys = getattr(self, SORT_KEYS[self.sort_column])[view]
+        order = np.argsort(keys, kind="stable")
+        self.view = view[order[::-1] if self.sort_descending else order]
+        self.offset = min(self.offset, max(len(self.view) - self.rows, 0))
+        self.status.config(text=f"Showing {len(self.view)} of {len(self.ids)} defects")
+        self.redraw()
+
+    def sort(self, column):
+        if self.sort_column == column:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_column, self.sort_descending = column, column == "Confidence"
+        for name in SORT_KEYS:
+            arrow = (" ▼" if self.sort_descending else " ▲") if name == column else ""
+            self.tree.heading(name, text=name + arrow)
+        self.refresh()
+
+    def redraw(self):
+        # Only the fixed row items are touched; their values come from the arrays
+        visible = self.view[self.offset : self.offset + self.rows]
+        selected_item = None
+        for row in range(self.rows):
+            if row < len(visible):
+                index = visible[row]
+                values = (
+                    int(self.ids[index]),
+                    self.class_names[self.class_ids[index]],
+                    f"{self.confidences[index] * 100:.1f}%",
+                )
+                if index == self.selected:
+                    selected_item = str(row)
+            else:
+                values = ("", "", "")
+            self.tree.item(str(row), values=values)
+        if selected_item:
+            self.tree.selection_set(selected_item)
+        else:
+            self.tree.selection_set(())
+
+        if len(self.view):
+            first = self.offset / len(self.view)
+            last = min(self.offset + self.rows, len(self.view)) / len(self.view)
+            self.scrollbar.set(first, last)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll(self, rows):
+        offset = min(max(self.offset + rows, 0), max(len(self.view) - self.rows, 0))
+        if offset != self.offset:
+            self.offset = offset
+            self.redraw()
+        return "break"
+
+    def yview(self, *args):
+        if args[0] == "moveto":
+            self.scroll(round(float(args[1]) * len(self.view)) - self.offset)
+        elif args[0] == "scroll":
+            amount = int(args[1]) * (self.rows if args[2] == "pages" else 1)
+            self.scroll(amount)
+
+    def step_selection(self, step):
+        # Arrow keys move through the whole result, scrolling at the edges
+        if not len(self.view):
+            return "break"
+        positions = np.flatnonzero(self.view == self.selected)
+        position = positions[0] + step if len(positions) else self.offset
+        position = min(max(position, 0), len(self.view) - 1)
+        if position < self.offset:
+            self.offset = position
+        elif position >= self.offset + self.rows:
+            self.offset = position - self.rows + 1
+        self.selected = self.view[position]
+        self.redraw()
+        if self.on_select:
+            self.on_select(self.selected)
+        return "break"
+
+    def select(self, _event):
+        # Also fires after redraw() re-selects the current row, which is ignored
+        selection = self.tree.selection()
+        if not selection:
+            return
+        position = self.offset + int(selection[0])
+        if position >= len(self.view) or self.view[position] == self.selected:
+            return
+        self.selected = self.view[position]
+        if self.on_select:
+            self.on_select(self.selected)
@@ -0,0 +1,402 @@
+import ast
+import os
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+from boxes import nms, xywh_to_xyxy
+
+load_dotenv()
+
+# Roboflow model details
+model_name = "cr7-det-shuzong-dataset"
+model_version = "2"
+MODEL_ID = f"{model_name}/{model_version}"
+
+# Images per forward pass for multi-image inference: a number, or "auto" to
+# measure on first use; BATCH_MAX_LATENCY_MS caps how long one batch may take
+BATCH_SIZE = os.getenv("BATCH_SIZE", "auto")
+BATCH_CANDIDATES = (1, 2, 4, 8, 16)
+BATCH_MAX_LATENCY_MS = float(os.getenv("BATCH_MAX_LATENCY_MS", "0"))
+
+# Precision of the local ONNX model: fp32 (the export itself), or an fp16 / int8
+# variant written next to it by quantize.py
+ONNX_PRECISION = os.getenv("ONNX_PRECISION", "fp32").lower()
+ONNX_PRECISIONS = ("fp32", "fp16", "int8")
+
+# Same fields the Roboflow predictions expose, so drawing code works with any backend
+Prediction = namedtuple(
+    "Prediction", ["x", "y", "width", "height", "class_name", "confidence", "class_id"]
+)
+InferenceResult = namedtuple("InferenceResult", ["predictions"])
+
+
+def make_predictions(boxes_xyxy, scores, class_ids, class_names):
+    predictions = []
+    for (x0, y0, x1, y1), score, class_id in zip(boxes_xyxy, scores, class_ids):
+        class_id = int(class_id)
+        predictions.append(
+            Prediction(
+                x=float(x0 + x1) / 2,
+                y=float(y0 + y1) / 2,
+                width=float(x1 - x0),
+                height=float(y1 - y0),
+                class_name=class_names[class_id]
+                if class_id < len(class_names)
+                else f"class_{class_id}",
+                confidence=float(score),
+                class_id=class_id,
+            )
+        )
+    return predictions
+
+
+def predictions_to_arrays(predictions):
+    # Inverse of make_predictions: xyxy boxes, scores, class ids and the names they index
+    class_names = []
+    class_index = {}
+    class_ids = np.empty(len(predictions), dtype=np.int64)
+    boxes = np.empty((len(predictions), 4), dtype=np.float32)
+    scores = np.empty(len(predictions), dtype=np.float32)
+    for row, prediction in enumerate(predictions):
+        if prediction.class_name not in class_index:
+            class_index[prediction.class_name] = len(class_names)
+            class_names.append(prediction.class_name)
+        class_ids[row] = class_index[prediction.class_name]
+        boxes[row] = (prediction.x, prediction.y, prediction.width, prediction.height)
+        scores[row] = prediction.confidence
+    return xywh_to_xyxy(boxes), scores, class_ids, class_names
+
+
+def gray_to_bgr(frame):
+    if frame.ndim == 2:
+        return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+    return frame
+
+
+class RoboflowDetector:
+    # Hosted Roboflow model, the behaviour every script had before backends existed
+
+    def __init__(self, model_id=MODEL_ID, api_key=None):
+        from inference.models.utils import get_roboflow_model
+
+        self.model_id = model_id
+        self.model = get_roboflow_model(
+            model_id=model_id, api_key=api_key or os.getenv("API_KEY")
+        )
+
+    def infer(self, image, confidence=0.5, iou_threshold=0.5):
+        # The hosted model expects 3 channels; mono raw frames are converted here
+        if isinstance(image, list):
+            image = [gray_to_bgr(frame) for frame in image]
+        else:
+            image = gray_to_bgr(image)
+        return self.model.infer(
+            image=image, confidence=confidence, iou_threshold=iou_threshold
+        )
+
+
+class OnnxDetector:
+    # Local YOLO ONNX export run through one reused ONNX Runtime session
+
+    def __init__(
+        self,
+        model_path,
+        class_names=None,
+        input_size=640,
+        intra_op_threads=None,
+        inter_op_threads=1,
+    ):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = intra_op_threads or os.cpu_count() or 1
+        options.inter_op_num_threads = inter_op_threads
+
+        # Size and mtime mark a re-exported model so cached results are invalidated
+        stat = os.stat(model_path)
+        self.model_path = model_path
+        self.model_id = (
+            f"onnx:{os.path.basename(model_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+        )
+        self.session = ort.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_dtype = np.float16 if "float16" in model_input.type else np.float32
+
+        # Fixed exports carry their input size, dynamic ones fall back to input_size
+        self.dynamic_batch = not isinstance(model_input.shape[0], int)
+        height, width = model_input.shape[2:4]
+        self.input_height = height if isinstance(height, int) else input_size
+        self.input_width = width if isinstance(width, int) else input_size
+
+        self.class_names = class_names or self._metadata_class_names()
+        self.local = threading.local()
+
+    @property
+    def timings(self):
+        # Sub-stage timings of the last call on the current thread, so calls made
+        # from several threads at once (tiles) never overwrite each other's
+        return getattr(self.local, "timings", {})
+
+    @timings.setter
+    def timings(self, value):
+        self.local.timings = value
+
+    def _metadata_class_names(self):
+        # Ultralytics exports store the class names as a dict literal in the metadata
+        names = self.session.get_modelmeta().custom_metadata_map.get("names")
+        if not names:
+            return []
+        names = ast.literal_eval(names)
+        if isinstance(names, dict):
+            return [names[key] for key in sorted(names)]
+        return list(names)
+
+    def letterbox_geometry(self, shape):
+        # Scale and padding that fit an image into the model input keeping the aspect ratio
+        height, width = shape[:2]
+        scale = min(self.input_width / width, self.input_height / height)
+        new_width, new_height = round(width * scale), round(height * scale)
+        pad_x = (self.input_width - new_width) // 2
+        pad_y = (self.input_height - new_height) // 2
+        return scale, (pad_x, pad_y), (new_width, new_height)
+
+    def preprocess_batch(self, frames):
+        # Letterbox every frame into one uint8 batch, then convert the whole batch
+        # BGR NHWC -> RGB NCHW float in [0, 1] with a single vectorized pass
+        canvas = np.full((len(frames), self.input_height, self.input_width, 3), 114, np.uint8)
+        scales, pads = [], []
+        for index, frame in enumerate(frames):
+            scale, (pad_x, pad_y), (new_width, new_height) = self.letterbox_geometry(frame.shape)
+            resized = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+            if resized.ndim == 2:
+                # Mono frames are broadcast to the 3 input channels at input size
+                resized = resized[..., None]
+            canvas[index, pad_y : pad_y + new_height, pad_x : pad_x + new_width] = resized
+            scales.append(scale)
+            pads.append((pad_x, pad_y))
+
+        tensor = np.empty(
+            (len(frames), 3, self.input_height, self.input_width), dtype=self.input_dtype
+        )
+        np.multiply(
+            canvas[..., ::-1].transpose(0, 3, 1, 2), 1 / 255, out=tensor, casting="unsafe"
+        )
+        return tensor, scales, pads
+
+    def preprocess(self, frame):
+        tensor, scales, pads = self.preprocess_batch([frame])
+        return tensor, scales[0], pads[0]
+
+    def postprocess(self, output, scale, pad, confidence, iou_threshold):
+        # YOLO head output is (4 + classes, anchors); rows become anchors
+        output = np.asarray(output, dtype=np.float32)
+        if output.shape[0] < output.shape[1]:
+            output = output.T
+
+        class_scores = output[:, 4:]
+        class_ids = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(class_scores)), class_ids]
+        mask = scores >= confidence
+        boxes = xywh_to_xyxy(output[mask, :4])
+        scores, class_ids = scores[mask], class_ids[mask]
+
+        # Undo the letterbox so boxes are in original image pixels
+        boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad[0]) / scale
+        boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad[1]) / scale
+
+        keep = nms(boxes, scores, iou_threshold, class_ids)
+        return make_predictions(
+            boxes[keep], scores[keep], class_ids[keep], self.class_names
+        )
+
+    def infer(self, image, confidence=0.5, iou_threshold=0.5):
+        # A list of images gives one result per image, like the Roboflow model; it
+        # runs as one forward pass when the export has a dynamic batch dimension
+        frames = image if isinstance(image, list) else [image]
+        if len(frames) > 1 and not self.dynamic_batch:
+            return [self.infer(frame, confidence, iou_threshold)[0] for frame in frames]
+
+        start_time = time.perf_counter()
+        tensor, scales, pads = self.preprocess_batch(frames)
+        preprocess_end = time.perf_counter()
+        output = self.session.run(None, {self.input_name: tensor})[0]
+        forward_end = time.perf_counter()
+        results = [
+            InferenceResult(
+                self.postprocess(output[index], scales[index], pads[index], confidence, iou_threshold)
+            )
+            for index in range(len(frames))
+        ]
+
+        # Sub-stage timings of this call, picked up by the instrumentation layer
+        self.timings = {
+            "preprocess": (preprocess_end - start_time) * 1000,
+            "forward": (forward_end - preprocess_end) * 1000,
+            "postprocess": (time.perf_counter() - forward_end) * 1000,
+        }
+        return results
+
+
+class StubDetector:
+    # Deterministic fake detector for offline benchmarks and tests; the same
+    # image size and seed always give the same boxes
+
+    def __init__(self, class_names=None, detections=20, delay_ms=0.0, seed=0):
+        self.model_id = f"stub:{seed}"
+        self.class_names = class_names or ["defect"]
+        self.detections = detections
+        self.delay_ms = delay_ms
+        self.seed = seed
+
+    def infer(self, image, confidence=0.5, iou_threshold=0.5):
+        if isinstance(image, list):
+            return [self.infer(frame, confidence, iou_threshold)[0] for frame in image]
+
+        start_time = time.perf_counter()
+        height, width = image.shape[:2]
+        rng = np.random.default_rng([self.seed, height, width])
+
+        sizes = rng.uniform(0.02, 0.2, size=(self.detections, 2)) * (width, height)
+        centers = rng.uniform(0, 1, size=(self.detections, 2)) * (width, height)
+        boxes = xywh_to_xyxy(np.concatenate([centers, sizes], axis=1))
+        boxes = np.clip(boxes, 0, [width, height, width, height])
+        scores = rng.uniform(0.2, 1.0, size=self.detections).astype(np.float32)
+        class_ids = rng.integers(0, len(self.class_names), size=self.detections)
+
+        mask = scores >= confidence
+        boxes, scores, class_ids = boxes[mask], scores[mask], class_ids[mask]
+        keep = nms(boxes, scores, iou_threshold, class_ids)
+        predictions = make_predictions(
+            boxes[keep], scores[keep], class_ids[keep], self.class_names
+        )
+
+        # Simulate model latency so pipelines can be timed without a model
+        remaining = self.delay_ms / 1000 - (time.perf_counter() - start_time)
+        if remaining > 0:
+            time.sleep(remaining)
+        return [InferenceResult(predictions)]
+
+
+def warm_up(model):
+    # One inference on a blank input-sized frame, so the first real image does not
+    # pay for session setup and first-call allocations
+    height = getattr(model, "input_height", 640)
+    width = getattr(model, "input_width", 640)
+    model.infer(image=np.zeros((height, width, 3), dtype=np.uint8))
+
+
+def autotune_batch_size(
+    model, candidates=BATCH_CANDIDATES, max_latency_ms=BATCH_MAX_LATENCY_MS, min_gain=0.1, repeats=3
+):
+    # Times one batch of each size on a synthetic frame and keeps growing the batch
+    # while throughput improves by at least min_gain and the batch stays under
+    # max_latency_ms. Returns the chosen size and {size: (latency_ms, images_per_s)}.
+    height = getattr(model, "input_height", 640)
+    width = getattr(model, "input_width", 640)
+    frame = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    model.infer(image=frame)  # warm-up
+
+    best_size, best_throughput, timings = 1, 0.0, {}
+    for size in candidates:
+        frames = [frame] * size
+        latency = float("inf")
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            model.infer(image=frames)
+            latency = min(latency, (time.perf_counter() - start_time) * 1000)
+        throughput = size / latency * 1000
+        timings[size] = (latency, throughput)
+        if max_latency_ms and latency > max_latency_ms:
+            break
+        if throughput < best_throughput * (1 + min_gain):
+            break
+        best_size, best_throughput = size, throughput
+    return best_size, timings
+
+
+def batch_size_for(model):
+    # BATCH_SIZE from .env, or autotuned once and remembered on the model
+    if BATCH_SIZE != "auto":
+        return max(int(BATCH_SIZE), 1)
+    if getattr(model, "batch_size", None) is None:
+        model.batch_size, model.batch_timings = autotune_batch_size(model)
+    return model.batch_size
+
+
+def infer_batch(model, frames, confidence=0.5, iou_threshold=0.5, batch_size=None):
+    # One result per frame; frames go to the model batch_size at a time
+    batch_size = batch_size or batch_size_for(model)
+    results = []
+    for start in range(0, len(frames), batch_size):
+        results += model.infer(
+            image=list(frames[start : start + batch_size]),
+            confidence=confidence,
+            iou_threshold=iou_threshold,
+        )
+    return results
+
+
+def parse_class_names(value):
+    # Comma-separated names or a path to a file with one name per line
+    if not value:
+        return None
+    if os.path.isfile(value):
+        with open(value) as names_file:
+            return [line.strip() for line in names_file if line.strip()]
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def variant_path(model_path, precision):
+    # models/cr7.onnx -> models/cr7.int8.onnx; fp32 is the export itself
+    if precision not in ONNX_PRECISIONS:
+        raise ValueError(f"ONNX_PRECISION must be one of {', '.join(ONNX_PRECISIONS)}")
+    if precision == "fp32":
+        return model_path
+    root, extension = os.path.splitext(model_path)
+    return f"{root}.{precision}{extension}"
+
+
+def load_detector(backend=None):
+    # Backend comes from DETECTOR_BACKEND in .env unless given explicitly
+    backend = (backend or os.getenv("DETECTOR_BACKEND", "roboflow")).lower()
+    class_names = parse_class_names(os.getenv("CLASS_NAMES"))
+
+    if backend == "roboflow":
+        return RoboflowDetector(model_id=os.getenv("ROBOFLOW_MODEL_ID", MODEL_ID))
+    if backend == "onnx":
+        model_path = os.getenv("ONNX_MODEL_PATH")
+        if not model_path:
+            raise ValueError("DETECTOR_BACKEND=onnx requires ONNX_MODEL_PATH")
+        if ONNX_PRECISION != "fp32":
+            model_path = variant_path(model_path, ONNX_PRECISION)
+            if not os.path.isfile(model_path):
+                raise ValueError(
+                    f"{model_path} not found, create it with "
+                    f"python quantize.py build --precision {ONNX_PRECISION}"
+                )
+        intra_op_threads = os.getenv("ONNX_INTRA_OP_THREADS")
+        return OnnxDetector(
+            model_path,
+            class_names=class_names,
+            input_size=int(os.getenv("ONNX_INPUT_SIZE", "640")),
+            intra_op_threads=int(intra_op_threads) if intra_op_threads else None,
+            inter_op_threads=int(os.getenv("ONNX_INTER_OP_THREADS", "1")),
+        )
+    if backend == "stub":
+        return StubDetector(
+            class_names=class_names,
+            detections=int(os.getenv("STUB_DETECTIONS", "20")),
+            delay_ms=float(os.getenv("STUB_DELAY_MS", "0")),
+            seed=int(os.getenv("STUB_SEED", "0")),
+        )
+    raise ValueError(f"Unknown detector backend: {backend}")
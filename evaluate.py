@@ -0,0 +1,357 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import xml.etree.ElementTree as ElementTree
+from collections import Counter
+
+import numpy as np
+
+from boxes import iou_matrix, xywh_to_xyxy
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+DATA_DIR = "rolled_data"
+
+# mAP@0.5:0.95 averages AP over these IoU thresholds (COCO); column 0 is mAP@0.5
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+RECALL_POINTS = np.linspace(0, 1, 101)
+
+# Per-process state, filled in by init_worker()
+model = None
+settings = None
+strip_cropper = None
+
+
+def collect_pairs(directory, limit=None):
+    # Images with a VOC .xml or YOLO .txt annotation of the same name anywhere
+    # under directory (CR7-DET keeps images and annotations in separate folders)
+    images, annotations = {}, {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            stem, extension = os.path.splitext(name)
+            extension = extension.lower()
+            if extension in IMAGE_EXTENSIONS:
+                images[stem] = os.path.join(root, name)
+            elif extension in (".xml", ".txt") and name != "classes.txt":
+                # VOC wins when both exist
+                if extension == ".xml" or stem not in annotations:
+                    annotations[stem] = os.path.join(root, name)
+    pairs = sorted((images[stem], annotations[stem]) for stem in images if stem in annotations)
+    if limit and len(pairs) > limit:
+        pairs = [pairs[index] for index in np.linspace(0, len(pairs) - 1, limit).astype(int)]
+    return pairs
+
+
+def find_class_names(directory, value=None):
+    # YOLO labels index classes.txt (or --classes / CLASS_NAMES); VOC files name them
+    value = value or os.getenv("CLASS_NAMES")
+    if not value:
+        for root, _, names in os.walk(directory):
+            if "classes.txt" in names:
+                value = os.path.join(root, "classes.txt")
+                break
+    if not value:
+        return None
+    if os.path.isfile(value):
+        with open(value) as names_file:
+            return [line.strip() for line in names_file if line.strip()]
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def load_annotation(path, shape, class_names=None):
+    # Ground-truth xyxy pixel boxes and class names
+    if path.endswith(".xml"):
+        boxes, names = [], []
+        for item in ElementTree.parse(path).getroot().iter("object"):
+            box = item.find("bndbox")
+            boxes.append([float(box.find(key).text) for key in ("xmin", "ymin", "xmax", "ymax")])
+            names.append(item.find("name").text.strip())
+        return np.asarray(boxes, dtype=np.float32).reshape(-1, 4), np.asarray(names, dtype=object)
+
+    with open(path) as label_file:
+        rows = [line.split()[:5] for line in label_file if line.strip()]
+    rows = np.asarray(rows, dtype=np.float32).reshape(-1, 5)
+    height, width = shape[:2]
+    class_ids = rows[:, 0].astype(int)
+    if class_names is None:
+        names = [str(class_id) for class_id in class_ids]
+    else:
+        names = [class_names[class_id] for class_id in class_ids]
+    boxes = xywh_to_xyxy(rows[:, 1:] * (width, height, width, height))
+    return boxes.astype(np.float32), np.asarray(names, dtype=object)
+
+
+def match_detections(boxes, scores, names, gt_boxes, gt_names):
+    # COCO-style greedy matching: detections in descending score take the unmatched
+    # same-class ground truth with the highest IoU. Returns a (detections, thresholds)
+    # true-positive table; all IoU thresholds are matched at once.
+    tp = np.zeros((len(boxes), len(IOU_THRESHOLDS)), dtype=bool)
+    if not len(boxes) or not len(gt_boxes):
+        return tp
+
+    ious = iou_matrix(boxes, gt_boxes)
+    ious[names[:, None] != gt_names[None, :]] = -1
+    matched = np.zeros((len(IOU_THRESHOLDS), len(gt_boxes)), dtype=bool)
+    rows = np.arange(len(IOU_THRESHOLDS))
+    for detection in np.argsort(-scores, kind="stable"):
+        candidates = np.where(matched, -1, ious[detection])
+        best = candidates.argmax(axis=1)
+        hit = candidates[rows, best] >= IOU_THRESHOLDS
+        matched[rows[hit], best[hit]] = True
+        tp[detection] = hit
+    return tp
+
+
+def average_precision(tp, scores, gt_count):
+    # AP per IoU threshold: area under the precision envelope sampled at 101
+    # recall points; cumulative counts cover all thresholds at once
+    if not len(scores):
+        return np.zeros(tp.shape[1])
+    tp = tp[np.argsort(-scores, kind="stable")]
+    true_positives = np.cumsum(tp, axis=0)
+    precision = true_positives / np.arange(1, len(tp) + 1)[:, None]
+    recall = true_positives / gt_count
+    envelope = np.flip(np.maximum.accumulate(np.flip(precision, axis=0), axis=0), axis=0)
+
+    # Recall never decreases, so the first detection reaching each recall point is
+    # a binary search; points beyond the final recall count as zero precision
+    sampled = np.zeros((tp.shape[1], len(RECALL_POINTS)))
+    for column in range(tp.shape[1]):
+        first = np.searchsorted(recall[:, column], RECALL_POINTS, side="left")
+        reached = first < len(recall)
+        sampled[column, reached] = envelope[first[reached], column]
+    return sampled.mean(axis=1)
+
+
+def init_worker(worker_settings):
+    global model, settings, strip_cropper
+
+    # One inference thread per process (OpenMP and the ONNX Runtime session); the
+    # pool provides the parallelism
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    os.environ.setdefault("ONNX_INTRA_OP_THREADS", "1")
+    import cv2
+
+    cv2.setNumThreads(1)
+
+    from steel_pipeline import load_model
+    from strip_crop import make_cropper
+
+    model = load_model()
+    settings = worker_settings
+    strip_cropper = make_cropper()
+
+
+def evaluate_image(pair):
+    import cv2
+    from detector import predictions_to_arrays
+    from steel_pipeline import detect_defects
+
+    image_path, annotation_path = pair
+    frame = cv2.imread(image_path)
+    if frame is None:
+        return {"image": image_path, "error": "could not read image"}
+    gt_boxes, gt_names = load_annotation(annotation_path, frame.shape, settings["class_names"])
+
+    # Same detection path as the steel scripts, including tiling and strip cropping
+    # when enabled
+    start_time = time.perf_counter()
+    predictions, _ = detect_defects(
+        model,
+        frame,
+        confidence=settings["confidence"],
+        iou_threshold=settings["iou_threshold"],
+        cropper=strip_cropper,
+    )
+    inference_time = (time.perf_counter() - start_time) * 1000
+
+    boxes, scores, class_ids, class_names = predictions_to_arrays(predictions)
+    names = np.asarray(class_names, dtype=object)[class_ids]
+    return {
+        "image": image_path,
+        "names": names,
+        "scores": scores,
+        "tp": match_detections(boxes, scores, names, gt_boxes, gt_names),
+        "gt": Counter(gt_names.tolist()),
+        "inference_ms": inference_time,
+        "model_id": getattr(model, "model_id", None),
+    }
+
+
+def mean_of(classes, key):
+    # mAP is the unweighted mean over classes present in the annotations
+    if not classes:
+        return 0.0
+    return round(float(np.mean([values[key] for values in classes.values()])), 4)
+
+
+def summarize(results, operating_confidence):
+    # Per-class AP@0.5, AP@0.5:0.95 and precision/recall at the operating confidence
+    names = np.concatenate([result["names"] for result in results])
+    scores = np.concatenate([result["scores"] for result in results])
+    tp = np.concatenate([result["tp"] for result in results])
+    gt_counts = sum((result["gt"] for result in results), Counter())
+
+    classes = {}
+    for class_name in sorted(gt_counts):
+        selected = names == class_name
+        class_tp, class_scores = tp[selected], scores[selected]
+        ap = average_precision(class_tp, class_scores, gt_counts[class_name])
+        kept = class_scores >= operating_confidence
+        true_positives = int(class_tp[kept, 0].sum())
+        classes[class_name] = {
+            "ground_truth": gt_counts[class_name],
+            "detections": int(kept.sum()),
+            "precision": round(true_positives / kept.sum(), 4) if kept.any() else 0.0,
+            "recall": round(true_positives / gt_counts[class_name], 4),
+            "ap50": round(float(ap[0]), 4),
+            "ap50_95": round(float(ap.mean()), 4),
+        }
+
+    # Detections of classes the annotations never mention are only reported
+    unknown = sorted(set(names.tolist()) - set(gt_counts))
+    return {
+        "map50": mean_of(classes, "ap50"),
+        "map50_95": mean_of(classes, "ap50_95"),
+        "classes": classes,
+        "unmatched_classes": unknown,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure mAP and latency of the steel detector on annotated images."
+    )
+    parser.add_argument(
+        "--data", default=DATA_DIR, help="images plus VOC .xml or YOLO .txt labels"
+    )
+    parser.add_argument("--classes", help="YOLO class names: comma-separated or a file")
+    parser.add_argument("--limit", type=int, help="evaluate an evenly spaced sample of N images")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of worker processes (default: number of CPU cores)",
+    )
+    parser.add_argument(
+        "--confidence", type=float, default=0.001, help="lowest score kept for the AP curves"
+    )
+    parser.add_argument("--iou-threshold", type=float, default=0.5, help="NMS IoU threshold")
+    parser.add_argument(
+        "--operating-confidence",
+        type=float,
+        default=0.5,
+        help="score threshold for the precision / recall columns (the GUIs use 0.5)",
+    )
+    parser.add_argument("--backend", choices=("roboflow", "onnx", "stub"))
+    parser.add_argument("--precision", choices=("fp32", "fp16", "int8"), help="ONNX variant")
+    parser.add_argument("--input-size", type=int, help="ONNX input size for dynamic exports")
+    parser.add_argument("--tiled", action="store_true", help="split large images into tiles")
+    parser.add_argument("--tile-size", type=int, help="tile size in pixels (default 640)")
+    parser.add_argument("--tile-overlap", type=int, help="tile overlap in pixels (default 128)")
+    parser.add_argument(
+        "--strip-crop", action="store_true", help="infer only the strip region of each image"
+    )
+    parser.add_argument("--label", help="name of this configuration in the results file")
+    parser.add_argument(
+        "--output", default="evaluation.jsonl", help="append one JSON line per run to this file"
+    )
+    args = parser.parse_args()
+
+    # Workers read these from the environment when they load the model
+    overrides = {
+        "DETECTOR_BACKEND": args.backend,
+        "ONNX_PRECISION": args.precision,
+        "ONNX_INPUT_SIZE": args.input_size,
+        "STEEL_TILED": "1" if args.tiled else None,
+        "STEEL_TILE_SIZE": args.tile_size,
+        "STEEL_TILE_OVERLAP": args.tile_overlap,
+        "STEEL_STRIP_CROP": "1" if args.strip_crop else None,
+    }
+    for name, value in overrides.items():
+        if value is not None:
+            os.environ[name] = str(value)
+
+    pairs = collect_pairs(args.data, args.limit)
+    if not pairs:
+        print(f"No annotated images found under {args.data}.", file=sys.stderr)
+        return 1
+    worker_settings = {
+        "class_names": find_class_names(args.data, args.classes),
+        "confidence": args.confidence,
+        "iou_threshold": args.iou_threshold,
+    }
+
+    workers = max(1, min(args.workers, len(pairs)))
+    results = []
+    failed = 0
+    start_time = time.perf_counter()
+    with multiprocessing.Pool(
+        workers, initializer=init_worker, initargs=(worker_settings,)
+    ) as pool:
+        for result in pool.imap_unordered(evaluate_image, pairs):
+            if "error" in result:
+                failed += 1
+                print(f"{result['image']}: {result['error']}", file=sys.stderr)
+                continue
+            results.append(result)
+            print(f"\r[{len(results) + failed}/{len(pairs)}]", end="", flush=True)
+    elapsed = time.perf_counter() - start_time
+    print()
+    if not results:
+        return 1
+
+    latencies = [result["inference_ms"] for result in results]
+    accuracy = summarize(results, args.operating_confidence)
+    run = {
+        "label": args.label,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "backend": os.getenv("DETECTOR_BACKEND", "roboflow"),
+            "model_id": results[0]["model_id"],
+            "precision": os.getenv("ONNX_PRECISION", "fp32"),
+            "input_size": os.getenv("ONNX_INPUT_SIZE", "640"),
+            "tiled": os.getenv("STEEL_TILED", "0") == "1",
+            "tile_size": os.getenv("STEEL_TILE_SIZE", "640"),
+            "tile_overlap": os.getenv("STEEL_TILE_OVERLAP", "128"),
+            "strip_crop": os.getenv("STEEL_STRIP_CROP", "0") == "1",
+            "confidence": args.confidence,
+            "iou_threshold": args.iou_threshold,
+            "operating_confidence": args.operating_confidence,
+            "workers": workers,
+        },
+        "images": len(results),
+        "failed": failed,
+        **accuracy,
+        "latency_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "latency_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "latency_mean_ms": round(float(np.mean(latencies)), 2),
+        "images_per_s": round(len(results) / elapsed, 3),
+    }
+
+    print(f"{'class':24s} {'GT':>6s} {'det':>6s} {'P':>7s} {'R':>7s} {'AP50':>7s} {'AP50:95':>8s}")
+    for class_name, values in accuracy["classes"].items():
+        print(
+            f"{class_name:24s} {values['ground_truth']:6d} {values['detections']:6d} "
+            f"{values['precision']:7.3f} {values['recall']:7.3f} "
+            f"{values['ap50']:7.3f} {values['ap50_95']:8.3f}"
+        )
+    if accuracy["unmatched_classes"]:
+        print(f"Detected classes without annotations: {', '.join(accuracy['unmatched_classes'])}")
+    print(
+        f"mAP@0.5 {run['map50']:.4f}, mAP@0.5:0.95 {run['map50_95']:.4f} "
+        f"on {len(results)} images; "
+        f"inference p50 {run['latency_p50_ms']:.1f}ms / p95 {run['latency_p95_ms']:.1f}ms, "
+        f"{run['images_per_s']:.2f} images/sec with {workers} workers"
+    )
+
+    with open(args.output, "a") as output_file:
+        output_file.write(json.dumps(run) + "\n")
+    print(f"Appended to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+import json
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from image_io import load_image, to_bgr
+
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+EXPORT_QUEUE_SIZE = int(os.getenv("EXPORT_QUEUE_SIZE", "16"))
+PNG_COMPRESSION = int(os.getenv("EXPORT_PNG_COMPRESSION", "3"))
+JPEG_QUALITY = int(os.getenv("EXPORT_JPEG_QUALITY", "95"))
+LABEL_FORMATS = tuple(
+    name.strip() for name in os.getenv("EXPORT_FORMATS", "coco,yolo").split(",") if name.strip()
+)
+
+# One image to write: frame is the full-resolution BGR image, or None to load
+# source_path in the worker; render(frame, predictions) draws the annotations
+ExportJob = namedtuple(
+    "ExportJob",
+    [
+        "image_path",
+        "predictions",
+        "frame",
+        "source_path",
+        "render",
+        "label_path",
+        "coco_path",
+        "classes_path",
+    ],
+)
+ExportProgress = namedtuple("ExportProgress", ["done", "failed", "total"])
+
+
+def image_write_params(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".jpg", ".jpeg"):
+        return [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY]
+    if extension == ".png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION]
+    return []
+
+
+def yolo_lines(predictions, class_index, width, height):
+    # class x_center y_center width height, normalized to the image size
+    return [
+        f"{class_index[p.class_name]} {p.x / width:.6f} {p.y / height:.6f} "
+        f"{p.width / width:.6f} {p.height / height:.6f}"
+        for p in predictions
+    ]
+
+
+def write_atomic(path, text):
+    # Workers may write the same file (e.g. classes.txt), so each uses its own temporary
+    temporary_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(temporary_path, "w") as output_file:
+        output_file.write(text)
+    os.replace(temporary_path, path)
+
+
+class Exporter:
+    # Writes annotated full-resolution images plus COCO / YOLO labels on a thread
+    # pool. At most queue_size jobs are pending, so memory stays bounded while the
+    # GUI keeps going; progress() is polled from the Tk thread.
+
+    def __init__(
+        self,
+        workers=EXPORT_WORKERS,
+        queue_size=EXPORT_QUEUE_SIZE,
+        formats=LABEL_FORMATS,
+        class_names=None,
+    ):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+        self.slots = threading.BoundedSemaphore(queue_size)
+        self.formats = formats
+        self.lock = threading.Lock()
+        self.class_names = list(class_names or [])
+        self.coco = {}
+        self.done = 0
+        self.failed = 0
+        self.total = 0
+        self.errors = []
+        # Session feeder threads, joined before the executor shuts down
+        self.feeders = []
+
+    def class_index(self, predictions):
+        # Class ids stay stable for the whole session; unseen classes are appended
+        with self.lock:
+            for prediction in predictions:
+                if prediction.class_name not in self.class_names:
+                    self.class_names.append(prediction.class_name)
+            return {name: index for index, name in enumerate(self.class_names)}
+
+    def submit(self, job, block=False):
+        # Returns False when the queue is full and block is False
+        if not self.slots.acquire(blocking=block):
+            return False
+        with self.lock:
+            self.total += 1
+        self.executor.submit(self.run, job)
+        return True
+
+    def run(self, job):
+        try:
+            self.export(job)
+            failed = False
+        except Exception as error:
+            failed = True
+            with self.lock:
+                self.errors.append(f"{job.image_path}: {error}")
+        finally:
+            self.slots.release()
+
+        with self.lock:
+            self.done += 1
+            self.failed += failed
+            finished = self.done == self.total
+        if finished:
+            self.write_coco()
+
+    def export(self, job):
+        frame = job.frame if job.frame is not None else load_image(job.source_path)
+        if frame is None:
+            raise ValueError(f"could not read {job.source_path}")
+        if job.render is not None:
+            # Draw on a colour copy, the caller may still be using its frame
+            frame = frame.copy() if frame.ndim == 3 else to_bgr(frame)
+            job.render(frame, job.predictions)
+
+        directory = os.path.dirname(job.image_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if not cv2.imwrite(job.image_path, frame, image_write_params(job.image_path)):
+            raise ValueError("could not encode image")
+
+        height, width = frame.shape[:2]
+        class_index = self.class_index(job.predictions)
+        if "yolo" in self.formats and job.label_path:
+            os.makedirs(os.path.dirname(job.label_path) or ".", exist_ok=True)
+            write_atomic(
+                job.label_path,
+                "\n".join(yolo_lines(job.predictions, class_index, width, height)) + "\n",
+            )
+            if job.classes_path:
+                with self.lock:
+                    class_list = "\n".join(self.class_names) + "\n"
+                write_atomic(job.classes_path, class_list)
+
+        if "coco" in self.formats and job.coco_path:
+            # Keyed by file name so saving the same image again replaces its entry
+            file_name = os.path.relpath(job.image_path, os.path.dirname(job.coco_path) or ".")
+            annotations = [
+                {
+                    "category_id": class_index[p.class_name] + 1,
+                    "bbox": [
+                        round(p.x - p.width / 2, 2),
+                        round(p.y - p.height / 2, 2),
+                        round(p.width, 2),
+                        round(p.height, 2),
+                    ],
+                    "area": round(p.width * p.height, 2),
+                    "score": round(float(p.confidence), 4),
+                    "iscrowd": 0,
+                }
+                for p in job.predictions
+            ]
+            with self.lock:
+                self.coco.setdefault(job.coco_path, {})[file_name] = (width, height, annotations)
+
+    def write_coco(self):
+        # Rewritten whenever the queue drains, so each file always holds complete entries
+        with self.lock:
+            categories = [
+                {"id": index + 1, "name": name} for index, name in enumerate(self.class_names)
+            ]
+            datasets = {path: list(entries.items()) for path, entries in self.coco.items()}
+
+        for path, entries in datasets.items():
+            images, annotations = [], []
+            for image_id, (file_name, (width, height, image_annotations)) in enumerate(
+                entries, start=1
+            ):
+                images.append(
+                    {"id": image_id, "file_name": file_name, "width": width, "height": height}
+                )
+                for annotation in image_annotations:
+                    annotations.append(
+                        {"id": len(annotations) + 1, "image_id": image_id, **annotation}
+                    )
+            write_atomic(
+                path,
+                json.dumps(
+                    {"images": images, "annotations": annotations, "categories": categories}
+                ),
+            )
+
+    def progress(self):
+        with self.lock:
+            return ExportProgress(self.done, self.failed, self.total)
+
+    def export_session(self, session, directory, render, image_format="png"):
+        # Bulk export of (source_path, predictions) pairs; images are reloaded in the
+        # workers and a feeder thread waits for free slots so the caller never blocks
+        coco_path = os.path.join(directory, "annotations.json")
+        used_names = set()
+
+        def feed():
+            for source_path, predictions in session:
+                name = os.path.splitext(os.path.basename(source_path))[0]
+                stem, suffix = name, 1
+                while stem in used_names:
+                    suffix += 1
+                    stem = f"{name}_{suffix}"
+                used_names.add(stem)
+                self.submit(
+                    ExportJob(
+                        image_path=os.path.join(directory, "images", f"{stem}.{image_format}"),
+                        predictions=predictions,
+                        frame=None,
+                        source_path=source_path,
+                        render=render,
+                        label_path=os.path.join(directory, "labels", f"{stem}.txt"),
+                        coco_path=coco_path,
+                        classes_path=os.path.join(directory, "labels", "classes.txt"),
+                    ),
+                    block=True,
+                )
+
+        feeder = threading.Thread(target=feed, name="export-feed", daemon=True)
+        self.feeders.append(feeder)
+        feeder.start()
+
+    def close(self):
+        # Waits for pending exports; feeders finish submitting first, since the
+        # executor rejects jobs once it is shut down
+        for feeder in self.feeders:
+            feeder.join()
+        self.executor.shutdown(wait=True)
+        self.write_coco()
+
+
+def single_image_job(image_path, predictions, frame, render=None):
+    # Labels next to a user-chosen image path: same stem with .txt (YOLO), .classes.txt
+    # (its class names) and .json (COCO), so nothing else in that folder is touched
+    stem = os.path.splitext(image_path)[0]
+    return ExportJob(
+        image_path=image_path,
+        predictions=predictions,
+        frame=frame,
+        source_path=None,
+        render=render,
+        label_path=stem + ".txt",
+        coco_path=stem + ".json",
+        classes_path=stem + ".classes.txt",
+    )
+
+
+def format_progress(progress):
+    if progress.total == 0:
+        return ""
+    text = f"Exported {progress.done}/{progress.total}"
+    if progress.failed:
+        text += f" ({progress.failed} failed)"
+    return text
@@ -1,77 +1,88 @@
 import tkinter as tk
 from tkinter import filedialog
-from PIL import Image, ImageTk
-import cv2
-from inference.models.utils import get_roboflow_model
 import time
-from dotenv import load_dotenv
-import os
+from startup import BackgroundLoader, StartupTimer
 
-load_dotenv()
+# Cold-start milestones, shown in the window and exported as startup_* stages
+startup = StartupTimer()
 
-# Roboflow model details
-model_name = "cr7-det-shuzong-dataset"
-model_version = "2"
+# Model and metrics are created on a background thread once the window is up
+model = None
+metrics = None
 
-API_KEY = os.getenv("API_KEY")  # Replace with your actual API key
 
-# Load the Roboflow face detection model
-model = get_roboflow_model(model_id=f"{model_name}/{model_version}", api_key=API_KEY)
+def load_pipeline():
+    # Runs on the loader thread: heavy imports (OpenCV, NumPy, PIL, the inference
+    # backend), the model and a warm-up inference, so neither the window nor the
+    # first real image waits for them
+    import PIL.ImageTk
+    import image_io
+    import renderer
+    from detector import load_detector, warm_up
+    from instrumentation import load_instrumentation
+
+    startup.mark("imports")
+    # Load the face detection model (backend selected through DETECTOR_BACKEND)
+    loaded_model = load_detector()
+    startup.mark("model")
+    warm_up(loaded_model)
+    startup.mark("ready")
+
+    # Per-stage timers, exported when METRICS_PORT / METRICS_JSONL are set
+    return loaded_model, load_instrumentation("face-image")
+
+
+def pipeline_ready(loaded):
+    global model, metrics
+    model, metrics = loaded
+    startup.record(metrics)
+    startup_label.config(text=startup.format())
+    open_image_button.config(text="Select and Detect Image", state="normal")
+
+
+def pipeline_failed(error):
+    open_image_button.config(text="Model failed to load")
+    startup_label.config(text=f"Could not load the model: {error}")
 
 
 def open_and_detect_image():
+    from PIL import ImageTk
+    from image_io import load_image, make_preview
+    from renderer import render_faces
+
     file_path = filedialog.askopenfilename(
         filetypes=[("Image Files", "*.png;*.jpg;*.jpeg;*.bmp;*.gif")]
     )
     if file_path:
-        start_time = time.time()  # Start time before processing
+        start_time = time.perf_counter()  # Start time before processing
 
         # Load image with OpenCV
-        frame = cv2.imread(file_path)
+        with metrics.stage("decode"):
+            frame = load_image(file_path)
 
         # Inference image to find faces
-        results = model.infer(image=frame, confidence=0.5, iou_threshold=0.5)
+        with metrics.stage("inference"):
+            results = model.infer(image=frame, confidence=0.5, iou_threshold=0.5)
+        metrics.record_detector(model)
 
         # Plot image with face bounding box (using OpenCV)
-        if results[0].predictions:
-            for prediction in results[0].predictions:
-                x_center = int(prediction.x)
-                y_center = int(prediction.y)
-                width = int(prediction.width)
-                height = int(prediction.height)
-
-                # Calculate top-left and bottom-right corners from center, width, and height
-                x0 = x_center - width // 2
-                y0 = y_center - height // 2
-                x1 = x_center + width // 2
-                y1 = y_center + height // 2
-
-                cv2.rectangle(frame, (x0, y0), (x1, y1), (255, 255, 0), 10)
-                cv2.putText(
-                    frame,
-                    "Face",
-                    (x0, y0 - 10),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    1.5,
-                    (255, 255, 255),
-                    2,
-                )
-
-        # Convert BGR to RGB for Tkinter
-        detected_image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        annotated_image = Image.fromarray(detected_image_rgb)
-        annotated_image.thumbnail(
-            (400, 300), Image.Resampling.LANCZOS
-        )  # Resize to fit window
-        photo = ImageTk.PhotoImage(annotated_image)
+        with metrics.stage("render"):
+            render_faces(frame, results[0].predictions, thickness=10, font_scale=1.5)
+
+        # Downscale to fit the window first, then convert BGR to RGB for Tkinter
+        with metrics.stage("convert"):
+            annotated_image = make_preview(frame)
 
         # Display the image with annotations
-        image_label.config(image=photo)
-        image_label.image = photo  # Keep reference to avoid garbage collection
+        with metrics.stage("display"):
+            photo = ImageTk.PhotoImage(annotated_image)
+            image_label.config(image=photo)
+            image_label.image = photo  # Keep reference to avoid garbage collection
+        metrics.frame()
 
         # End time after processing is done
-        end_time = time.time()  # Record end time
-        processing_time = (end_time - start_time) * 1000  # Convert to milliseconds
+        processing_time = (time.perf_counter() - start_time) * 1000  # Convert to milliseconds
+        metrics.record("total", processing_time)
 
         # Summary of detections
         detection_count = len(results[0].predictions)
@@ -93,15 +104,22 @@ def open_and_detect_image():
         processing_textbox.insert(tk.END, processing_text)
         processing_textbox.configure(state="disabled")
 
+        # Time to first result, counted from process start
+        if "first_result" not in startup.marks:
+            startup.mark("first_result")
+            startup.record(metrics, ["first_result"])
+            startup_label.config(text=startup.format())
+
 
 # Create the main window
 root = tk.Tk()
 root.title("Roboflow Face Detection Viewer")
 root.geometry("500x500")  # Set fixed size to 600x700
 
-# Create a button to open and detect objects in the image
+# Create a button to open and detect objects in the image, enabled once the
+# model has loaded and warmed up
 open_image_button = tk.Button(
-    root, text="Select and Detect Image", command=open_and_detect_image
+    root, text="Loading model…", command=open_and_detect_image, state="disabled"
 )
 open_image_button.pack(pady=10)
 
@@ -135,5 +153,13 @@ processing_textbox = tk.Text(
 processing_textbox.pack(pady=5)
 processing_textbox.configure(state="disabled")  # Disable typing initially
 
+# Create a label for the cold-start and time-to-first-result report
+startup_label = tk.Label(root, text="", font=("Arial", 8), wraplength=480)
+startup_label.pack(pady=0)
+
+# Load the model in the background; the window appears right away
+root.after_idle(startup.mark, "window")
+loader = BackgroundLoader(root, load_pipeline, pipeline_ready, pipeline_failed)
+
 # Run the application
 root.mainloop()
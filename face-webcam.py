@@ -1,130 +1,485 @@
 import tkinter as tk
-from PIL import Image, ImageTk
-import cv2
+import os
+import sys
 import time
-from inference.models.utils import get_roboflow_model
+import traceback
 from dotenv import load_dotenv
-import os
+from frame_pipeline import AllocationMeter, DropOldestQueue, FpsMeter, StageThread
+from startup import BackgroundLoader, StartupTimer
 
+# Settings below come from .env; detector.py, which normally loads it, is imported later
 load_dotenv()
 
-# Roboflow model details
-model_name = "cr7-det-shuzong-dataset"
-model_version = "2"
+# Cold-start milestones, shown in the window and exported as startup_* stages
+startup = StartupTimer()
+
+# Model and metrics are created on a background thread once the window is up
+model = None
+metrics = None
+
+# Size of the preview shown in the window
+PREVIEW_SIZE = (400, 300)
 
-API_KEY = os.getenv("API_KEY")  # Replace with your actual API key
+# Run the detector every N frames and track boxes in between (1 = every frame);
+# with a minimum tracking confidence the detector also runs when tracking degrades
+DETECT_EVERY_N = int(os.getenv("DETECT_EVERY_N", "1"))
+TRACKER = os.getenv("TRACKER", "iou")  # iou or flow
+TRACKER_MIN_CONFIDENCE = float(os.getenv("TRACKER_MIN_CONFIDENCE", "0"))
 
-# Load the Roboflow face detection model
-model = get_roboflow_model(model_id=f"{model_name}/{model_version}", api_key=API_KEY)
+# Run the detector in this many worker processes that read frames from a shared
+# memory ring (0 = one inference thread in this process)
+INFERENCE_PROCESSES = int(os.getenv("INFERENCE_PROCESSES", "0"))
+
+# Report Python-heap allocations per frame (tracemalloc, slows the loop down)
+TRACE_ALLOCATIONS = os.getenv("TRACE_ALLOCATIONS", "0") == "1"
 
 # Global variables
 cap = None
 running = False
 paused = False
+stages = []
+
+# Frames and previews live in rings of preallocated slots, created once the
+# first frame's size is known, so the steady-state loop allocates no images.
+# A full ring drops its oldest unread frame, so capture never waits on
+# inference and latency stays bounded. The camera ring is shared memory when
+# INFERENCE_PROCESSES is set.
+ring = None
+preview_ring = None
+inference_pool = None
+inference_queue = DropOldestQueue(maxsize=1)
+results_queue = DropOldestQueue(maxsize=1)
+
+# Persistent Tk-side image, refilled from the newest preview slot
+preview_image = None
+preview_photo = None
+allocations = None
+
+# Tracker state, only touched by the display stage
+detect_every_n = DETECT_EVERY_N
+tracker = None
+change_gate = None
+detection_pending = False
+frames_since_detection = 0
+inference_time = 0.0
+inference_error = None
+
+# Frame rates measured from real frame intervals
+capture_fps = FpsMeter()
+inference_fps = FpsMeter()
+tracked_fps = FpsMeter()
+
+
+def load_pipeline():
+    # Runs on the loader thread: heavy imports (OpenCV, NumPy, PIL, the inference
+    # backend), the model and a warm-up inference, so neither the window nor the
+    # first frame waits for them
+    import PIL.ImageTk
+    import image_io
+    import renderer
+    from change_gate import ChangeGate
+    from detector import load_detector, warm_up
+    from instrumentation import load_instrumentation
+    from tracking import make_tracker
+
+    startup.mark("imports")
+    # Load the face detection model (backend selected through DETECTOR_BACKEND);
+    # inference worker processes load their own when the camera starts
+    loaded_model = None
+    if not INFERENCE_PROCESSES:
+        loaded_model = load_detector()
+        startup.mark("model")
+        warm_up(loaded_model)
+        startup.mark("ready")
+
+    # Per-stage timers, exported when METRICS_PORT / METRICS_JSONL are set; the
+    # change gate skips detections while the scene is static
+    return (
+        loaded_model,
+        load_instrumentation("face-webcam"),
+        make_tracker(TRACKER),
+        ChangeGate(),
+    )
+
+
+def pipeline_ready(loaded):
+    global model, metrics, tracker, change_gate
+    model, metrics, tracker, change_gate = loaded
+    skip_unchanged_var.set(change_gate.enabled)
+    if change_gate.enabled:
+        skip_unchanged_button.config(state=tk.NORMAL)
+    startup.record(metrics)
+    startup_label.config(text=startup.format())
+    start_button.config(text="Start Camera", state=tk.NORMAL)
+
+
+def pipeline_failed(error):
+    start_button.config(text="Model failed to load")
+    startup_label.config(text=f"Could not load the model: {error}")
+
+
+def capture_step():
+    # Capture thread: read frames at camera rate, decoded straight into a free
+    # ring slot so no frame is allocated
+    if paused:
+        time.sleep(0.01)
+        return
+    slot = ring.writable()
+    if slot is None:
+        time.sleep(0.005)
+        return
+    view = ring.view(slot)
+    with metrics.stage("read"):
+        ret, frame = cap.read(view)
+    if not ret or frame.shape != view.shape:
+        ring.release(slot)
+        time.sleep(0.01)
+        return
+    if frame is not view:
+        view[...] = frame
+    timestamp = time.perf_counter()
+    capture_fps.tick(timestamp)
+    ring.publish(slot, timestamp)
+
+
+def inference_step():
+    # Inference worker: runs the detector on frames the display stage selected
+    global detection_pending, inference_error
+    item = inference_queue.get(timeout=0.1)
+    if item is None:
+        return
+    slot, timestamp = item
+
+    start_time = time.perf_counter()
+    try:
+        results = model.infer(image=ring.view(slot), confidence=0.5, iou_threshold=0.5)
+    except Exception as error:
+        # Keep detecting: the error is shown and the next due frame is requested again
+        traceback.print_exc(file=sys.stderr)
+        inference_error = f"Inference failed: {type(error).__name__}: {error}"
+        detection_pending = False
+        return
+    finally:
+        ring.release(slot)
+    metrics.record_detector(model)
+    detections_ready(results[0].predictions, timestamp, (time.perf_counter() - start_time) * 1000)
+
+
+def detections_ready(predictions, timestamp, milliseconds):
+    # From the inference thread, or the collector thread of the worker processes
+    global inference_time, inference_error
+    inference_time = milliseconds
+    inference_error = None
+    metrics.record("inference", inference_time)
+    results_queue.put(predictions)
+    inference_fps.tick()
+
+
+def display_step():
+    # Display stage: track boxes on every frame, request detections every N frames
+    # (or sooner when tracking confidence drops) and build the preview off the Tk thread
+    global detection_pending, frames_since_detection
+    from image_io import downscale_into, preview_scale, scale_predictions
+    from renderer import render_faces
+
+    item = ring.get(timeout=0.1)
+    if item is None:
+        return
+    slot, timestamp = item
+    frame = ring.view(slot)
+    tracked_fps.tick(timestamp)
+    if allocations is not None:
+        allocations.tick()
+
+    with metrics.stage("track"):
+        detections = results_queue.get_latest()
+        if detections is not None:
+            predictions = tracker.update(frame, detections)
+            detection_pending = False
+        else:
+            predictions = tracker.track(frame)
+
+    # Each worker process takes its own frame, so with several of them detections
+    # overlap instead of waiting for the previous result
+    frames_since_detection += 1
+    can_detect = inference_pool.idle() if inference_pool is not None else not detection_pending
+    if can_detect and (
+        frames_since_detection >= detect_every_n
+        or tracker.confidence < TRACKER_MIN_CONFIDENCE
+    ):
+        # While nothing changed since the last inferred frame, keep its detections
+        with metrics.stage("change_gate"):
+            changed = change_gate.should_infer(frame, timestamp)
+        if not changed:
+            # Reuse the last detections as they are instead of extrapolating motion
+            predictions = tracker.hold()
+        elif inference_pool is not None:
+            inference_pool.submit(slot, timestamp)
+        else:
+            # The inference thread releases the slot; with one detection pending
+            # at most, the queue never drops it
+            ring.retain(slot)
+            inference_queue.put((slot, timestamp))
+            detection_pending = True
+        frames_since_detection = 0
+
+    # Downscale into a free preview slot and draw there, so the frame an
+    # inference worker may still be reading is never touched
+    preview_slot = preview_ring.writable()
+    if preview_slot is not None:
+        preview_frame = preview_ring.view(preview_slot)
+        with metrics.stage("downscale"):
+            downscale_into(frame, preview_frame)
+        scale = preview_scale(frame.shape, PREVIEW_SIZE)
+    ring.release(slot)
+    if preview_slot is None:
+        return
+
+    with metrics.stage("render"):
+        render_faces(
+            preview_frame,
+            scale_predictions(predictions, scale),
+            thickness=2,
+            font_scale=0.6,
+            texts=[f"Face {prediction.track_id}" for prediction in predictions],
+        )
+    # The Tk thread converts BGR to RGB while copying into its image
+    preview_ring.publish(preview_slot, timestamp)
+
+
+def change_detect_every_n(*_):
+    global detect_every_n
+    # Read on the Tk thread; the display stage only sees the plain integer
+    try:
+        detect_every_n = max(1, detect_every_n_var.get())
+    except tk.TclError:
+        pass  # Ignore partially typed values
+
+
+def change_tracker(name):
+    global tracker
+    from tracking import make_tracker
+
+    # The next detection re-seeds the new tracker
+    tracker = make_tracker(name)
+    change_gate.reset()
+
+
+def change_skip_unchanged():
+    # Read on the Tk thread; the display stage only sees the plain flag
+    change_gate.enabled = skip_unchanged_var.get()
+    change_gate.reset()
 
 
 def start_camera():
-    global cap, running, paused
+    global cap, running, stages, ring, preview_ring, inference_pool
+    global preview_image, preview_photo, allocations
+    import cv2
+    from PIL import Image, ImageTk
+    from frame_ring import FrameRing, ProcessInference, ring_slots
+    from image_io import preview_size
+
     cap = cv2.VideoCapture(0)  # Access the webcam
+    # Slots are sized from the first frame; the camera keeps its resolution
+    ret, frame = cap.read()
+    if not ret:
+        start_button.config(text="No camera frame")
+        return
+    ring = FrameRing(
+        ring_slots(INFERENCE_PROCESSES or 1), frame.shape, shared=INFERENCE_PROCESSES > 0
+    )
+    # One preview being drawn, one waiting and one being copied by the Tk thread
+    width, height = preview_size(frame.shape, PREVIEW_SIZE)
+    preview_ring = FrameRing(3, (height, width, 3), ready=1, shared=False)
+    preview_image = Image.new("RGB", (width, height))
+    preview_photo = ImageTk.PhotoImage(preview_image)
+    image_label.config(image=preview_photo)
+
+    stages = [StageThread("capture", capture_step), StageThread("display", display_step)]
+    if INFERENCE_PROCESSES:
+        inference_pool = ProcessInference(ring, INFERENCE_PROCESSES, detections_ready)
+        inference_pool.start()
+    else:
+        stages.append(StageThread("inference", inference_step))
+    if TRACE_ALLOCATIONS:
+        allocations = AllocationMeter()
+        allocations.start()
     running = True
+    for stage in stages:
+        stage.start()
     pause_button.config(state=tk.NORMAL)
     start_button.config(state=tk.DISABLED)
     update_frame()  # Start updating frames
 
 
 def update_frame():
-    global cap, running, paused
-    if running:
-        ret, frame = cap.read()  # Read a frame from the camera
-        if ret:
-            start_time = time.time()  # Start time before processing
-
-            # Perform inference with Roboflow model
-            results = model.infer(image=frame, confidence=0.5, iou_threshold=0.5)
-            if results[0].predictions:
-                for prediction in results[0].predictions:
-                    x_center, y_center = int(prediction.x), int(prediction.y)
-                    width, height = int(prediction.width), int(prediction.height)
-                    x0, y0 = x_center - width // 2, y_center - height // 2
-                    x1, y1 = x_center + width // 2, y_center + height // 2
-                    cv2.rectangle(frame, (x0, y0), (x1, y1), (255, 255, 0), 2)
-                    cv2.putText(
-                        frame,
-                        "Face",
-                        (x0, y0 - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        0.6,
-                        (255, 255, 255),
-                        2,
-                    )
-
-            # Convert BGR to RGB for Tkinter display
-            detected_image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            annotated_image = Image.fromarray(detected_image_rgb)
-            annotated_image.thumbnail((400, 300), Image.Resampling.LANCZOS)
-            photo = ImageTk.PhotoImage(annotated_image)
-
-            # Display annotated image
-            image_label.config(image=photo)
-            image_label.image = photo
-
-            # Display processing time
-            end_time = time.time()
-            processing_time = (end_time - start_time) * 1000  # in milliseconds
+    # Tk main thread only copies the newest finished preview into the one photo
+    # image; nothing is allocated per frame
+    if not running:
+        return
+    item = preview_ring.get(timeout=0)
+    if item is not None and paused:
+        preview_ring.release(item[0])
+    elif item is not None:
+        slot, timestamp = item
+
+        # Display annotated image (BGR to RGB while copying)
+        with metrics.stage("display"):
+            preview_image.frombytes(preview_ring.view(slot), "raw", "BGR")
+            preview_photo.paste(preview_image)
+        preview_ring.release(slot)
+        metrics.frame()
+
+        # Time to the first frame annotated by the detector, counted from process start
+        if inference_time and "first_result" not in startup.marks:
+            startup.mark("first_result")
+            startup.record(metrics, ["first_result"])
+            startup_label.config(text=startup.format())
+
+        # Display inference time and capture-to-display latency
+        latency = (time.perf_counter() - timestamp) * 1000
+        metrics.record("latency", latency)
+        processing_label.config(
+            text=f"Total processing time: {inference_time:.1f}ms, "
+            f"latency: {latency:.1f}ms"
+        )
+        gate_label.config(text=change_gate.format())
+        if allocations is not None:
+            allocation_label.config(text=allocations.format())
+
+        # Show displayed FPS and the share of frames that ran the detector
+        duty_cycle = inference_fps.fps / tracked_fps.fps * 100 if tracked_fps.fps else 0.0
+        fps_label.config(
+            text=f"FPS: {metrics.fps:.2f} (camera {capture_fps.fps:.2f}, "
+            f"inference {inference_fps.fps:.2f}, "
+            f"detector duty {duty_cycle:.0f}%)"
+        )
+        if inference_pool is not None:
+            stats = inference_pool.stats()
             processing_label.config(
-                text=f"Total processing time: {processing_time:.1f}ms"
+                text=inference_pool.error
+                or f"{processing_label.cget('text')}, {stats['alive']}/{stats['processes']} "
+                f"inference processes, ring {stats['ring_mb']:.0f}MB"
             )
+        elif inference_error:
+            processing_label.config(text=inference_error)
 
-            # Show FPS
-            fps = 1 / (end_time - start_time)
-            fps_label.config(text=f"FPS: {fps:.2f}")
-
-        if not paused:
-            image_label.after(1, update_frame)  # Continue updating frames if not paused
+    image_label.after(5, update_frame)
 
 
 def pause_camera():
     global paused
     paused = not paused
     pause_button.config(text="Resume" if paused else "Pause")
-    if not paused:
-        update_frame()  # Resume updating frames
 
 
-# Create Tkinter window
-root = tk.Tk()
-root.title("Roboflow Face Detection Viewer")
-root.geometry("500x500")
+def stop_camera():
+    global running
+    running = False
+    for stage in stages:
+        stage.stop()
+    for queue in (inference_queue, results_queue):
+        queue.close()
+    for frames in (ring, preview_ring):
+        if frames is not None:
+            frames.close()
+    for stage in stages:
+        stage.join(timeout=1)
+    if inference_pool is not None:
+        inference_pool.stop()
+    if ring is not None:
+        ring.unlink()
+    if allocations is not None:
+        print(allocations.format())
+        allocations.stop()
+
+
+def on_close():
+    stop_camera()
+    root.destroy()
+
+
+# Inference worker processes import this script again; only the GUI process builds the window
+if __name__ == "__main__":
+    # Create Tkinter window
+    root = tk.Tk()
+    root.title("Roboflow Face Detection Viewer")
+    root.geometry("500x600")
+    root.protocol("WM_DELETE_WINDOW", on_close)
+
+    # Image display label with a grey placeholder (a plain Tk image, PIL is not loaded yet)
+    placeholder_photo = tk.PhotoImage(width=400, height=300)
+    placeholder_photo.put("grey", to=(0, 0, 400, 300))
+
+    image_label = tk.Label(root, image=placeholder_photo)  # Set the placeholder image
+    image_label.pack(pady=10)
+
+    # FPS display label
+    fps_label = tk.Label(root, text="FPS: 0.00")
+    fps_label.pack(pady=5)
+
+    # Processing time display label initialized with placeholder text
+    processing_label = tk.Label(
+        root, text="Total processing time: 0.0ms", font=("Arial", 10)
+    )
+    processing_label.pack(pady=5)
+
+    # Detector skips reported by the change gate
+    gate_label = tk.Label(root, text="", font=("Arial", 10))
+    gate_label.pack(pady=0)
+
+    # Allocations per frame, with TRACE_ALLOCATIONS=1
+    allocation_label = tk.Label(root, text="", font=("Arial", 8))
+    allocation_label.pack(pady=0)
 
-# Image display label with a grey placeholder
-placeholder_image = Image.new("RGB", (400, 300), "grey")  # Create a grey placeholder
-placeholder_photo = ImageTk.PhotoImage(placeholder_image)
+    # Tracking settings: detector interval and tracker type
+    settings_frame = tk.Frame(root)
+    settings_frame.pack(pady=5)
+    tk.Label(settings_frame, text="Detect every N frames:").pack(side=tk.LEFT)
+    detect_every_n_var = tk.IntVar(value=DETECT_EVERY_N)
+    detect_every_n_var.trace_add("write", change_detect_every_n)
+    tk.Spinbox(
+        settings_frame, from_=1, to=60, width=4, textvariable=detect_every_n_var
+    ).pack(side=tk.LEFT, padx=5)
+    tk.Label(settings_frame, text="Tracker:").pack(side=tk.LEFT)
+    tracker_var = tk.StringVar(value=TRACKER)
+    tk.OptionMenu(settings_frame, tracker_var, "iou", "flow", command=change_tracker).pack(
+        side=tk.LEFT
+    )
 
-image_label = tk.Label(root, image=placeholder_photo)  # Set the placeholder image
-image_label.pack(pady=10)
+    # Skip detections on frames that look like the last inferred one; enabled once
+    # the model has loaded, unless MOTION_GATE=off
+    skip_unchanged_var = tk.BooleanVar(value=False)
+    skip_unchanged_button = tk.Checkbutton(
+        root,
+        text="Skip unchanged frames",
+        variable=skip_unchanged_var,
+        command=change_skip_unchanged,
+        state=tk.DISABLED,
+    )
+    skip_unchanged_button.pack(pady=0)
 
-# FPS display label
-fps_label = tk.Label(root, text="FPS: 0.00")
-fps_label.pack(pady=5)
+    # Start camera button, enabled once the model has loaded and warmed up
+    start_button = tk.Button(
+        root, text="Loading model…", command=start_camera, state=tk.DISABLED
+    )
+    start_button.pack(pady=10)
 
-# Processing time display label initialized with placeholder text
-processing_label = tk.Label(
-    root, text="Total processing time: 0.0ms", font=("Arial", 10)
-)
-processing_label.pack(pady=5)
+    # Pause camera button
+    pause_button = tk.Button(root, text="Pause", command=pause_camera, state=tk.DISABLED)
+    pause_button.pack(pady=10)
 
-# Start camera button
-start_button = tk.Button(root, text="Start Camera", command=start_camera)
-start_button.pack(pady=10)
+    # Cold-start and time-to-first-result report
+    startup_label = tk.Label(root, text="", font=("Arial", 8), wraplength=480)
+    startup_label.pack(pady=0)
 
-# Pause camera button
-pause_button = tk.Button(root, text="Pause", command=pause_camera, state=tk.DISABLED)
-pause_button.pack(pady=10)
+    # Load the model in the background; the window appears right away
+    root.after_idle(startup.mark, "window")
+    loader = BackgroundLoader(root, load_pipeline, pipeline_ready, pipeline_failed)
 
-# Run the Tkinter main loop
-root.mainloop()
+    # Run the Tkinter main loop
+    root.mainloop()
 
-# Release camera on exit
-if cap is not None:
-    cap.release()
-cv2.destroyAllWindows()
+    # Release camera on exit
+    if cap is not None:
+        cap.release()
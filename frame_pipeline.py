@@ -0,0 +1,116 @@
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+
+class DropOldestQueue:
+    # Bounded queue where a full put() discards the oldest item instead of
+    # blocking the producer, so a slow consumer always sees recent data
+
+    def __init__(self, maxsize=1):
+        self.items = deque(maxlen=maxsize)
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, item):
+        with self.condition:
+            if len(self.items) == self.items.maxlen:
+                self.dropped += 1
+            self.items.append(item)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        # Blocks until an item arrives; returns None on timeout or after close()
+        with self.condition:
+            if not self.condition.wait_for(
+                lambda: self.items or self.closed, timeout=timeout
+            ):
+                return None
+            return self.items.popleft() if self.items else None
+
+    def get_latest(self):
+        # Non-blocking: newest item (discarding older ones) or None
+        with self.condition:
+            if not self.items:
+                return None
+            item = self.items.pop()
+            self.dropped += len(self.items)
+            self.items.clear()
+            return item
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class FpsMeter:
+    # Frames per second from real frame intervals over a sliding time window
+
+    def __init__(self, window=1.0):
+        self.window = window
+        self.timestamps = deque()
+
+    def tick(self, now=None):
+        now = time.perf_counter() if now is None else now
+        self.timestamps.append(now)
+        while now - self.timestamps[0] > self.window:
+            self.timestamps.popleft()
+
+    @property
+    def fps(self):
+        if len(self.timestamps) < 2:
+            return 0.0
+        elapsed = self.timestamps[-1] - self.timestamps[0]
+        return (len(self.timestamps) - 1) / elapsed if elapsed > 0 else 0.0
+
+
+class AllocationMeter:
+    # Python-heap bytes (NumPy and OpenCV arrays included) allocated per frame,
+    # from tracemalloc: the peak above the live size since the previous tick, so a
+    # buffer allocated and freed within the frame still counts. tracemalloc slows
+    # everything down, so this is a debugging aid.
+
+    def __init__(self, window=100):
+        self.samples = deque(maxlen=window)
+        self.live = 0
+
+    def start(self):
+        tracemalloc.start()
+        self.live = tracemalloc.get_traced_memory()[0]
+
+    def tick(self):
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        self.samples.append(max(peak - self.live, 0))
+        self.live = current
+
+    def format(self):
+        if not self.samples:
+            return "Allocations: -"
+        return (
+            f"Allocations: {sum(self.samples) / len(self.samples) / 1024:.1f}KB/frame "
+            f"(max {max(self.samples) / 1024:.1f}KB), live {self.live / 2**20:.1f}MB"
+        )
+
+    def stop(self):
+        tracemalloc.stop()
+
+
+class StageThread(threading.Thread):
+    # Runs step() in a loop until stop() is called; step() returning False ends it
+
+    def __init__(self, name, step):
+        super().__init__(name=name, daemon=True)
+        self.step = step
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            if self.step() is False:
+                break
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,281 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from detector import make_predictions
+from frame_pipeline import StageThread
+
+
+class FrameRing:
+    # A fixed number of frame-sized slots in one shared memory block. Capture
+    # writes a frame into a free slot in place and publishes it; readers get the
+    # slot index and use a NumPy view of it. Every holder of a slot releases it
+    # once done, and the slot is reused when no one holds it any more. The slot
+    # bookkeeping lives in the process that created the ring; worker processes
+    # only attach to the memory by name. With shared=False the slots are plain
+    # process memory, a preallocated buffer pool for threads.
+
+    def __init__(self, slots, shape, dtype=np.uint8, ready=2, shared=True):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.nbytes = slots * frame_bytes
+        self.memory = None
+        if shared:
+            self.memory = shared_memory.SharedMemory(create=True, size=self.nbytes)
+            self.frames = np.ndarray((slots, *self.shape), self.dtype, buffer=self.memory.buf)
+        else:
+            self.frames = np.zeros((slots, *self.shape), self.dtype)
+        self.holds = [0] * slots
+        self.timestamps = [0.0] * slots
+        self.free = deque(range(slots))
+        # Published frames nobody has read yet; past this many the oldest is dropped
+        self.ready = deque()
+        self.ready_size = ready
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.full = 0
+        self.closed = False
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def view(self, slot):
+        return self.frames[slot]
+
+    def writable(self):
+        # A free slot for the next frame, held by the caller; None when every slot
+        # is still in use (the caller skips the frame)
+        with self.condition:
+            if not self.free:
+                self.full += 1
+                return None
+            slot = self.free.popleft()
+            self.holds[slot] = 1
+            return slot
+
+    def publish(self, slot, timestamp):
+        # Hands the caller's hold on a written slot over to the next get()
+        with self.condition:
+            self.timestamps[slot] = timestamp
+            if len(self.ready) == self.ready_size:
+                self.dropped += 1
+                self.release_locked(self.ready.popleft())
+            self.ready.append(slot)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        # Oldest published (slot, timestamp), held by the caller; None on timeout
+        # or after close()
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.ready or self.closed, timeout=timeout):
+                return None
+            if not self.ready:
+                return None
+            slot = self.ready.popleft()
+            return slot, self.timestamps[slot]
+
+    def retain(self, slot):
+        with self.condition:
+            self.holds[slot] += 1
+
+    def release(self, slot):
+        with self.condition:
+            self.release_locked(slot)
+
+    def release_locked(self, slot):
+        self.holds[slot] -= 1
+        if self.holds[slot] == 0:
+            self.free.append(slot)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def unlink(self):
+        # Called once no process uses the ring any more. Views still referenced
+        # elsewhere keep the mapping alive until they are gone; the name is
+        # removed either way.
+        self.frames = None
+        if self.memory is None:
+            return
+        try:
+            self.memory.close()
+        except BufferError:
+            pass
+        self.memory.unlink()
+
+
+def inference_worker(ring_name, ring_shape, dtype, threads, tasks, results, confidence, iou):
+    # Worker process: attaches to the ring, loads its own detector and answers
+    # (slot, timestamp) tasks with detection arrays; the frame is never copied
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    os.environ.setdefault("ONNX_INTRA_OP_THREADS", str(threads))
+    import cv2
+
+    cv2.setNumThreads(1)
+
+    memory = shared_memory.SharedMemory(name=ring_name)
+    frames = np.ndarray(ring_shape, np.dtype(dtype), buffer=memory.buf)
+    try:
+        from detector import load_detector, predictions_to_arrays, warm_up
+
+        model = load_detector()
+        warm_up(model)
+    except Exception as error:
+        results.put((None, 0.0, f"{type(error).__name__}: {error}"))
+        return
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        slot, timestamp = task
+        start_time = time.perf_counter()
+        try:
+            predictions = model.infer(image=frames[slot], confidence=confidence, iou_threshold=iou)
+            arrays = predictions_to_arrays(predictions[0].predictions)
+        except Exception as error:
+            results.put((slot, timestamp, f"{type(error).__name__}: {error}"))
+            continue
+        inference_ms = (time.perf_counter() - start_time) * 1000
+        results.put((slot, timestamp, arrays, inference_ms))
+    del frames
+    memory.close()
+
+
+class ProcessInference:
+    # Runs the detector in worker processes on frames of a FrameRing. Each task
+    # and result is a few bytes plus the detection arrays, so throughput scales
+    # with cores while memory stays at the ring size plus one model per process.
+    # At most one frame per worker is in flight; a frame submitted while all
+    # workers are busy waits, replacing (and dropping) any frame already waiting.
+    # on_result(predictions, timestamp, inference_ms) is called on the collector
+    # thread, newest frames only.
+
+    def __init__(self, ring, processes, on_result, confidence=0.5, iou_threshold=0.5):
+        context = multiprocessing.get_context("spawn")
+        self.ring = ring
+        self.processes = processes
+        self.on_result = on_result
+        self.tasks = context.Queue()
+        self.results = context.Queue()
+        threads = max((os.cpu_count() or 1) // processes, 1)
+        self.workers = [
+            context.Process(
+                target=inference_worker,
+                args=(
+                    ring.name,
+                    ring.frames.shape,
+                    ring.dtype.str,
+                    threads,
+                    self.tasks,
+                    self.results,
+                    confidence,
+                    iou_threshold,
+                ),
+                name=f"inference-{index}",
+                daemon=True,
+            )
+            for index in range(processes)
+        ]
+        self.collector = StageThread("collect", self.collect_step)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = None
+        self.latest = 0.0
+        self.completed = 0
+        self.dropped = 0
+        self.stale = 0
+        self.error = None
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        self.collector.start()
+
+    def idle(self):
+        # Whether a submitted frame would start right away
+        with self.lock:
+            return self.in_flight < self.processes and self.waiting is None
+
+    def submit(self, slot, timestamp):
+        self.ring.retain(slot)
+        with self.lock:
+            if self.in_flight < self.processes:
+                self.in_flight += 1
+                self.tasks.put((slot, timestamp))
+                return
+            if self.waiting is not None:
+                self.dropped += 1
+                self.ring.release(self.waiting[0])
+            self.waiting = (slot, timestamp)
+
+    def collect_step(self):
+        try:
+            result = self.results.get(timeout=0.1)
+        except queue.Empty:
+            return
+        slot, timestamp = result[:2]
+        if slot is None:
+            # A worker could not load the model
+            self.error = result[2]
+            return
+        self.ring.release(slot)
+        with self.lock:
+            self.in_flight -= 1
+            if self.waiting is not None:
+                self.in_flight += 1
+                self.tasks.put(self.waiting)
+                self.waiting = None
+        if isinstance(result[2], str):
+            self.error = result[2]
+            return
+
+        # Workers finish out of order; an older frame's boxes would move the tracker back
+        if timestamp < self.latest:
+            self.stale += 1
+            return
+        self.latest = timestamp
+        self.completed += 1
+        (boxes, scores, class_ids, class_names), inference_ms = result[2:]
+        self.on_result(
+            make_predictions(boxes, scores, class_ids, class_names), timestamp, inference_ms
+        )
+
+    def stop(self):
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join(timeout=2)
+            if worker.is_alive():
+                worker.terminate()
+        self.collector.stop()
+        self.collector.join(timeout=1)
+
+    def stats(self):
+        return {
+            "processes": self.processes,
+            "alive": sum(worker.is_alive() for worker in self.workers),
+            "completed": self.completed,
+            "dropped": self.dropped,
+            "stale": self.stale,
+            "ring_mb": round(self.ring.nbytes / 2**20, 1),
+            "ring_dropped": self.ring.dropped,
+            "ring_full": self.ring.full,
+        }
+
+
+def ring_slots(processes, ready=2):
+    # Enough slots that capture never waits on a healthy pipeline: one being
+    # written, the published ones, one being displayed, one in flight per worker
+    # and one waiting for a worker
+    return 1 + ready + 1 + processes + 1
@@ -0,0 +1,224 @@
+import os
+import re
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw
+
+PREVIEW_SIZE = (400, 300)
+PREVIEW_LEVELS = int(os.getenv("PREVIEW_LEVELS", "4"))
+
+# Headerless line-scan dumps; the size comes from a "_<width>x<height>" suffix in
+# the name or RAW_IMAGE_WIDTH, with RAW_IMAGE_CHANNELS bytes per pixel
+RAW_EXTENSIONS = (".raw", ".bin")
+JPEG_EXTENSIONS = (".jpg", ".jpeg")
+REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def is_raw(path):
+    return path.lower().endswith(RAW_EXTENSIONS)
+
+
+def raw_shape(path):
+    channels = int(os.getenv("RAW_IMAGE_CHANNELS", "1"))
+    match = re.search(r"_(\d+)x(\d+)\.[^.]+$", os.path.basename(path))
+    if match:
+        width = int(match.group(1))
+    elif os.getenv("RAW_IMAGE_WIDTH"):
+        width = int(os.getenv("RAW_IMAGE_WIDTH"))
+    else:
+        raise ValueError(f"{path}: raw image width unknown, set RAW_IMAGE_WIDTH")
+    height = os.path.getsize(path) // (width * channels)
+    return (height, width, channels) if channels > 1 else (height, width)
+
+
+def map_raw(path):
+    # Copy-on-write mapping: pages are read on demand and drawing never touches the file
+    return np.memmap(path, dtype=np.uint8, mode="c", shape=raw_shape(path))
+
+
+def load_image(path):
+    # Full-resolution frame; raw dumps are memory-mapped instead of read into a
+    # buffer, and mono ones stay single-channel (to_bgr() where colour is drawn)
+    if not is_raw(path):
+        return cv2.imread(path)
+    return map_raw(path)
+
+
+def to_bgr(frame):
+    # Colour copy of a mono frame for drawing; BGR frames are returned as they are
+    if frame.ndim == 2:
+        return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+    return frame
+
+
+def decode_image(path, data):
+    # Same as load_image for a file whose bytes were already read (e.g. for hashing)
+    if is_raw(path):
+        return load_image(path)
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def preview_scale(shape, size=PREVIEW_SIZE):
+    height, width = shape[:2]
+    return min(size[0] / width, size[1] / height, 1.0)
+
+
+def preview_size(shape, size=PREVIEW_SIZE):
+    # (width, height) of downscale() for a frame of this shape
+    scale = min(preview_scale(shape, size), 1.0)
+    height, width = shape[:2]
+    return max(round(width * scale), 1), max(round(height * scale), 1)
+
+
+def downscale(frame, size):
+    # INTER_AREA averages whole source pixels, the right filter for large reductions
+    if preview_scale(frame.shape, size) >= 1.0:
+        return frame
+    return cv2.resize(frame, preview_size(frame.shape, size), interpolation=cv2.INTER_AREA)
+
+
+def downscale_into(frame, preview):
+    # downscale() into a preallocated array of preview_size(), for loops that must
+    # not allocate a new preview per frame
+    height, width = preview.shape[:2]
+    if frame.shape[:2] == (height, width):
+        np.copyto(preview, frame)
+    else:
+        cv2.resize(frame, (width, height), dst=preview, interpolation=cv2.INTER_AREA)
+    return preview
+
+
+def to_pil(frame):
+    # Colour conversion on the already small image
+    if frame.ndim == 2:
+        return Image.fromarray(np.ascontiguousarray(frame))
+    return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+
+def make_preview(frame, size=PREVIEW_SIZE):
+    return to_pil(downscale(frame, size))
+
+
+def quick_preview(path, size=PREVIEW_SIZE):
+    # Preview shown before the full decode, only where reading it is cheap: JPEG
+    # decodes at 1/2, 1/4 or 1/8 scale in the DCT, raw dumps are subsampled views
+    if is_raw(path):
+        frame = map_raw(path)
+        step = max(int(1 / preview_scale(frame.shape, size)) // 2, 1)
+        return make_preview(frame[::step, ::step], size)
+    if not path.lower().endswith(JPEG_EXTENSIONS):
+        return None
+    with Image.open(path) as image:
+        width, height = image.size
+    factor = 1
+    for candidate in (2, 4, 8):
+        if width / candidate >= size[0] and height / candidate >= size[1]:
+            factor = candidate
+    if factor == 1:
+        return None
+    frame = cv2.imread(path, REDUCED_FLAGS[factor])
+    return None if frame is None else make_preview(frame, size)
+
+
+def scale_predictions(predictions, scale):
+    # Boxes in preview coordinates, for drawing after downscaling
+    return [
+        prediction._replace(
+            x=prediction.x * scale,
+            y=prediction.y * scale,
+            width=prediction.width * scale,
+            height=prediction.height * scale,
+        )
+        for prediction in predictions
+    ]
+
+
+class PreviewPyramid:
+    # A few downscaled copies of a frame, each twice the size of the previous one,
+    # so zooming into the preview never touches the full image. Annotations set
+    # with annotate() are drawn on copies of the levels in preview coordinates,
+    # so they can be redrawn without the full-resolution frame.
+
+    def __init__(self, frame, size=PREVIEW_SIZE, levels=PREVIEW_LEVELS):
+        self.size = size
+        self.frame_width = frame.shape[1]
+        self.levels = []
+        # Largest level from the frame, every smaller one from the level above it
+        for level in reversed(range(levels)):
+            source = self.levels[0] if self.levels else frame
+            scaled = downscale(source, (size[0] << level, size[1] << level))
+            if self.levels and scaled is source:
+                continue
+            # Mono frames get their colour channels here, on the small levels
+            self.levels.insert(0, to_bgr(scaled))
+        self.zoom = 0
+        self.center = (0.5, 0.5)
+        self.render = None
+        self.annotated = {}
+
+    def annotate(self, render, predictions):
+        # render(image, predictions) draws onto a level; levels are drawn when first viewed
+        self.render = render
+        self.predictions = predictions
+        self.annotated = {}
+
+    def level(self, zoom):
+        if self.render is None:
+            return self.levels[zoom]
+        if zoom not in self.annotated:
+            image = self.levels[zoom].copy()
+            scale = image.shape[1] / self.frame_width
+            self.render(image, scale_predictions(self.predictions, scale))
+            self.annotated[zoom] = image
+        return self.annotated[zoom]
+
+    def window(self):
+        # Top-left corner and size of the visible crop at the current zoom level
+        height, width = self.levels[self.zoom].shape[:2]
+        crop_width, crop_height = min(self.size[0], width), min(self.size[1], height)
+        x0 = min(max(int(self.center[0] * width) - crop_width // 2, 0), width - crop_width)
+        y0 = min(max(int(self.center[1] * height) - crop_height // 2, 0), height - crop_height)
+        return x0, y0, crop_width, crop_height
+
+    def view(self, zoom=None, center=None):
+        # zoom 0 is the whole image; higher levels crop a preview-sized window around center
+        if zoom is not None:
+            self.zoom = max(0, min(zoom, len(self.levels) - 1))
+        if center is not None:
+            self.center = center
+        x0, y0, crop_width, crop_height = self.window()
+        return to_pil(self.level(self.zoom)[y0 : y0 + crop_height, x0 : x0 + crop_width])
+
+    def highlight(self, box, color=(255, 255, 0), width=2):
+        # Current view with one full-resolution xyxy box outlined; zoomed views are
+        # centred on the box first
+        height, width_pixels = self.levels[self.zoom].shape[:2]
+        scale = width_pixels / self.frame_width
+        if self.zoom > 0:
+            self.center = (
+                (box[0] + box[2]) / 2 * scale / width_pixels,
+                (box[1] + box[3]) / 2 * scale / height,
+            )
+        image = self.view()
+        x0, y0, _, _ = self.window()
+        outline = [
+            box[0] * scale - x0 - width,
+            box[1] * scale - y0 - width,
+            box[2] * scale - x0 + width,
+            box[3] * scale - y0 + width,
+        ]
+        ImageDraw.Draw(image).rectangle(outline, outline=color, width=width)
+        return image
+
+    def zoom_at(self, step, x, y):
+        # Zoom in or out keeping the point under the cursor (x, y in displayed pixels)
+        height, width = self.levels[self.zoom].shape[:2]
+        x0, y0, crop_width, crop_height = self.window()
+        x = min(max(x, 0), crop_width)
+        y = min(max(y, 0), crop_height)
+        return self.view(self.zoom + step, ((x0 + x) / width, (y0 + y) / height))
@@ -0,0 +1,161 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+from frame_pipeline import FpsMeter
+
+# Latency buckets in seconds for the Prometheus histograms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUANTILES = (50, 95, 99)
+
+# Prometheus collectors are process-wide, so they are created once and labelled per app
+prometheus_metrics = None
+
+
+def get_prometheus_metrics():
+    global prometheus_metrics
+    if prometheus_metrics is None:
+        from prometheus_client import Gauge, Histogram
+
+        prometheus_metrics = {
+            "latency": Histogram(
+                "cr7_stage_latency_seconds",
+                "Latency of one pipeline stage",
+                ["app", "stage"],
+                buckets=LATENCY_BUCKETS,
+            ),
+            "quantile": Gauge(
+                "cr7_stage_latency_quantile_seconds",
+                "Rolling latency percentile of one pipeline stage",
+                ["app", "stage", "quantile"],
+            ),
+            "fps": Gauge("cr7_fps", "Wall-clock frames per second", ["app"]),
+        }
+    return prometheus_metrics
+
+
+class Instrumentation:
+    # Rolling per-stage latency windows with p50/p95/p99, wall-clock FPS, and
+    # optional export to Prometheus and/or a JSON-lines file
+
+    def __init__(self, app, window=1000):
+        self.app = app
+        self.window = window
+        self.samples = {}
+        self.lock = threading.Lock()
+        self.fps_meter = FpsMeter(window=2.0)
+        self.prometheus = None
+        self.jsonl_file = None
+        self.publish_thread = None
+
+    def record(self, stage, milliseconds):
+        with self.lock:
+            if stage not in self.samples:
+                self.samples[stage] = deque(maxlen=self.window)
+            self.samples[stage].append(milliseconds)
+        if self.prometheus:
+            self.prometheus["latency"].labels(self.app, stage).observe(milliseconds / 1000)
+
+    @contextmanager
+    def stage(self, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start_time) * 1000)
+
+    def record_detector(self, model):
+        # Backends that time their own sub-stages (e.g. ONNX preprocess) expose them
+        for stage, milliseconds in getattr(model, "timings", {}).items():
+            self.record(stage, milliseconds)
+
+    def frame(self):
+        # Call once per displayed frame; FPS comes from real frame intervals
+        with self.lock:
+            self.fps_meter.tick()
+
+    @property
+    def fps(self):
+        with self.lock:
+            return self.fps_meter.fps
+
+    def summary(self):
+        with self.lock:
+            samples = {stage: np.asarray(values) for stage, values in self.samples.items()}
+        stages = {}
+        for stage, values in samples.items():
+            if len(values) == 0:
+                continue
+            percentiles = np.percentile(values, QUANTILES)
+            stages[stage] = {
+                "count": int(len(values)),
+                "mean_ms": round(float(values.mean()), 3),
+                **{
+                    f"p{quantile}_ms": round(float(value), 3)
+                    for quantile, value in zip(QUANTILES, percentiles)
+                },
+            }
+        return {"app": self.app, "time": time.time(), "fps": round(self.fps, 2), "stages": stages}
+
+    def format_summary(self, stages=None):
+        summary = self.summary()["stages"]
+        return ", ".join(
+            f"{stage} p50 {values['p50_ms']:.1f} / p95 {values['p95_ms']:.1f}ms"
+            for stage, values in summary.items()
+            if stages is None or stage in stages
+        )
+
+    def publish(self):
+        # Push rolling percentiles and FPS to the enabled exporters
+        summary = self.summary()
+        if self.prometheus:
+            self.prometheus["fps"].labels(self.app).set(summary["fps"])
+            for stage, values in summary["stages"].items():
+                for quantile in QUANTILES:
+                    gauge = self.prometheus["quantile"].labels(
+                        self.app, stage, f"{quantile / 100:g}"
+                    )
+                    gauge.set(values[f"p{quantile}_ms"] / 1000)
+        if self.jsonl_file:
+            self.jsonl_file.write(json.dumps(summary) + "\n")
+            self.jsonl_file.flush()
+        return summary
+
+    def start_prometheus(self, port=None):
+        # Without a port the metrics are only registered, e.g. for an app's own /metrics
+        from prometheus_client import start_http_server
+
+        self.prometheus = get_prometheus_metrics()
+        if port:
+            start_http_server(port, addr="127.0.0.1")
+
+    def start_jsonl(self, path):
+        self.jsonl_file = open(path, "a")
+
+    def start_publishing(self, interval):
+        def publish_loop():
+            while True:
+                time.sleep(interval)
+                self.publish()
+
+        self.publish_thread = threading.Thread(target=publish_loop, daemon=True)
+        self.publish_thread.start()
+
+
+def load_instrumentation(app):
+    # Exporters are enabled through METRICS_PORT and METRICS_JSONL in .env
+    metrics = Instrumentation(app)
+    port = os.getenv("METRICS_PORT")
+    jsonl_path = os.getenv("METRICS_JSONL")
+    if port:
+        metrics.start_prometheus(int(port))
+    if jsonl_path:
+        metrics.start_jsonl(jsonl_path)
+    if port or jsonl_path:
+        metrics.start_publishing(float(os.getenv("METRICS_INTERVAL", "5")))
+    return metrics
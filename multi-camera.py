@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+import time
+import tkinter as tk
+from dotenv import load_dotenv
+from frame_pipeline import DropOldestQueue, StageThread
+from startup import BackgroundLoader, StartupTimer
+
+# Settings below come from .env; detector.py, which normally loads it, is imported later
+load_dotenv()
+
+# Cold-start milestones, shown in the window and exported as startup_* stages
+startup = StartupTimer()
+
+# Pool, mosaic and metrics are created once the model has loaded
+pool = None
+mosaic = None
+metrics = None
+display_stage = None
+ready_queue = DropOldestQueue(maxsize=1)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Run detection on several cameras, videos or image folders at once."
+    )
+    parser.add_argument(
+        "sources", nargs="+", help="camera indices (0, 1), video files, image directories or globs"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("CAMERA_WORKERS", "2")),
+        help="inference worker threads sharing the model (default 2)",
+    )
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=int(os.getenv("CAMERA_BATCH", "1")),
+        help="frames from different sources per forward pass (default 1)",
+    )
+    parser.add_argument(
+        "--weights", type=float, nargs="+", help="scheduling weight per source (default 1 each)"
+    )
+    parser.add_argument("--fps", type=float, help="playback rate of image folders (default 10)")
+    parser.add_argument("--loop", action="store_true", help="restart videos and folders at the end")
+    parser.add_argument("--tile", default="320x240", help="tile size in the mosaic (WxH)")
+    parser.add_argument(
+        "--headless", action="store_true", help="no window, print per-source stats instead"
+    )
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    args = parser.parse_args()
+    if args.weights and len(args.weights) != len(args.sources):
+        parser.error("--weights needs one value per source")
+    return args
+
+
+def load_pipeline():
+    # Runs on the loader thread (or directly when headless): heavy imports, the
+    # model, a warm-up inference and the sources, which are opened up front so a
+    # bad path fails before anything starts
+    from camera_pool import CameraPool, Mosaic, Source, open_frame_source
+    from detector import load_detector, warm_up
+    from instrumentation import load_instrumentation
+
+    startup.mark("imports")
+    # One model for every source (backend selected through DETECTOR_BACKEND)
+    loaded_model = load_detector()
+    startup.mark("model")
+    warm_up(loaded_model)
+    startup.mark("ready")
+
+    sources = []
+    for index, spec in enumerate(args.sources):
+        read, fps = open_frame_source(spec, fps=args.fps, loop=args.loop)
+        weight = args.weights[index] if args.weights else 1.0
+        sources.append(Source(spec, read, fps=fps, weight=weight))
+
+    tile_size = tuple(int(value) for value in args.tile.lower().split("x"))
+    return (
+        CameraPool(loaded_model, sources, workers=args.workers, batch_size=args.batch),
+        Mosaic(len(sources), tile_size),
+        load_instrumentation("multi-camera"),
+    )
+
+
+def start_pipeline(loaded):
+    global pool, mosaic, metrics
+    pool, mosaic, metrics = loaded
+    startup.record(metrics)
+    pool.start()
+
+
+def print_stats():
+    stats = pool.stats()
+    print(json.dumps(stats))
+    for source in stats["sources"]:
+        metrics.record("source_latency", source["latency_ms"])
+
+
+def run_headless():
+    start_pipeline(load_pipeline())
+    start_time = time.perf_counter()
+    try:
+        while not pool.finished():
+            time.sleep(1)
+            print_stats()
+            if args.duration and time.perf_counter() - start_time >= args.duration:
+                break
+    except KeyboardInterrupt:
+        pass
+    pool.stop()
+    print_stats()
+
+
+def display_step():
+    # Display thread: redraw the tiles of sources with a new result and hand the
+    # mosaic to the Tk thread
+    from image_io import to_pil
+    from renderer import render_confidence
+
+    time.sleep(1 / 30)
+    with metrics.stage("render"):
+        changed = False
+        for index, source in enumerate(pool.sources):
+            result, version = pool.latest(source)
+            changed |= mosaic.update(index, source, result, version, render_confidence)
+    if changed:
+        with metrics.stage("convert"):
+            ready_queue.put(to_pil(mosaic.canvas))
+
+
+def pipeline_ready(loaded):
+    global display_stage
+    start_pipeline(loaded)
+    display_stage = StageThread("display", display_step)
+    display_stage.start()
+    status_label.config(text=startup.format())
+    update_mosaic()
+
+
+def pipeline_failed(error):
+    status_label.config(text=f"Could not start: {error}")
+
+
+def update_mosaic():
+    # Tk main thread only blits the newest mosaic
+    from PIL import ImageTk
+
+    image = ready_queue.get_latest()
+    if image is not None:
+        with metrics.stage("display"):
+            photo = ImageTk.PhotoImage(image)
+            image_label.config(image=photo)
+            image_label.image = photo
+        metrics.frame()
+
+        if "first_result" not in startup.marks:
+            startup.mark("first_result")
+            startup.record(metrics, ["first_result"])
+
+        # Total throughput across sources; per-source rates and drops are on the tiles
+        stats = pool.stats()
+        fps_label.config(
+            text=f"Throughput: {stats['throughput_fps']:.1f} frames/s over "
+            f"{len(pool.sources)} sources, {args.workers} workers, batch {args.batch}, "
+            f"dropped {sum(source['dropped'] for source in stats['sources'])}"
+        )
+        status_label.config(text=startup.format())
+    root.after(15, update_mosaic)
+
+
+def on_close():
+    if display_stage is not None:
+        display_stage.stop()
+    ready_queue.close()
+    if pool is not None:
+        pool.stop()
+    root.destroy()
+
+
+args = parse_args()
+
+if args.headless:
+    run_headless()
+else:
+    # Create Tkinter window
+    root = tk.Tk()
+    root.title("Roboflow Multi-Camera Viewer")
+    root.protocol("WM_DELETE_WINDOW", on_close)
+    if args.duration:
+        root.after(int(args.duration * 1000), on_close)
+
+    # Mosaic display label with a grey placeholder (a plain Tk image, PIL is not loaded yet)
+    placeholder_photo = tk.PhotoImage(width=320, height=240)
+    placeholder_photo.put("grey", to=(0, 0, 320, 240))
+    image_label = tk.Label(root, image=placeholder_photo)
+    image_label.pack(padx=10, pady=10)
+
+    # Combined throughput and drop count
+    fps_label = tk.Label(root, text="Loading model…")
+    fps_label.pack(pady=5)
+
+    # Cold-start report, or the error when a source or the model fails to open
+    status_label = tk.Label(root, text="", font=("Arial", 8), wraplength=600)
+    status_label.pack(pady=5)
+
+    # Load the model and open the sources in the background; the window appears right away
+    root.after_idle(startup.mark, "window")
+    loader = BackgroundLoader(root, load_pipeline, pipeline_ready, pipeline_failed)
+
+    # Run the Tkinter main loop
+    root.mainloop()
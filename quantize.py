@@ -0,0 +1,326 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from boxes import iou_matrix
+from detector import ONNX_PRECISIONS, OnnxDetector, predictions_to_arrays, variant_path
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+CALIBRATION_DIR = "rolled_data"
+
+
+def collect_images(directory, limit):
+    # Evenly spaced sample of the images under directory, so calibration and
+    # comparison see every defect class rather than the first few files
+    paths = sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(directory)
+        for name in names
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        raise ValueError(f"no images under {directory}")
+    if limit and len(paths) > limit:
+        paths = [paths[index] for index in np.linspace(0, len(paths) - 1, limit).astype(int)]
+    return paths
+
+
+class CalibrationReader:
+    # Feeds calibration images to the ONNX Runtime calibrator one at a time,
+    # letterboxed exactly like OnnxDetector does at inference time
+
+    def __init__(self, detector, paths):
+        self.detector = detector
+        self.paths = paths
+        self.position = 0
+
+    def get_next(self):
+        if self.position == len(self.paths):
+            return None
+        tensor, _, _ = self.detector.preprocess(cv2.imread(self.paths[self.position]))
+        self.position += 1
+        return {self.detector.input_name: tensor}
+
+    def rewind(self):
+        self.position = 0
+
+
+def copy_metadata(source_path, output_path):
+    # Class names live in the export metadata; keep them on the quantized model
+    import onnx
+
+    source = onnx.load(source_path, load_external_data=False)
+    output = onnx.load(output_path)
+    present = {prop.key for prop in output.metadata_props}
+    for prop in source.metadata_props:
+        if prop.key not in present:
+            output.metadata_props.add(key=prop.key, value=prop.value)
+    onnx.save(output, output_path)
+
+
+def build_int8(
+    model_path,
+    output_path,
+    calibration_paths,
+    method="minmax",
+    per_channel=True,
+    exclude_nodes=None,
+):
+    # Static QDQ quantization: int8 weights (per channel) and uint8 activations
+    # with ranges calibrated on real strip images
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    detector = OnnxDetector(model_path)
+    methods = {
+        "minmax": CalibrationMethod.MinMax,
+        "entropy": CalibrationMethod.Entropy,
+        "percentile": CalibrationMethod.Percentile,
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        prepared_path = os.path.join(directory, "prepared.onnx")
+        quant_pre_process(model_path, prepared_path)
+        quantize_static(
+            prepared_path,
+            output_path,
+            CalibrationReader(detector, calibration_paths),
+            quant_format=QuantFormat.QDQ,
+            per_channel=per_channel,
+            weight_type=QuantType.QInt8,
+            activation_type=QuantType.QUInt8,
+            calibrate_method=methods[method],
+            nodes_to_exclude=exclude_nodes or [],
+        )
+    copy_metadata(model_path, output_path)
+
+
+def build_fp16(model_path, output_path):
+    # Weights and activations in half precision; inputs and outputs stay float32
+    import onnx
+    from onnxruntime.transformers.float16 import convert_float_to_float16
+
+    model = onnx.load(model_path)
+    onnx.save(convert_float_to_float16(model, keep_io_types=True), output_path)
+
+
+def profile_variant(model_path, image_paths, warmup, confidence, iou_threshold):
+    # Runs in a fresh process per variant so the memory numbers are its own
+    from benchmark import PeakRssSampler
+
+    memory = PeakRssSampler()
+    baseline_rss = memory.rss()
+    start_time = time.perf_counter()
+    detector = OnnxDetector(model_path)
+    load_ms = (time.perf_counter() - start_time) * 1000
+    loaded_rss = memory.rss()
+
+    frames = [cv2.imread(path) for path in image_paths]
+    for frame in frames[:warmup]:
+        detector.infer(frame, confidence, iou_threshold)
+
+    latencies, predictions = [], []
+    with memory:
+        for frame in frames:
+            start_time = time.perf_counter()
+            predictions.append(detector.infer(frame, confidence, iou_threshold)[0].predictions)
+            latencies.append((time.perf_counter() - start_time) * 1000)
+
+    return {
+        "model": model_path,
+        "file_mb": round(os.path.getsize(model_path) / 2**20, 2),
+        "load_ms": round(load_ms, 1),
+        "model_rss_mb": round((loaded_rss - baseline_rss) / 2**20, 1),
+        "peak_rss_mb": round(memory.peak / 2**20, 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "images_per_s": round(len(latencies) / (sum(latencies) / 1000), 2),
+        "predictions": predictions,
+    }
+
+
+def agreement(references, candidates, iou_threshold=0.5):
+    # How closely a variant reproduces the reference detections: boxes of the same
+    # class matched greedily by score at IoU >= iou_threshold
+    matched = reference_count = candidate_count = 0
+    ious, score_deltas = [], []
+    for reference, candidate in zip(references, candidates):
+        reference_boxes, reference_scores, reference_ids, reference_names = predictions_to_arrays(
+            reference
+        )
+        boxes, scores, class_ids, class_names = predictions_to_arrays(candidate)
+        reference_count += len(reference_boxes)
+        candidate_count += len(boxes)
+        if not len(reference_boxes) or not len(boxes):
+            continue
+
+        same_class = (
+            np.asarray(class_names)[class_ids][:, None]
+            == np.asarray(reference_names)[reference_ids]
+        )
+        overlaps = np.where(same_class, iou_matrix(boxes, reference_boxes), 0)
+        available = np.ones(len(reference_boxes), dtype=bool)
+        for row in np.argsort(-scores, kind="stable"):
+            candidates_iou = np.where(available, overlaps[row], 0)
+            column = int(candidates_iou.argmax())
+            if candidates_iou[column] >= iou_threshold:
+                available[column] = False
+                matched += 1
+                ious.append(candidates_iou[column])
+                score_deltas.append(abs(scores[row] - reference_scores[column]))
+
+    precision = matched / candidate_count if candidate_count else 1.0
+    recall = matched / reference_count if reference_count else 1.0
+    return {
+        "precision": round(precision, 4),
+        "recall": round(recall, 4),
+        "f1": round(2 * precision * recall / (precision + recall), 4)
+        if precision + recall
+        else 0.0,
+        "mean_iou": round(float(np.mean(ious)), 4) if ious else 0.0,
+        "mean_score_delta": round(float(np.mean(score_deltas)), 4) if score_deltas else 0.0,
+    }
+
+
+def build(args):
+    output_path = args.output or variant_path(args.model, args.precision)
+    start_time = time.perf_counter()
+    if args.precision == "int8":
+        paths = collect_images(args.calibration, args.calibration_images)
+        print(f"Calibrating on {len(paths)} images from {args.calibration}")
+        build_int8(
+            args.model,
+            output_path,
+            paths,
+            method=args.method,
+            per_channel=not args.per_tensor,
+            exclude_nodes=args.exclude_nodes,
+        )
+    else:
+        build_fp16(args.model, output_path)
+    print(
+        f"Wrote {output_path} ({os.path.getsize(output_path) / 2**20:.1f}MB, "
+        f"fp32 {os.path.getsize(args.model) / 2**20:.1f}MB) "
+        f"in {time.perf_counter() - start_time:.0f}s"
+    )
+    return 0
+
+
+def compare(args):
+    paths = collect_images(args.images, args.limit)
+    variants = {}
+    for precision in args.precisions:
+        model_path = variant_path(args.model, precision)
+        if not os.path.isfile(model_path):
+            print(f"Skipping {precision}: {model_path} not found")
+            continue
+        # One variant at a time, each in its own process, so they neither share
+        # memory nor compete for cores
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            variants[precision] = pool.submit(
+                profile_variant, model_path, paths, args.warmup, args.confidence, args.iou_threshold
+            ).result()
+
+    if "fp32" not in variants:
+        raise ValueError(f"{args.model} is needed as the reference")
+    reference = variants["fp32"]
+    for result in variants.values():
+        result.update(agreement(reference["predictions"], result["predictions"]))
+
+    rows = [
+        ("file MB", "file_mb"),
+        ("model RSS MB", "model_rss_mb"),
+        ("peak RSS MB", "peak_rss_mb"),
+        ("load ms", "load_ms"),
+        ("latency p50 ms", "p50_ms"),
+        ("latency p95 ms", "p95_ms"),
+        ("images/s", "images_per_s"),
+        ("F1 vs fp32", "f1"),
+        ("recall vs fp32", "recall"),
+        ("mean IoU vs fp32", "mean_iou"),
+        ("mean |score delta|", "mean_score_delta"),
+    ]
+    print(f"{len(paths)} images from {args.images}")
+    print(f"{'':20s}" + "".join(f"{precision:>22s}" for precision in variants))
+    for name, key in rows:
+        cells = []
+        for result in variants.values():
+            value, old = result[key], reference[key]
+            change = ""
+            if old and result is not reference:
+                change = f" ({(value - old) / old * 100:+.0f}%)"
+            cells.append(f"{value:.2f}{change}".rjust(22))
+        print(f"{name:20s}" + "".join(cells))
+
+    if args.output:
+        report = {
+            "images": len(paths),
+            "variants": {
+                precision: {key: value for key, value in result.items() if key != "predictions"}
+                for precision, result in variants.items()
+            },
+        }
+        with open(args.output, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f"Report written to {args.output}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build fp16 / int8 variants of the ONNX defect model and compare them."
+    )
+    parser.add_argument(
+        "--model",
+        default=os.getenv("ONNX_MODEL_PATH"),
+        help="fp32 export (default ONNX_MODEL_PATH)",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="write a quantized variant")
+    build_parser.add_argument("--precision", choices=ONNX_PRECISIONS[1:], default="int8")
+    build_parser.add_argument("--output", help="default: <model>.<precision>.onnx")
+    build_parser.add_argument(
+        "--calibration", default=CALIBRATION_DIR, help="calibration image folder"
+    )
+    build_parser.add_argument("--calibration-images", type=int, default=200)
+    build_parser.add_argument(
+        "--method", choices=("minmax", "entropy", "percentile"), default="minmax"
+    )
+    build_parser.add_argument(
+        "--per-tensor",
+        action="store_true",
+        help="one weight scale per tensor instead of per channel",
+    )
+    build_parser.add_argument(
+        "--exclude-nodes", nargs="*", help="node names kept in float, e.g. the detection head"
+    )
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="latency, memory and accuracy side by side"
+    )
+    compare_parser.add_argument("--images", default=CALIBRATION_DIR)
+    compare_parser.add_argument("--limit", type=int, default=100)
+    compare_parser.add_argument(
+        "--precisions", nargs="+", choices=ONNX_PRECISIONS, default=list(ONNX_PRECISIONS)
+    )
+    compare_parser.add_argument("--warmup", type=int, default=3)
+    compare_parser.add_argument("--confidence", type=float, default=0.5)
+    compare_parser.add_argument("--iou-threshold", type=float, default=0.5)
+    compare_parser.add_argument("--output", help="also write the comparison as JSON")
+
+    args = parser.parse_args()
+    if not args.model:
+        parser.error("--model or ONNX_MODEL_PATH is required")
+    return build(args) if args.command == "build" else compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+def prediction_array(predictions):
+    # Box corners (N, 4) as int32 computed the way the scripts always have:
+    # from the integer center and half of the integer width/height
+    centers = np.array(
+        [(p.x, p.y, p.width, p.height) for p in predictions], dtype=np.float64
+    ).reshape(-1, 4)
+    centers = centers.astype(np.int32)
+    half = centers[:, 2:4] // 2
+    corners = np.concatenate([centers[:, :2] - half, centers[:, :2] + half], axis=1)
+    confidences = np.array([p.confidence for p in predictions], dtype=np.float32)
+    class_names = [p.class_name for p in predictions]
+    return corners, confidences, class_names
+
+
+def label_brightness(frame, corners, band=20):
+    # Mean grey level of the band just above each box, for every box at once.
+    # One integral image replaces a cv2.mean call per box.
+    height, width = frame.shape[:2]
+    if len(corners) == 0:
+        return np.empty(0, dtype=np.float64)
+
+    # Only the rows the bands can touch are integrated
+    row_start = max(int(corners[:, 1].min()) - band, 0)
+    row_end = min(max(int(corners[:, 1].max()), 0), height)
+    if row_end <= row_start:
+        return np.zeros(len(corners), dtype=np.float64)
+
+    region = frame[row_start:row_end]
+    if region.ndim == 2:
+        region = region[:, :, None]
+    region = np.ascontiguousarray(region[:, :, :3])  # Ignore alpha channel if present
+    channels = region.shape[2]
+
+    # 32-bit sums are much faster and cannot overflow below ~8M pixels
+    depth = cv2.CV_32S if region.shape[0] * region.shape[1] < 8_000_000 else cv2.CV_64F
+    integral = cv2.integral(region, sdepth=depth).reshape(
+        row_end - row_start + 1, width + 1, channels
+    )
+
+    y_start = np.clip(corners[:, 1] - band, 0, height) - row_start
+    y_end = np.clip(corners[:, 1], 0, height) - row_start
+    x_start = np.clip(corners[:, 0], 0, width)
+    x_end = np.clip(corners[:, 2], 0, width)
+    y_start = np.clip(y_start, 0, row_end - row_start)
+    y_end = np.clip(y_end, y_start, row_end - row_start)
+    x_end = np.maximum(x_end, x_start)
+
+    totals = (
+        integral[y_end, x_end].astype(np.float64)
+        - integral[y_start, x_end]
+        - integral[y_end, x_start]
+        + integral[y_start, x_start]
+    ).sum(axis=1)
+    area = (y_end - y_start) * (x_end - x_start) * channels
+    # Empty bands count as dark, matching cv2.mean on an empty slice
+    return np.divide(totals, area, out=np.zeros(len(corners)), where=area > 0)
+
+
+def draw_boxes(frame, corners, colors, thickness):
+    # One polylines call per colour instead of one rectangle call per box
+    colors = np.asarray(colors, dtype=np.int32).reshape(-1, 3)
+    polygons = corners[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+    for color in np.unique(colors, axis=0):
+        mask = np.all(colors == color, axis=1)
+        cv2.polylines(
+            frame, list(polygons[mask]), True, tuple(int(c) for c in color), thickness
+        )
+
+
+def draw_labels(frame, texts, origins, colors, font_scale, thickness):
+    for text, origin, color in zip(texts, origins.tolist(), np.asarray(colors).tolist()):
+        cv2.putText(frame, text, tuple(origin), FONT, font_scale, tuple(color), thickness)
+
+
+def render_confidence(frame, predictions):
+    # steel-image style: "class 97.5%" above each box, colour picked from the
+    # brightness behind the label so it stays readable
+    corners, confidences, class_names = prediction_array(predictions)
+    if len(corners) == 0:
+        return []
+
+    dark = label_brightness(frame, corners) < 128
+    colors = np.where(dark[:, None], (255, 255, 0), (100, 100, 0))
+    texts = [
+        f"{name} {confidence * 100:.1f}%"
+        for name, confidence in zip(class_names, confidences.tolist())
+    ]
+    text_y = np.where(corners[:, 1] - 10 > 0, corners[:, 1] - 10, corners[:, 3] + 20)
+    origins = np.stack([corners[:, 0], text_y], axis=1)
+
+    draw_boxes(frame, corners, colors, 1)
+    draw_labels(frame, texts, origins, colors, 0.4, 1)
+    return [
+        f"{name}: {confidence * 100:.1f}%"
+        for name, confidence in zip(class_names, confidences.tolist())
+    ]
+
+
+def render_ids(frame, predictions, color=(238, 0, 0), texts=None):
+    # steel-image-detail style: numbered boxes whose IDs match the defect table
+    corners, _, _ = prediction_array(predictions)
+    if len(corners) == 0:
+        return
+    if texts is None:
+        texts = [str(idx) for idx in range(1, len(corners) + 1)]
+    colors = np.tile(color, (len(corners), 1))
+    text_y = np.where(corners[:, 1] - 5 > 0, corners[:, 1] - 5, corners[:, 3] + 5)
+    origins = np.stack([corners[:, 0], text_y], axis=1)
+
+    draw_boxes(frame, corners, colors, 1)
+    draw_labels(frame, texts, origins, colors, 0.4, 1)
+
+
+def render_faces(frame, predictions, thickness=2, font_scale=0.6, texts=None):
+    # Face scripts: cyan box with a white "Face" label
+    corners, _, _ = prediction_array(predictions)
+    if len(corners) == 0:
+        return
+    if texts is None:
+        texts = ["Face"] * len(corners)
+    origins = np.stack([corners[:, 0], corners[:, 1] - 10], axis=1)
+
+    draw_boxes(frame, corners, np.tile((255, 255, 0), (len(corners), 1)), thickness)
+    draw_labels(
+        frame,
+        texts,
+        origins,
+        np.tile((255, 255, 255), (len(corners), 1)),
+        font_scale,
+        2,
+    )
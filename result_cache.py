@@ -0,0 +1,202 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from detector import Prediction
+
+ENABLED = os.getenv("RESULT_CACHE", "1") == "1"
+CACHE_PATH = os.getenv("RESULT_CACHE_PATH", os.path.join(".cache", "results.sqlite"))
+MEMORY_MB = float(os.getenv("RESULT_CACHE_MEMORY_MB", "64"))
+
+
+def cache_key(image_bytes, model_id, confidence, iou_threshold, variant=""):
+    # Content address: the same file bytes with the same model and thresholds hit.
+    # Any contiguous buffer works, so memory-mapped raw frames are hashed in place.
+    digest = hashlib.sha256(image_bytes)
+    digest.update(f"|{model_id}|{confidence:.4f}|{iou_threshold:.4f}|{variant}".encode())
+    return digest.hexdigest()
+
+
+def model_family(model_id):
+    # Model ids without their version: "project/3" -> "project", and an ONNX file
+    # id without its size and mtime. Other ids are their own family.
+    if model_id.startswith("onnx:"):
+        return model_id.rsplit(":", 2)[0]
+    if "/" in model_id:
+        return model_id.rsplit("/", 1)[0]
+    return model_id
+
+
+def encode_predictions(predictions, inference_ms):
+    rows = [
+        [
+            float(p.x),
+            float(p.y),
+            float(p.width),
+            float(p.height),
+            p.class_name,
+            float(p.confidence),
+            int(getattr(p, "class_id", 0)),
+        ]
+        for p in predictions
+    ]
+    return json.dumps({"inference_ms": inference_ms, "predictions": rows}).encode()
+
+
+def decode_predictions(data):
+    entry = json.loads(data)
+    return [Prediction(*row) for row in entry["predictions"]], entry["inference_ms"]
+
+
+class ResultCache:
+    # Two tiers: an in-memory LRU bounded by encoded size, backed by SQLite so
+    # results survive restarts
+
+    def __init__(self, path=CACHE_PATH, memory_bytes=int(MEMORY_MB * 2**20)):
+        self.path = path
+        self.memory_bytes = memory_bytes
+        self.memory = OrderedDict()
+        self.memory_used = 0
+        self.lock = threading.Lock()
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, model_id TEXT NOT NULL, created REAL NOT NULL, data BLOB NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS results_model_id ON results (model_id)"
+        )
+        self.connection.commit()
+
+    def remember(self, key, data):
+        # Insert into the memory tier, evicting least recently used entries by size
+        if len(data) > self.memory_bytes:
+            return
+        if key in self.memory:
+            self.memory_used -= len(self.memory.pop(key))
+        self.memory[key] = data
+        self.memory_used += len(data)
+        while self.memory_used > self.memory_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_used -= len(evicted)
+
+    def get(self, key):
+        # Returns (predictions, original inference ms, tier) or None on a miss
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                self.hits["memory"] += 1
+                return (*decode_predictions(data), "memory")
+
+            row = self.connection.execute(
+                "SELECT data FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.remember(key, row[0])
+            self.hits["disk"] += 1
+            return (*decode_predictions(row[0]), "disk")
+
+    def put(self, key, model_id, predictions, inference_ms):
+        data = encode_predictions(predictions, inference_ms)
+        with self.lock:
+            self.remember(key, data)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results (key, model_id, created, data) VALUES (?, ?, ?, ?)",
+                (key, model_id, time.time(), data),
+            )
+            self.connection.commit()
+
+    def invalidate(self, keep_model_id=None):
+        # Drop everything, or only entries produced by other model versions
+        with self.lock:
+            self.memory.clear()
+            self.memory_used = 0
+            if keep_model_id is None:
+                cursor = self.connection.execute("DELETE FROM results")
+            else:
+                cursor = self.connection.execute(
+                    "DELETE FROM results WHERE model_id != ?", (keep_model_id,)
+                )
+            self.connection.commit()
+            return cursor.rowcount
+
+    def purge_superseded(self, model_id):
+        # Drop entries of older versions of this model only; other backends and
+        # models sharing the cache file keep theirs
+        family = model_family(model_id)
+        with self.lock:
+            superseded = [
+                (other,)
+                for (other,) in self.connection.execute("SELECT DISTINCT model_id FROM results")
+                if other != model_id and model_family(other) == family
+            ]
+            if not superseded:
+                return 0
+            self.memory.clear()
+            self.memory_used = 0
+            cursor = self.connection.executemany(
+                "DELETE FROM results WHERE model_id = ?", superseded
+            )
+            self.connection.commit()
+            return cursor.rowcount
+
+    def stats(self):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT model_id, COUNT(*), SUM(LENGTH(data)) FROM results GROUP BY model_id"
+            ).fetchall()
+            return {
+                "memory_entries": len(self.memory),
+                "memory_bytes": self.memory_used,
+                "hits": dict(self.hits),
+                "misses": self.misses,
+                "disk": {model_id: {"entries": count, "bytes": size} for model_id, count, size in rows},
+            }
+
+    def close(self):
+        self.connection.close()
+
+
+def load_result_cache(model):
+    # Results of superseded versions of this model can never hit again, so they are
+    # purged on start; `result_cache.py clear` removes the rest
+    if not ENABLED:
+        return None
+    cache = ResultCache()
+    cache.purge_superseded(getattr(model, "model_id", None) or "")
+    return cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the detection result cache.")
+    parser.add_argument("command", choices=("stats", "clear"))
+    parser.add_argument("--path", default=CACHE_PATH)
+    parser.add_argument("--keep-model", help="with clear: keep entries of this model id")
+    args = parser.parse_args()
+
+    cache = ResultCache(args.path)
+    if args.command == "stats":
+        print(json.dumps(cache.stats()["disk"], indent=2))
+    else:
+        print(f"Removed {cache.invalidate(args.keep_model)} cached results")
+    cache.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List
+
+import cv2
+import numpy as np
+from fastapi import FastAPI, File, HTTPException, Query, UploadFile
+from fastapi.responses import Response
+
+from instrumentation import load_instrumentation
+from steel_pipeline import CONFIDENCE, IOU_THRESHOLD, load_model, prediction_to_record
+
+# Micro-batching and backpressure settings
+MAX_BATCH_SIZE = int(os.getenv("SERVER_MAX_BATCH", "8"))
+MAX_WAIT_MS = float(os.getenv("SERVER_MAX_WAIT_MS", "10"))
+QUEUE_SIZE = int(os.getenv("SERVER_QUEUE_SIZE", "64"))
+
+
+class MicroBatcher:
+    # Collects concurrent requests into batches of up to max_batch_size images,
+    # waiting at most max_wait_ms after the first one, and runs each batch as
+    # one detector call on a dedicated inference thread
+
+    def __init__(self, model, metrics, max_batch_size, max_wait_ms, queue_size):
+        self.model = model
+        self.metrics = metrics
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self.task = None
+        self.batches = 0
+        self.images = 0
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        self.task.cancel()
+        self.executor.shutdown(wait=False)
+
+    def submit(self, frame, confidence, iou_threshold):
+        # Raises asyncio.QueueFull when the service is saturated
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((frame, confidence, iou_threshold, future, time.perf_counter()))
+        return future
+
+    async def collect(self):
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def infer_batch(self, batch):
+        # Requests with the same thresholds share one detector call
+        groups = {}
+        for index, (_, confidence, iou_threshold, _, _) in enumerate(batch):
+            groups.setdefault((confidence, iou_threshold), []).append(index)
+
+        outputs = [None] * len(batch)
+        for (confidence, iou_threshold), indices in groups.items():
+            results = self.model.infer(
+                image=[batch[index][0] for index in indices],
+                confidence=confidence,
+                iou_threshold=iou_threshold,
+            )
+            for index, result in zip(indices, results):
+                outputs[index] = result.predictions
+        return outputs
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.collect()
+            start_time = time.perf_counter()
+            try:
+                outputs = await loop.run_in_executor(self.executor, self.infer_batch, batch)
+            except Exception as error:
+                for *_, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+
+            inference_time = (time.perf_counter() - start_time) * 1000
+            self.metrics.record("batch_inference", inference_time)
+            self.batches += 1
+            self.images += len(batch)
+            for (*_, future, queued_at), predictions in zip(batch, outputs):
+                self.metrics.record("queue_wait", (start_time - queued_at) * 1000)
+                if not future.done():
+                    future.set_result((predictions, inference_time, len(batch)))
+
+
+model = None
+metrics = None
+batcher = None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Model, metrics and batcher live as long as the service
+    global model, metrics, batcher
+    model = load_model()
+    metrics = load_instrumentation("server")
+    metrics.start_prometheus()
+    batcher = MicroBatcher(model, metrics, MAX_BATCH_SIZE, MAX_WAIT_MS, QUEUE_SIZE)
+    batcher.start()
+    yield
+    await batcher.stop()
+
+
+app = FastAPI(title="CR7-DET steel defect detection service", lifespan=lifespan)
+
+
+def decode_image(data):
+    frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError("could not decode image")
+    return frame
+
+
+def queue_full():
+    # Backpressure: clients should retry later instead of piling up latency
+    return HTTPException(
+        status_code=429, detail="Inference queue is full", headers={"Retry-After": "1"}
+    )
+
+
+async def detect_upload(upload, confidence, iou_threshold):
+    start_time = time.perf_counter()
+    # Reject before reading and decoding, so a saturated service does no work for
+    # requests it turns away; the QueueFull below still guards the race
+    if batcher.queue.full():
+        raise queue_full()
+    data = await upload.read()
+    try:
+        # Default executor; asyncio.to_thread needs Python 3.9
+        frame = await asyncio.get_running_loop().run_in_executor(None, decode_image, data)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{upload.filename}: could not decode image")
+
+    try:
+        future = batcher.submit(frame, confidence, iou_threshold)
+    except asyncio.QueueFull:
+        raise queue_full()
+
+    predictions, inference_time, batch_size = await future
+    total_time = (time.perf_counter() - start_time) * 1000
+    metrics.record("request", total_time)
+    metrics.frame()
+    return {
+        "image": upload.filename,
+        "width": frame.shape[1],
+        "height": frame.shape[0],
+        "predictions": [prediction_to_record(p) for p in predictions],
+        "batch_size": batch_size,
+        "inference_ms": round(inference_time, 2),
+        "total_ms": round(total_time, 2),
+    }
+
+
+@app.post("/detect")
+async def detect(
+    file: UploadFile = File(...),
+    confidence: float = Query(CONFIDENCE, ge=0.0, le=1.0),
+    iou_threshold: float = Query(IOU_THRESHOLD, ge=0.0, le=1.0),
+):
+    return await detect_upload(file, confidence, iou_threshold)
+
+
+@app.post("/detect/batch")
+async def detect_batch(
+    files: List[UploadFile] = File(...),
+    confidence: float = Query(CONFIDENCE, ge=0.0, le=1.0),
+    iou_threshold: float = Query(IOU_THRESHOLD, ge=0.0, le=1.0),
+):
+    # Images of one request join the same micro-batches as concurrent single requests;
+    # a file that fails gets an error entry instead of failing the whole request
+    if len(files) > batcher.queue.maxsize - batcher.queue.qsize():
+        raise queue_full()
+    outcomes = await asyncio.gather(
+        *(detect_upload(upload, confidence, iou_threshold) for upload in files),
+        return_exceptions=True,
+    )
+    results = []
+    for upload, outcome in zip(files, outcomes):
+        if isinstance(outcome, HTTPException):
+            status, error = outcome.status_code, outcome.detail
+        elif isinstance(outcome, Exception):
+            status, error = 500, f"{upload.filename}: {outcome}"
+        else:
+            results.append(outcome)
+            continue
+        results.append({"image": upload.filename, "status": status, "error": error})
+    return {"results": results}
+
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "model_id": getattr(model, "model_id", None),
+        "queue_depth": batcher.queue.qsize(),
+        "queue_size": batcher.queue.maxsize,
+        "max_batch_size": batcher.max_batch_size,
+        "max_wait_ms": batcher.max_wait * 1000,
+        "batches": batcher.batches,
+        "images": batcher.images,
+        "average_batch_size": round(batcher.images / batcher.batches, 2)
+        if batcher.batches
+        else 0.0,
+        "fps": round(metrics.fps, 2),
+        "stages": metrics.summary()["stages"],
+    }
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+    metrics.publish()
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        app,
+        host=os.getenv("SERVER_HOST", "127.0.0.1"),
+        port=int(os.getenv("SERVER_PORT", "8000")),
+    )
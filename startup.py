@@ -0,0 +1,82 @@
+import sys
+import threading
+import time
+import traceback
+
+# Imported first by the GUI scripts, so this stands in for the process start
+# when psutil is not installed
+IMPORT_TIME = time.time()
+
+
+def process_start_time():
+    # Wall-clock time the interpreter started, which includes Python's own startup
+    try:
+        import psutil
+
+        return psutil.Process().create_time()
+    except ImportError:
+        return IMPORT_TIME
+
+
+class StartupTimer:
+    # Milestones in seconds since process start: "window" (Tk window shown),
+    # "imports" (heavy modules loaded), "model", "ready" (warmed up) and "first_result"
+
+    def __init__(self):
+        self.marks = {}
+        self.start = None
+
+    def mark(self, name):
+        # Only the first occurrence of a milestone counts
+        if name not in self.marks:
+            self.marks[name] = time.time()
+
+    def elapsed(self, name):
+        if self.start is None:
+            self.start = process_start_time()
+        return self.marks[name] - self.start
+
+    def record(self, metrics, names=None):
+        # Milestones as stages, e.g. startup_ready, in milliseconds since process start
+        for name in names or list(self.marks):
+            metrics.record(f"startup_{name}", self.elapsed(name) * 1000)
+
+    def format(self):
+        parts = [
+            f"{name.replace('_', ' ')} {self.elapsed(name):.1f}s"
+            for name in ("window", "imports", "model", "ready", "first_result")
+            if name in self.marks
+        ]
+        return "Startup: " + ", ".join(parts)
+
+
+class BackgroundLoader:
+    # Runs load() on a daemon thread while the Tk window is already up. The Tk
+    # thread polls and calls on_ready(result), or on_error(error), once it finishes.
+
+    def __init__(self, root, load, on_ready, on_error=None, interval=50):
+        self.root = root
+        self.on_ready = on_ready
+        self.on_error = on_error
+        self.interval = interval
+        self.result = None
+        self.error = None
+        self.thread = threading.Thread(target=self.run, args=(load,), name="loader", daemon=True)
+        self.thread.start()
+        root.after(interval, self.poll)
+
+    def run(self, load):
+        try:
+            self.result = load()
+        except Exception as error:
+            traceback.print_exc(file=sys.stderr)
+            self.error = error
+
+    def poll(self):
+        if self.thread.is_alive():
+            self.root.after(self.interval, self.poll)
+        elif self.error is not None:
+            if self.on_error:
+                self.on_error(self.error)
+        else:
+            self.on_ready(self.result)
@@ -0,0 +1,243 @@
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff")
+
+CSV_FIELDS = [
+    "image",
+    "class",
+    "confidence",
+    "x",
+    "y",
+    "width",
+    "height",
+    "inference_ms",
+    "total_ms",
+]
+
+# Per-process state, filled in by init_worker()
+model = None
+annotated_dir = None
+input_root = None
+strip_cropper = None
+
+
+def collect_images(inputs, recursive):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, "**", "*") if recursive else os.path.join(item, "*")
+            candidates = glob.glob(pattern, recursive=recursive)
+        else:
+            candidates = glob.glob(item, recursive=recursive)
+        paths.extend(
+            path
+            for path in candidates
+            if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS)
+        )
+    # Keep the order stable and drop duplicates from overlapping inputs
+    return sorted(set(paths))
+
+
+def common_root(paths):
+    # Deepest directory holding every input, so annotated images can mirror the
+    # input tree below it and same-named files in different folders never collide
+    return os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+
+
+def init_worker(output_dir, root):
+    global model, annotated_dir, input_root, strip_cropper
+
+    # One inference thread per process; the pool provides the parallelism
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    import cv2
+
+    cv2.setNumThreads(1)
+
+    from steel_pipeline import load_model
+    from strip_crop import make_cropper
+
+    model = load_model()
+    annotated_dir = output_dir
+    input_root = root
+    strip_cropper = make_cropper()
+
+
+def process_image(file_path):
+    # A failure is returned as an error record, so one bad image never stops the run
+    try:
+        return detect_image(file_path)
+    except Exception as error:
+        return {"image": file_path, "error": f"{type(error).__name__}: {error}"}
+
+
+def detect_image(file_path):
+    import cv2
+    from steel_pipeline import detect_defects, annotate_defects, prediction_to_record
+
+    start_time = time.perf_counter()
+
+    # Load image with OpenCV
+    frame = cv2.imread(file_path)
+    if frame is None:
+        return {"image": file_path, "error": "could not read image"}
+
+    # Inference image to find defects
+    inference_start = time.perf_counter()
+    predictions, tile_stats = detect_defects(model, frame, cropper=strip_cropper)
+    inference_time = (time.perf_counter() - inference_start) * 1000
+
+    # Write the annotated image using the same drawing as steel-image.py
+    if annotated_dir:
+        annotate_defects(frame, predictions)
+        output_path = os.path.join(
+            annotated_dir, os.path.relpath(os.path.abspath(file_path), input_root)
+        )
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        if not cv2.imwrite(output_path, frame):
+            return {"image": file_path, "error": f"could not write {output_path}"}
+
+    total_time = (time.perf_counter() - start_time) * 1000
+    result = {
+        "image": file_path,
+        "width": frame.shape[1],
+        "height": frame.shape[0],
+        "detections": [prediction_to_record(p) for p in predictions],
+        "inference_ms": round(inference_time, 2),
+        "total_ms": round(total_time, 2),
+    }
+    if strip_cropper is not None:
+        result["crop"] = list(strip_cropper.last.region)
+        result["crop_ratio"] = round(strip_cropper.last.ratio, 4)
+    if tile_stats:
+        result["tiles"] = tile_stats.tiles
+        result["tile_ms"] = [round(tile_time, 2) for tile_time in tile_stats.tile_ms]
+        result["merge_ms"] = round(tile_stats.merge_ms, 2)
+    return result
+
+
+def write_csv_rows(writer, result):
+    timing = {
+        "inference_ms": result.get("inference_ms"),
+        "total_ms": result.get("total_ms"),
+    }
+    if not result.get("detections"):
+        # Keep images without detections visible in the CSV
+        writer.writerow({"image": result["image"], **timing})
+        return
+    for detection in result["detections"]:
+        writer.writerow({"image": result["image"], **detection, **timing})
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run steel defect detection over a directory or glob without the GUI."
+    )
+    parser.add_argument("inputs", nargs="+", help="image files, directories or glob patterns")
+    parser.add_argument("--recursive", action="store_true", help="descend into subdirectories")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of worker processes (default: number of CPU cores)",
+    )
+    parser.add_argument("--jsonl", help="stream per-image results to this JSON-lines file")
+    parser.add_argument("--csv", help="stream per-detection rows to this CSV file")
+    parser.add_argument("--annotated-dir", help="write annotated images to this directory")
+    parser.add_argument("--tiled", action="store_true", help="split large images into tiles")
+    parser.add_argument("--tile-size", type=int, help="tile size in pixels (default 640)")
+    parser.add_argument("--tile-overlap", type=int, help="tile overlap in pixels (default 128)")
+    parser.add_argument(
+        "--strip-crop", action="store_true", help="infer only the strip region of each image"
+    )
+    args = parser.parse_args()
+
+    # Workers read the tiling settings from the environment in steel_pipeline
+    if args.tiled:
+        os.environ["STEEL_TILED"] = "1"
+    if args.tile_size:
+        os.environ["STEEL_TILE_SIZE"] = str(args.tile_size)
+    if args.tile_overlap is not None:
+        os.environ["STEEL_TILE_OVERLAP"] = str(args.tile_overlap)
+    if args.strip_crop:
+        os.environ["STEEL_STRIP_CROP"] = "1"
+
+    paths = collect_images(args.inputs, args.recursive)
+    if not paths:
+        print("No images found.", file=sys.stderr)
+        return 1
+
+    if args.annotated_dir:
+        os.makedirs(args.annotated_dir, exist_ok=True)
+
+    jsonl_file = open(args.jsonl, "w") if args.jsonl else None
+    csv_file = open(args.csv, "w", newline="") if args.csv else None
+    csv_writer = None
+    if csv_file:
+        csv_writer = csv.DictWriter(csv_file, fieldnames=CSV_FIELDS)
+        csv_writer.writeheader()
+
+    workers = max(1, min(args.workers, len(paths)))
+    processed = 0
+    failed = 0
+    detection_count = 0
+    pixels = 0
+    inferred_pixels = 0
+
+    start_time = time.perf_counter()
+    try:
+        with multiprocessing.Pool(
+            workers, initializer=init_worker, initargs=(args.annotated_dir, common_root(paths))
+        ) as pool:
+            # Results arrive as soon as any worker finishes, not in input order
+            for result in pool.imap_unordered(process_image, paths):
+                if "error" in result:
+                    failed += 1
+                    print(f"{result['image']}: {result['error']}", file=sys.stderr)
+                    if jsonl_file:
+                        jsonl_file.write(json.dumps(result) + "\n")
+                        jsonl_file.flush()
+                    continue
+
+                processed += 1
+                detection_count += len(result["detections"])
+                image_pixels = result["width"] * result["height"]
+                pixels += image_pixels
+                inferred_pixels += image_pixels * result.get("crop_ratio", 1.0)
+
+                if jsonl_file:
+                    jsonl_file.write(json.dumps(result) + "\n")
+                    jsonl_file.flush()
+                if csv_writer:
+                    write_csv_rows(csv_writer, result)
+                    csv_file.flush()
+
+                print(
+                    f"[{processed + failed}/{len(paths)}] {result['image']}: "
+                    f"{len(result['detections'])} detections, {result['total_ms']:.1f}ms"
+                )
+    finally:
+        if jsonl_file:
+            jsonl_file.close()
+        if csv_file:
+            csv_file.close()
+
+    elapsed = time.perf_counter() - start_time
+    print(
+        f"Processed {processed} images ({failed} failed) with {workers} workers "
+        f"in {elapsed:.1f}s: {processed / elapsed:.2f} images/sec, "
+        f"{detection_count} detections"
+    )
+    if args.strip_crop and pixels:
+        print(f"Strip crop: {(1 - inferred_pixels / pixels) * 100:.0f}% fewer pixels inferred")
+    return 0 if failed == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
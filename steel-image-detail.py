@@ -1,137 +1,341 @@
 import tkinter as tk
 from tkinter import filedialog
-from tkinter import ttk
-from PIL import Image, ImageTk
-import cv2
-from inference.models.utils import get_roboflow_model
 import time
-from dotenv import load_dotenv
-import os
+from startup import BackgroundLoader, StartupTimer
+from threshold_panel import ThresholdPanel
 
-load_dotenv()
+# Cold-start milestones, shown in the window and exported as startup_* stages
+startup = StartupTimer()
 
-# Roboflow model details
-model_name = "cr7-det-shuzong-dataset"
-model_version = "2"
+# Model, metrics, result cache, defect store writer and exporter are created on a
+# background thread once the window is up
+model = None
+metrics = None
+result_cache = None
+store_writer = None
+exporter = None
 
-API_KEY = os.getenv("API_KEY")
+# Crops each image to the steel strip before inference (STEEL_STRIP_CROP=1)
+strip_cropper = None
 
-# Get Roboflow defect model
-model = get_roboflow_model(
-    model_id=f"{model_name}/{model_version}",
-    api_key=API_KEY,
-)
+# Every (file, predictions) inspected so far, for "Export Session"
+session_results = []
 
-# Global variables to hold the processed image and defect details
+# Global variables to hold the processed image, its zoomable preview, raw candidates
+# and the defect predictions left after the current thresholds
+processed_path = None
 processed_image = None
-defect_details = []
+preview_pyramid = None
+defect_candidates = None
+defect_predictions = []
+
+# Defect store record of the displayed image; written again with its final
+# predictions when the thresholds were changed, once another image is opened or
+# the window closes
+displayed_store_image = None
+store_stale = False
+
+
+def load_pipeline():
+    # Runs on the loader thread: heavy imports (OpenCV, NumPy, PIL, the inference
+    # backend), the model and a warm-up inference, so neither the window nor the
+    # first real image waits for them. The functions below import from these
+    # modules locally, which is only a lookup once they are loaded.
+    global strip_cropper
+    import PIL.ImageTk
+    from defect_store import load_store_writer
+    from defect_table import DefectTable
+    from detector import warm_up
+    from exporter import Exporter
+    from instrumentation import load_instrumentation
+    from result_cache import load_result_cache
+    from steel_pipeline import load_model
+    from strip_crop import make_cropper
+
+    startup.mark("imports")
+    # Get defect model (backend selected through DETECTOR_BACKEND)
+    loaded_model = load_model()
+    startup.mark("model")
+    warm_up(loaded_model)
+    startup.mark("ready")
+    strip_cropper = make_cropper()
+
+    return (
+        loaded_model,
+        # Per-stage timers, exported when METRICS_PORT / METRICS_JSONL are set
+        load_instrumentation("steel-image-detail"),
+        # Results keyed by image content, model version and settings (disable with RESULT_CACHE=0)
+        load_result_cache(loaded_model),
+        # Every inspection is persisted to the SQLite defect store on a background thread
+        load_store_writer(),
+        # Annotated images and labels are written on a background thread pool
+        Exporter(),
+    )
+
+
+def pipeline_ready(loaded):
+    global model, metrics, result_cache, store_writer, exporter, defect_table, threshold_panel
+    from defect_table import DefectTable
+    from steel_pipeline import CANDIDATE_CONFIDENCE, CONFIDENCE, IOU_THRESHOLD, TILED
+
+    model, metrics, result_cache, store_writer, exporter = loaded
+    startup.record(metrics)
+    startup_label.config(text=startup.format())
+
+    # Create a paged table for detailed defect information, filterable and sortable
+    defect_table = DefectTable(root, rows=8, on_select=highlight_defect)
+    defect_table.pack(pady=10, before=processing_textbox)
+
+    # Create sliders that re-filter the last candidates without running inference again
+    threshold_panel = ThresholdPanel(
+        root, CONFIDENCE, IOU_THRESHOLD, CANDIDATE_CONFIDENCE, on_change=thresholds_changed
+    )
+    threshold_panel.pack(pady=0, before=tiled_checkbox)
+    tiled_var.set(TILED)
+
+    open_image_button.config(text="Select and Detect Images", state="normal")
+    poll_export_progress()
+
+
+def pipeline_failed(error):
+    open_image_button.config(text="Model failed to load")
+    startup_label.config(text=f"Could not load the model: {error}")
+
+
+def show_preview(image):
+    from PIL import ImageTk
+
+    photo = ImageTk.PhotoImage(image)
+    image_label.config(image=photo)
+    image_label.image = photo
+
+
+def zoom_preview(event):
+    # Mouse wheel zooms into the preview pyramid around the cursor
+    if preview_pyramid is None:
+        return
+    step = 1 if event.num == 4 or event.delta > 0 else -1
+    show_preview(preview_pyramid.zoom_at(step, event.x, event.y))
+
+
+def highlight_defect(index):
+    # Outline the selected defect on the preview without re-rendering the image
+    if preview_pyramid is not None:
+        show_preview(preview_pyramid.highlight(defect_table.boxes[index]))
+
+
+def draw_defect_ids(frame, predictions):
+    # Draw bounding boxes with IDs on the displayed image (red color)
+    from renderer import render_ids
+
+    render_ids(frame, predictions, color=(238, 0, 0))
+
+
+def flush_store():
+    global store_stale
+    if store_writer is not None and store_stale:
+        store_writer.submit(displayed_store_image, defect_predictions)
+    store_stale = False
+
+
+def thresholds_changed():
+    global store_stale
+    apply_thresholds()
+    store_stale = True
+
+
+def apply_thresholds():
+    # Re-filter the candidates of the displayed image with the slider values and
+    # redraw the preview and table; no inference involved
+    global defect_predictions
+    from detector import predictions_to_arrays
+
+    if defect_candidates is None:
+        return
+    start_time = time.perf_counter()
+    with metrics.stage("refilter"):
+        # Keep the predictions for saving; their order gives the IDs shown on the image
+        defect_predictions = defect_candidates.filter(*threshold_panel.values())
+        preview_pyramid.annotate(draw_defect_ids, defect_predictions)
+        show_preview(preview_pyramid.view())
+
+        # Update detailed defect info; only the visible rows are materialized
+        boxes, scores, class_ids, class_names = predictions_to_arrays(defect_predictions)
+        defect_table.set_data(class_ids, scores, boxes, class_names)
+    session_results[-1] = (processed_path, defect_predictions)
+    threshold_panel.report(
+        len(defect_predictions),
+        len(defect_candidates),
+        (time.perf_counter() - start_time) * 1000,
+    )
 
 
 def open_and_detect_image():
-    global processed_image, defect_details  # Use global variables to hold processed image and defect details
-    file_path = filedialog.askopenfilename(
-        filetypes=[("Image Files", "*.png;*.jpg;*.jpeg;*.bmp;*.gif")]
+    global processed_path, processed_image, preview_pyramid, defect_candidates, displayed_store_image  # Use global variables to hold processed image and defect predictions
+    from image_io import PreviewPyramid, decode_image, is_raw, load_image, quick_preview
+    from result_cache import cache_key
+    from steel_pipeline import (
+        CANDIDATE_CONFIDENCE,
+        CandidateFilter,
+        batch_chunks,
+        candidate_merge,
+        detect_candidates_batch,
+        detection_variant,
     )
-    if file_path:
-        start_time = time.time()
-
-        # Load image with OpenCV
-        frame = cv2.imread(file_path)
-
-        # Inference image to find defects
-        results = model.infer(image=frame, confidence=0.5, iou_threshold=0.5)
-
-        # Clear previous data in the defect table
-        for item in defect_table.get_children():
-            defect_table.delete(item)
-
-        # Clear previous defect details
-        defect_details.clear()
-
-        # Plot image with bounding box and ID (using OpenCV)
-        if results[0].predictions:
-            for idx, prediction in enumerate(results[0].predictions, start=1):
-                x_center = int(prediction.x)
-                y_center = int(prediction.y)
-                width = int(prediction.width)
-                height = int(prediction.height)
-                class_name = prediction.class_name
-                confidence = prediction.confidence * 100
-
-                # Save details for the defect, including the ID
-                defect_details.append(
-                    (
-                        idx,  # Include ID
-                        class_name,
-                        f"{confidence:.1f}%",  # Store confidence as string
-                        x_center,
-                        y_center,
-                        width,
-                        height,
-                    )
-                )
+    from strip_crop import format_crop
+    from tiling import format_tile_stats
 
-                # Calculate top-left and bottom-right corners
-                x0 = x_center - width // 2
-                y0 = y_center - height // 2
-                x1 = x_center + width // 2
-                y1 = y_center + height // 2
-
-                # Draw bounding box with ID on the displayed image (red color)
-                label_color = (238, 0, 0)  # Red color
-                cv2.rectangle(frame, (x0, y0), (x1, y1), label_color, 1)
-                cv2.putText(
-                    frame,
-                    str(idx),  # Display the ID
-                    (x0, y0 - 5 if y0 - 5 > 0 else y1 + 5),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.4,
-                    label_color,
-                    1,
-                )
+    file_paths = filedialog.askopenfilenames(
+        filetypes=[("Image Files", "*.png;*.jpg;*.jpeg;*.bmp;*.gif;*.tif;*.tiff;*.raw;*.bin")]
+    )
+    if file_paths:
+        start_time = time.perf_counter()
+
+        # Show a reduced-resolution preview first where decoding one is cheap; with
+        # several files the last one is the one displayed
+        with metrics.stage("quick_preview"):
+            early_preview = quick_preview(file_paths[-1])
+        if early_preview is not None:
+            show_preview(early_preview)
+            root.update_idletasks()
+
+        # The previously displayed image is done with
+        flush_store()
+
+        # Several files are decoded and inferred a batch at a time
+        cache_hits = 0
+        chunks, batch_size = batch_chunks(model, list(file_paths))
+        for chunk in chunks:
+            frames, keys, hits = [], [], []
+            for file_path in chunk:
+                # Read the file once; its bytes are both the cache key and the decode input.
+                # Raw dumps are hashed straight from their mapping instead.
+                with metrics.stage("decode"):
+                    if is_raw(file_path):
+                        frames.append(load_image(file_path))
+                        content = frames[-1]
+                    else:
+                        with open(file_path, "rb") as image_file:
+                            content = image_file.read()
+                        frames.append(decode_image(file_path, content))
+
+                # Content key of this image, model and settings for the cache and the defect
+                # store; the cache holds the raw candidates, so thresholds are not part of it
+                with metrics.stage("hash"):
+                    keys.append(
+                        cache_key(
+                            content,
+                            model.model_id,
+                            CANDIDATE_CONFIDENCE,
+                            1.0,
+                            detection_variant(tiled_var.get(), strip_cropper),
+                        )
+                    )
 
-        # Convert BGR to RGB for Tkinter
-        detected_image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        annotated_image = Image.fromarray(detected_image_rgb)
-        annotated_image.thumbnail((400, 300), Image.Resampling.LANCZOS)
-        photo = ImageTk.PhotoImage(annotated_image)
-
-        # Store the processed image for saving later
-        processed_image = detected_image_rgb
-
-        # Display the image with annotations
-        image_label.config(image=photo)
-        image_label.image = photo
-
-        end_time = time.time()
-        processing_time = (end_time - start_time) * 1000
-
-        # Update detailed defect info
-        for detail in defect_details:
-            defect_table.insert(
-                "",
-                "end",
-                values=(
-                    detail[0],
-                    detail[1],
-                    detail[2],
-                ),  # Display ID, Class, and Confidence
-            )
+                # Look up earlier candidates for the same image before running the model
+                cached = None
+                if result_cache is not None:
+                    with metrics.stage("cache"):
+                        cached = result_cache.get(keys[-1])
+                hits.append(cached)
+
+            # Inference on the images without cached results, in one batch
+            results = [None if cached is None else (cached[0], None) for cached in hits]
+            misses = [index for index, cached in enumerate(hits) if cached is None]
+            cache_hits += len(chunk) - len(misses)
+            if misses:
+                with metrics.stage("inference" if len(misses) == 1 else "batch_inference"):
+                    inference_start = time.perf_counter()
+                    detections = detect_candidates_batch(
+                        model,
+                        [frames[index] for index in misses],
+                        tiled=tiled_var.get(),
+                        cropper=strip_cropper,
+                    )
+                    inference_time = (time.perf_counter() - inference_start) * 1000 / len(misses)
+                metrics.record_detector(model)
+                for index, (predictions, tile_stats) in zip(misses, detections):
+                    results[index] = (predictions, tile_stats)
+                    if result_cache is not None:
+                        result_cache.put(keys[index], model.model_id, predictions, inference_time)
+
+            for file_path, frame, key, result in zip(chunk, frames, keys, results):
+                # Predictions at the current thresholds
+                candidates = CandidateFilter(result[0], candidate_merge(frame, tiled_var.get()))
+                threshold_panel.set_classes(candidates.class_names)
+                predictions = candidates.filter(*threshold_panel.values())
+                displayed_store_image = {
+                    "path": file_path,
+                    "content_key": key,
+                    "model_id": model.model_id,
+                    "width": frame.shape[1],
+                    "height": frame.shape[0],
+                }
+                if store_writer is not None:
+                    store_writer.submit(displayed_store_image, predictions)
+                session_results.append((file_path, predictions))
+
+        # The last image is the one displayed
+        frame = frames[-1]
+        tile_stats = results[-1][1]
+        cached = hits[-1]
+        if cached is not None:
+            _, cached_inference_time, cache_tier = cached
+
+        # Downscale first; boxes are drawn on the small preview levels only
+        with metrics.stage("convert"):
+            preview_pyramid = PreviewPyramid(frame)
+
+        # Keep the clean full-resolution frame (BGR) and its candidates for
+        # re-filtering and saving later
+        processed_path = file_paths[-1]
+        processed_image = frame
+        defect_candidates = candidates
+        defect_candidates.cache_overlaps()
+
+        # Draw boxes with IDs, display and fill the defect table
+        with metrics.stage("render"):
+            apply_thresholds()
+        metrics.frame()
+
+        processing_time = (time.perf_counter() - start_time) * 1000
+        metrics.record("total", processing_time)
 
         # Update total processing time in the Text widget
+        processing_text = f"Total processing time: {processing_time:.1f}ms"
+        if cached is not None:
+            processing_text += (
+                f" (cache hit: {cache_tier}, saved ~{cached_inference_time:.0f}ms)"
+            )
+        if len(file_paths) > 1:
+            processing_text += (
+                f"\n{len(file_paths)} images, {processing_time / len(file_paths):.1f}ms/image "
+                f"(batch size {batch_size}, {cache_hits} cached)"
+            )
+        if strip_cropper is not None and cached is None:
+            processing_text += f"\n{format_crop(strip_cropper.last)}"
+        if tile_stats:
+            processing_text += f"\n{format_tile_stats(tile_stats)}"
         processing_textbox.configure(state="normal")
         processing_textbox.delete("1.0", tk.END)
-        processing_textbox.insert(
-            tk.END, f"Total processing time: {processing_time:.1f}ms"
-        )
+        processing_textbox.insert(tk.END, processing_text)
         processing_textbox.configure(state="disabled")
 
-        # Enable save button after processing
+        # Enable save and export buttons after processing
         save_image_button.config(state="normal")
+        export_session_button.config(state="normal")
+
+        # Time to first result, counted from process start
+        if "first_result" not in startup.marks:
+            startup.mark("first_result")
+            startup.record(metrics, ["first_result"])
+            startup_label.config(text=startup.format())
 
 
 def save_image():
-    global processed_image, defect_details
+    global processed_image, defect_predictions
+    from exporter import single_image_job
+
     if processed_image is not None:
         file_path = filedialog.asksaveasfilename(
             defaultextension=".png",
@@ -142,71 +346,70 @@ def save_image():
             ],
         )
         if file_path:
-            # Save the processed image with defect names and confidence
-            save_image_with_defects(processed_image, defect_details, file_path)
+            # Save the processed image with defect IDs, names and confidence, plus
+            # COCO / YOLO labels, on the export workers (they draw on a copy)
+            if not exporter.submit(
+                single_image_job(
+                    file_path, defect_predictions, processed_image, render=draw_session_image
+                )
+            ):
+                export_label.config(text="Export queue is full, try again shortly")
 
 
-def save_image_with_defects(image, details, file_path):
-    # Create a copy of the image to draw labels on
-    image_copy = image.copy()
-    for detail in details:
-        id_num, class_name, confidence, x_center, y_center, width, height = (
-            detail  # Unpack correctly
-        )
+def draw_defect_labels(frame, predictions):
+    # Draw bounding boxes with class name and confidence (blue color, BGR order)
+    from renderer import render_ids
 
-        # Calculate top-left and bottom-right corners
-        x0 = x_center - width // 2
-        y0 = y_center - height // 2
-        x1 = x_center + width // 2
-        y1 = y_center + height // 2
-
-        # Draw bounding box and label on saved image
-        label_color = (0, 0, 238)  # Use blue color
-        cv2.rectangle(image_copy, (x0, y0), (x1, y1), label_color, 1)
-        label_text = (
-            f"{class_name} {confidence}"  # Include only the class name and confidence
-        )
-        cv2.putText(
-            image_copy,
-            label_text,
-            (x0, y0 - 5 if y0 - 5 > 0 else y1 + 5),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            0.4,
-            label_color,
-            1,
-        )
+    labels = [
+        f"{prediction.class_name} {prediction.confidence * 100:.1f}%"
+        for prediction in predictions
+    ]
+    render_ids(frame, predictions, color=(238, 0, 0), texts=labels)
 
-    # Save the modified image
-    Image.fromarray(image_copy).save(file_path)
+
+def draw_session_image(frame, predictions):
+    # Saved images start from the clean frame, so the ID boxes are drawn first
+    draw_defect_ids(frame, predictions)
+    draw_defect_labels(frame, predictions)
+
+
+def export_session():
+    # Re-reads every inspected image in the workers and writes images/, labels/
+    # and annotations.json into the chosen directory
+    directory = filedialog.askdirectory()
+    if directory and session_results:
+        exporter.export_session(list(session_results), directory, draw_session_image)
+
+
+def poll_export_progress():
+    from exporter import format_progress
+
+    export_label.config(text=format_progress(exporter.progress()))
+    root.after(250, poll_export_progress)
 
 
 # Create the main window
 root = tk.Tk()
 root.title("Roboflow Defect Detection Viewer")
-root.geometry("400x700")
+root.geometry("400x950")
 
-# Create a label for the placeholder
-placeholder_image = Image.new("RGB", (300, 300), "grey")
-placeholder_photo = ImageTk.PhotoImage(placeholder_image)
+# Create a label for the placeholder (a plain Tk image, PIL is not loaded yet)
+placeholder_photo = tk.PhotoImage(width=300, height=300)
+placeholder_photo.put("grey", to=(0, 0, 300, 300))
 image_label = tk.Label(root, image=placeholder_photo)
 image_label.pack(pady=10)
+image_label.bind("<MouseWheel>", zoom_preview)
+image_label.bind("<Button-4>", zoom_preview)
+image_label.bind("<Button-5>", zoom_preview)
 
-# Create a table for detailed defect information
-defect_table = ttk.Treeview(
-    root, columns=("ID", "Class", "Confidence"), show="headings", height=8
-)
-defect_table.column("ID", width=50, anchor="center")
-defect_table.column("Class", width=150, anchor="center")
-defect_table.column("Confidence", width=100, anchor="center")
-defect_table.heading("ID", text="ID")
-defect_table.heading("Class", text="Class")
-defect_table.heading("Confidence", text="Confidence")
-defect_table.pack(pady=10)
+# Defect table and threshold sliders, created once the model has loaded
+defect_table = None
+threshold_panel = None
 
 # Create a text box for the processing time with initial text
 processing_textbox = tk.Text(
     root,
-    height=2,
+    height=3,
     width=40,
     wrap="word",
     font=("Arial", 10),
@@ -217,9 +420,15 @@ processing_textbox.pack(pady=10)
 processing_textbox.insert(tk.END, "Total processing time: ")
 processing_textbox.configure(state="disabled")
 
-# Create a button to open and detect objects in the image
+# Create a checkbox to split large images into overlapping tiles
+tiled_var = tk.BooleanVar(value=False)
+tiled_checkbox = tk.Checkbutton(root, text="Tiled inference", variable=tiled_var)
+tiled_checkbox.pack(pady=0)
+
+# Create a button to open and detect objects in one or more images, enabled once
+# the model has loaded and warmed up
 open_image_button = tk.Button(
-    root, text="Select and Detect Image", command=open_and_detect_image
+    root, text="Loading model…", command=open_and_detect_image, state="disabled"
 )
 open_image_button.pack(pady=10)
 
@@ -229,5 +438,32 @@ save_image_button = tk.Button(
 )
 save_image_button.pack(pady=10)
 
+# Create a button to export every image inspected in this session
+export_session_button = tk.Button(
+    root, text="Export Session", command=export_session, state="disabled"
+)
+export_session_button.pack(pady=0)
+
+# Create a label for background export progress
+export_label = tk.Label(root, text="")
+export_label.pack(pady=5)
+
+# Create a label for the cold-start and time-to-first-result report
+startup_label = tk.Label(root, text="", font=("Arial", 8), wraplength=380)
+startup_label.pack(pady=0)
+
+# Load the model in the background; the window appears right away
+root.after_idle(startup.mark, "window")
+loader = BackgroundLoader(root, load_pipeline, pipeline_ready, pipeline_failed)
+
 # Run the application
 root.mainloop()
+
+# Finish exports still in progress
+if exporter is not None:
+    exporter.close()
+
+# Flush detections still queued for the defect store
+if store_writer is not None:
+    flush_store()
+    store_writer.close()
@@ -1,133 +1,219 @@
 import tkinter as tk
 from tkinter import filedialog
-from PIL import Image, ImageTk
-import cv2
-from inference.models.utils import get_roboflow_model
 import time
-from dotenv import load_dotenv
-import os
+from startup import BackgroundLoader, StartupTimer
+from threshold_panel import ThresholdPanel
 
-load_dotenv()
+# Cold-start milestones, shown in the window and exported as startup_* stages
+startup = StartupTimer()
 
-# Roboflow model details
-model_name = "cr7-det-shuzong-dataset"
-model_version = "2"
+# Model, metrics and exporter are created on a background thread once the window is up
+model = None
+metrics = None
+exporter = None
 
-API_KEY = os.getenv("API_KEY")
+# Crops each image to the steel strip before inference (STEEL_STRIP_CROP=1)
+strip_cropper = None
 
-# Get Roboflow defect model
-model = get_roboflow_model(
-    model_id=f"{model_name}/{model_version}",
-    api_key=API_KEY,
-)
-
-# Global variable to hold the processed image
+# Global variables to hold the processed image, its raw candidates, the predictions
+# left after the current thresholds and the zoomable preview
+processed_path = None
 processed_image = None
+processed_candidates = None
+processed_predictions = []
+preview_pyramid = None
+
+# Every (file, predictions) inspected so far, for "Export Session"
+session_results = []
+
+
+def load_pipeline():
+    # Runs on the loader thread: heavy imports (OpenCV, NumPy, PIL, the inference
+    # backend), the model and a warm-up inference, so neither the window nor the
+    # first real image waits for them. The functions below import from these
+    # modules locally, which is only a lookup once they are loaded.
+    global strip_cropper
+    import PIL.ImageTk
+    from detector import warm_up
+    from exporter import Exporter
+    from instrumentation import load_instrumentation
+    from steel_pipeline import load_model
+    from strip_crop import make_cropper
+
+    startup.mark("imports")
+    # Get defect model (backend selected through DETECTOR_BACKEND)
+    loaded_model = load_model()
+    startup.mark("model")
+    warm_up(loaded_model)
+    startup.mark("ready")
+    strip_cropper = make_cropper()
+
+    # Per-stage timers (exported when METRICS_PORT / METRICS_JSONL are set) and
+    # the background thread pool writing annotated images and labels
+    return loaded_model, load_instrumentation("steel-image"), Exporter()
+
+
+def pipeline_ready(loaded):
+    global model, metrics, exporter, threshold_panel
+    from steel_pipeline import CANDIDATE_CONFIDENCE, CONFIDENCE, IOU_THRESHOLD, TILED
+
+    model, metrics, exporter = loaded
+    startup.record(metrics)
+    startup_label.config(text=startup.format())
+
+    # Create sliders that re-filter the last candidates without running inference again
+    threshold_panel = ThresholdPanel(
+        root, CONFIDENCE, IOU_THRESHOLD, CANDIDATE_CONFIDENCE, on_change=apply_thresholds
+    )
+    threshold_panel.pack(pady=0, before=tiled_checkbox)
+    tiled_var.set(TILED)
 
+    open_image_button.config(text="Select and Detect Images", state="normal")
+    poll_export_progress()
 
-def open_and_detect_image():
-    global processed_image  # Use global variable to hold processed image
-    file_path = filedialog.askopenfilename(
-        filetypes=[("Image Files", "*.png;*.jpg;*.jpeg;*.bmp;*.gif")]
-    )
-    if file_path:
-        start_time = time.time()
-
-        # Load image with OpenCV
-        frame = cv2.imread(file_path)
-
-        # Inference image to find defects
-        results = model.infer(image=frame, confidence=0.5, iou_threshold=0.5)
-
-        # Clear previous defect details
-        defect_info = []  # List to store defect info
-
-        # Plot image with bounding box and ID (using OpenCV)
-        if results[0].predictions:
-            for idx, prediction in enumerate(results[0].predictions, start=1):
-                x_center = int(prediction.x)
-                y_center = int(prediction.y)
-                width = int(prediction.width)
-                height = int(prediction.height)
-                class_name = prediction.class_name
-                confidence = prediction.confidence * 100
-
-                # Append defect details to the list
-                defect_info.append(f"{class_name}: {confidence:.1f}%")
-
-                # Calculate top-left and bottom-right corners
-                x0 = x_center - width // 2
-                y0 = y_center - height // 2
-                x1 = x_center + width // 2
-                y1 = y_center + height // 2
-
-                # Display defect name with confidence percentage
-                label_text = f"{class_name} {confidence:.1f}%"
-                text_y = (
-                    y0 - 10 if y0 - 10 > 0 else y1 + 20
-                )  # Adjust position if text goes out of bounds
-
-                # Sample the region around the label for brightness calculation
-                roi_y_start = max(y0 - 20, 0)  # A few pixels above the bounding box
-                roi_y_end = min(y0, frame.shape[0])
-                roi_x_start = max(x0, 0)
-                roi_x_end = min(x1, frame.shape[1])
-
-                # Calculate average brightness
-                roi = frame[roi_y_start:roi_y_end, roi_x_start:roi_x_end]
-                avg_brightness = cv2.mean(roi)[:3]  # Ignore alpha channel if present
-                avg_brightness_value = (
-                    sum(avg_brightness) / 3
-                )  # Grayscale average brightness
-
-                label_color = (
-                    (255, 255, 0) if avg_brightness_value < 128 else (100, 100, 0)
-                )
 
-                # Draw bounding box with certain thickness
-                cv2.rectangle(frame, (x0, y0), (x1, y1), label_color, 1)
-
-                cv2.putText(
-                    frame,
-                    label_text,  # Use actual class name instead of "Face"
-                    (x0, text_y),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.4,
-                    label_color,
-                    1,
-                )
+def pipeline_failed(error):
+    open_image_button.config(text="Model failed to load")
+    startup_label.config(text=f"Could not load the model: {error}")
+
+
+def show_preview(image):
+    from PIL import ImageTk
+
+    photo = ImageTk.PhotoImage(image)
+    image_label.config(image=photo)
+    image_label.image = photo
 
-        # Convert BGR to RGB for Tkinter
-        detected_image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        annotated_image = Image.fromarray(detected_image_rgb)
-        annotated_image.thumbnail((400, 300), Image.Resampling.LANCZOS)
-        photo = ImageTk.PhotoImage(annotated_image)
 
-        # Store the processed image for saving later
-        processed_image = annotated_image
+def zoom_preview(event):
+    # Mouse wheel zooms into the preview pyramid around the cursor
+    if preview_pyramid is None:
+        return
+    step = 1 if event.num == 4 or event.delta > 0 else -1
+    show_preview(preview_pyramid.zoom_at(step, event.x, event.y))
 
-        # Display the image with annotations
-        image_label.config(image=photo)
-        image_label.image = photo
 
-        # Enable the save button after processing
+def apply_thresholds():
+    # Re-filter the candidates of the displayed image with the slider values and
+    # redraw the preview; no inference involved
+    global processed_predictions
+    from steel_pipeline import annotate_defects
+
+    if processed_candidates is None:
+        return
+    start_time = time.perf_counter()
+    with metrics.stage("refilter"):
+        processed_predictions = processed_candidates.filter(*threshold_panel.values())
+        preview_pyramid.annotate(annotate_defects, processed_predictions)
+        show_preview(preview_pyramid.view())
+    session_results[-1] = (processed_path, processed_predictions)
+    threshold_panel.report(
+        len(processed_predictions),
+        len(processed_candidates),
+        (time.perf_counter() - start_time) * 1000,
+    )
+
+
+def open_and_detect_image():
+    global processed_path, processed_image, processed_candidates, preview_pyramid  # Use global variables to hold processed image
+    from image_io import PreviewPyramid, load_image, quick_preview
+    from steel_pipeline import (
+        CandidateFilter,
+        batch_chunks,
+        candidate_merge,
+        detect_candidates_batch,
+    )
+    from strip_crop import format_crop
+    from tiling import format_tile_stats
+
+    file_paths = filedialog.askopenfilenames(
+        filetypes=[("Image Files", "*.png;*.jpg;*.jpeg;*.bmp;*.gif;*.tif;*.tiff;*.raw;*.bin")]
+    )
+    if file_paths:
+        start_time = time.perf_counter()
+
+        # Show a reduced-resolution preview first where decoding one is cheap; with
+        # several files the last one is the one displayed
+        with metrics.stage("quick_preview"):
+            early_preview = quick_preview(file_paths[-1])
+        if early_preview is not None:
+            show_preview(early_preview)
+            root.update_idletasks()
+
+        # Several files are decoded and inferred a batch at a time
+        chunks, batch_size = batch_chunks(model, list(file_paths))
+        for chunk in chunks:
+            # Load images with OpenCV (raw line-scan dumps are memory-mapped)
+            frames = []
+            for file_path in chunk:
+                with metrics.stage("decode"):
+                    frames.append(load_image(file_path))
+
+            # Inference images to find defect candidates, filtered with the current thresholds
+            with metrics.stage("inference" if len(chunk) == 1 else "batch_inference"):
+                results = detect_candidates_batch(
+                    model, frames, tiled=tiled_var.get(), cropper=strip_cropper
+                )
+            metrics.record_detector(model)
+            for file_path, frame, (predictions, _) in zip(chunk, frames, results):
+                candidates = CandidateFilter(predictions, candidate_merge(frame, tiled_var.get()))
+                threshold_panel.set_classes(candidates.class_names)
+                session_results.append((file_path, candidates.filter(*threshold_panel.values())))
+        frame = frames[-1]
+        tile_stats = results[-1][1]
+
+        # Downscale first; boxes are drawn on the small preview levels only
+        with metrics.stage("convert"):
+            preview_pyramid = PreviewPyramid(frame)
+
+        # Keep the clean full-resolution frame and its candidates for re-filtering
+        # and saving later
+        processed_path = file_paths[-1]
+        processed_image = frame
+        processed_candidates = candidates
+        processed_candidates.cache_overlaps()
+
+        # Plot bounding boxes and labels, then display
+        with metrics.stage("render"):
+            apply_thresholds()
+        metrics.frame()
+
+        # Enable the save and export buttons after processing
         save_image_button.config(state="normal")
+        export_session_button.config(state="normal")
 
-        end_time = time.time()
-        processing_time = (end_time - start_time) * 1000
+        processing_time = (time.perf_counter() - start_time) * 1000
+        metrics.record("total", processing_time)
 
         # Update total processing time in the Text widget
+        processing_text = f"Total processing time: {processing_time:.1f}ms"
+        if len(file_paths) > 1:
+            processing_text += (
+                f"\n{len(file_paths)} images, {processing_time / len(file_paths):.1f}ms/image "
+                f"(batch size {batch_size})"
+            )
+        if strip_cropper is not None:
+            processing_text += f"\n{format_crop(strip_cropper.last)}"
+        if tile_stats:
+            processing_text += f"\n{format_tile_stats(tile_stats)}"
         processing_textbox.configure(state="normal")
         processing_textbox.delete("1.0", tk.END)
-        processing_textbox.insert(
-            tk.END, f"Total processing time: {processing_time:.1f}ms"
-        )
+        processing_textbox.insert(tk.END, processing_text)
         processing_textbox.configure(state="disabled")
 
+        # Time to first result, counted from process start
+        if "first_result" not in startup.marks:
+            startup.mark("first_result")
+            startup.record(metrics, ["first_result"])
+            startup_label.config(text=startup.format())
+
 
 def save_image():
     global processed_image  # Access the processed image
-    if processed_image:
+    from exporter import single_image_job
+    from steel_pipeline import annotate_defects
+
+    if processed_image is not None:
         file_path = filedialog.asksaveasfilename(
             defaultextension=".png",
             filetypes=[
@@ -137,26 +223,50 @@ def save_image():
             ],
         )
         if file_path:
-            processed_image.save(
-                file_path
-            )  # Save the processed image to the selected path
+            # Full-resolution image plus COCO / YOLO labels, written in the background
+            if not exporter.submit(
+                single_image_job(
+                    file_path, processed_predictions, processed_image, render=annotate_defects
+                )
+            ):
+                export_label.config(text="Export queue is full, try again shortly")
+
+
+def export_session():
+    # Re-reads every inspected image in the workers and writes images/, labels/
+    # and annotations.json into the chosen directory
+    from steel_pipeline import annotate_defects
+
+    directory = filedialog.askdirectory()
+    if directory and session_results:
+        exporter.export_session(list(session_results), directory, annotate_defects)
+
+
+def poll_export_progress():
+    from exporter import format_progress
+
+    export_label.config(text=format_progress(exporter.progress()))
+    root.after(250, poll_export_progress)
 
 
 # Create the main window
 root = tk.Tk()
 root.title("Roboflow Defect Detection Viewer")
-root.geometry("400x500")
+root.geometry("400x700")
 
-# Create a label for the placeholder
-placeholder_image = Image.new("RGB", (300, 300), "grey")
-placeholder_photo = ImageTk.PhotoImage(placeholder_image)
+# Create a label for the placeholder (a plain Tk image, PIL is not loaded yet)
+placeholder_photo = tk.PhotoImage(width=300, height=300)
+placeholder_photo.put("grey", to=(0, 0, 300, 300))
 image_label = tk.Label(root, image=placeholder_photo)
 image_label.pack(pady=20)
+image_label.bind("<MouseWheel>", zoom_preview)
+image_label.bind("<Button-4>", zoom_preview)
+image_label.bind("<Button-5>", zoom_preview)
 
 # Create a text box for the processing time with initial text
 processing_textbox = tk.Text(
     root,
-    height=2,
+    height=3,
     width=40,
     wrap="word",
     font=("Arial", 10),
@@ -167,9 +277,18 @@ processing_textbox.pack(pady=10)
 processing_textbox.insert(tk.END, "Total processing time: ")  # Initial text
 processing_textbox.configure(state="disabled")  # Disable editing initially
 
-# Create a button to open and detect objects in the image
+# Threshold sliders, created once the model has loaded
+threshold_panel = None
+
+# Create a checkbox to split large images into overlapping tiles
+tiled_var = tk.BooleanVar(value=False)
+tiled_checkbox = tk.Checkbutton(root, text="Tiled inference", variable=tiled_var)
+tiled_checkbox.pack(pady=0)
+
+# Create a button to open and detect objects in one or more images, enabled once
+# the model has loaded and warmed up
 open_image_button = tk.Button(
-    root, text="Select and Detect Image", command=open_and_detect_image
+    root, text="Loading model…", command=open_and_detect_image, state="disabled"
 )
 open_image_button.pack(pady=0)
 
@@ -179,5 +298,27 @@ save_image_button = tk.Button(
 )
 save_image_button.pack(pady=10)
 
+# Create a button to export every image inspected in this session
+export_session_button = tk.Button(
+    root, text="Export Session", command=export_session, state="disabled"
+)
+export_session_button.pack(pady=0)
+
+# Create a label for background export progress
+export_label = tk.Label(root, text="")
+export_label.pack(pady=5)
+
+# Create a label for the cold-start and time-to-first-result report
+startup_label = tk.Label(root, text="", font=("Arial", 8), wraplength=380)
+startup_label.pack(pady=0)
+
+# Load the model in the background; the window appears right away
+root.after_idle(startup.mark, "window")
+loader = BackgroundLoader(root, load_pipeline, pipeline_ready, pipeline_failed)
+
 # Run the application
 root.mainloop()
+
+# Finish exports still in progress
+if exporter is not None:
+    exporter.close()
@@ -0,0 +1,254 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import queue
+import sys
+import time
+
+import cv2
+
+from coil import CoilScanner, StripPositioner, motion_preview, pixels_per_frame
+from defect_store import DefectStore
+from detector import make_predictions
+from frame_pipeline import StageThread
+from steel_pipeline import detect_defects, load_model
+from strip_crop import STRIP_CROP, STRIP_CROP_MARGIN, STRIP_CROP_REFRESH, StripCropper
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+CSV_FIELDS = [
+    "coil",
+    "id",
+    "class",
+    "confidence",
+    "position_px",
+    "x_px",
+    "length_px",
+    "width_px",
+    "position_mm",
+    "x_mm",
+    "length_mm",
+    "width_mm",
+    "first_frame",
+    "last_frame",
+    "observations",
+]
+
+
+def open_source(source):
+    # A video file, or a directory / glob of line-scan frames in name order.
+    # Returns a frame iterator and the source frame rate if known.
+    if os.path.isdir(source) or any(char in source for char in "*?["):
+        pattern = os.path.join(source, "*") if os.path.isdir(source) else source
+        paths = sorted(
+            path for path in glob.glob(pattern) if path.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        return (cv2.imread(path) for path in paths), None
+
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise ValueError(f"could not open {source}")
+
+    def frames():
+        try:
+            while True:
+                ret, frame = capture.read()
+                if not ret:
+                    return
+                yield frame
+        finally:
+            capture.release()
+
+    return frames(), capture.get(cv2.CAP_PROP_FPS) or None
+
+
+def start_decoder(frames, frame_queue):
+    # Decode and build motion previews on a background thread; the bounded queue
+    # blocks instead of dropping because every frame of the coil matters
+    iterator = enumerate(frames)
+
+    def decode_step():
+        # The None sentinel always follows the last frame, also when decoding fails,
+        # so the main loop never waits forever; a failure is queued before it
+        finished = True
+        try:
+            item = next(iterator, None)
+            if item is None:
+                return False
+            index, frame = item
+            if frame is not None:
+                frame_queue.put((index, frame, motion_preview(frame)))
+            finished = False
+        except Exception as error:
+            frame_queue.put(error)
+            return False
+        finally:
+            if finished:
+                frame_queue.put(None)
+
+    decoder = StageThread("decode", decode_step)
+    decoder.start()
+    return decoder
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Detect steel defects along a whole coil from video or a frame sequence."
+    )
+    parser.add_argument("source", help="video file, directory of frames or glob pattern")
+    parser.add_argument("--coil-id", help="coil identifier (default: source name)")
+    parser.add_argument("--output", help="per-coil defect list JSON (default: <coil-id>-defects.json)")
+    parser.add_argument("--csv", help="also write the defect list as CSV")
+    parser.add_argument(
+        "--direction",
+        choices=("up", "down"),
+        default="up",
+        help="direction the strip moves in the image (default: up, new strip enters at the bottom)",
+    )
+    parser.add_argument(
+        "--motion",
+        choices=("phase", "speed"),
+        default="phase",
+        help="estimate travel between frames by phase correlation or from --line-speed",
+    )
+    parser.add_argument("--line-speed", type=float, help="line speed in m/min")
+    parser.add_argument("--mm-per-pixel", type=float, help="strip length covered by one image row")
+    parser.add_argument("--fps", type=float, help="frame rate of a frame sequence")
+    parser.add_argument(
+        "--margin",
+        type=int,
+        default=64,
+        help="rows re-inferred before each new band so edge defects are seen whole",
+    )
+    parser.add_argument(
+        "--min-band",
+        type=float,
+        default=0.5,
+        help="infer once this fraction of a frame is new strip (default 0.5)",
+    )
+    parser.add_argument(
+        "--store",
+        action="store_true",
+        help="also save the defects (strip coordinates) to the SQLite defect store",
+    )
+    parser.add_argument("--tiled", action="store_true", help="split wide bands into tiles")
+    parser.add_argument(
+        "--strip-crop",
+        action="store_true",
+        default=STRIP_CROP,
+        help="infer only the strip width, found every STEEL_STRIP_CROP_REFRESH frames",
+    )
+    parser.add_argument("--queue", type=int, default=8, help="decoded frames buffered ahead")
+    args = parser.parse_args()
+
+    frames, source_fps = open_source(args.source)
+    fps = args.fps or source_fps
+
+    rows_per_frame = None
+    if args.line_speed and args.mm_per_pixel and fps:
+        rows_per_frame = pixels_per_frame(args.line_speed, args.mm_per_pixel, fps)
+    elif args.motion == "speed":
+        parser.error("--motion speed needs --line-speed, --mm-per-pixel and a frame rate")
+
+    coil_id = args.coil_id or os.path.splitext(os.path.basename(args.source.rstrip("/\\")))[0]
+    output_path = args.output or f"{coil_id}-defects.json"
+
+    model = load_model()
+    # Bands vary in height, so only the strip width is cropped; one coil keeps its edges
+    cropper = (
+        StripCropper("x", STRIP_CROP_MARGIN, STRIP_CROP_REFRESH) if args.strip_crop else None
+    )
+    scanner = CoilScanner(
+        lambda band: detect_defects(model, band, tiled=args.tiled, cropper=cropper)[0],
+        StripPositioner(args.direction, rows_per_frame, args.motion),
+        margin=args.margin,
+        min_band=args.min_band,
+    )
+
+    frame_queue = queue.Queue(maxsize=args.queue)
+    decoder = start_decoder(frames, frame_queue)
+
+    start_time = time.perf_counter()
+    while True:
+        item = frame_queue.get()
+        if item is None:
+            break
+        if isinstance(item, Exception):
+            raise RuntimeError(f"decoding {args.source} failed") from item
+        scanner.process(*item)
+        if scanner.frames % 100 == 0:
+            print(f"{scanner.frames} frames, {len(scanner.active) + len(scanner.finished)} defects")
+    defects = scanner.finish()
+    elapsed = time.perf_counter() - start_time
+    decoder.join()
+
+    records = [
+        defect.to_record(defect_id, args.mm_per_pixel)
+        for defect_id, defect in enumerate(defects, start=1)
+    ]
+    stats = scanner.stats()
+    report = {
+        "coil": coil_id,
+        "source": args.source,
+        "length_px": round(scanner.coil_length, 1),
+        "length_mm": round(scanner.coil_length * args.mm_per_pixel, 1)
+        if args.mm_per_pixel
+        else None,
+        "processing_fps": round(stats["frames"] / elapsed, 2) if elapsed > 0 else 0.0,
+        **stats,
+        "strip_crop": cropper.stats() if cropper else None,
+        "defects": records,
+    }
+    with open(output_path, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+
+    if args.store:
+        store = DefectStore()
+        class_names = sorted({defect.class_name for defect in defects})
+        store.write(
+            [
+                (
+                    {
+                        "path": args.source,
+                        "content_key": f"coil:{coil_id}",
+                        "model_id": model.model_id,
+                        "coil": coil_id,
+                    },
+                    make_predictions(
+                        [defect.box for defect in defects],
+                        [defect.confidence for defect in defects],
+                        [class_names.index(defect.class_name) for defect in defects],
+                        class_names,
+                    ),
+                )
+            ]
+        )
+        store.close()
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            for record in records:
+                writer.writerow({"coil": coil_id, **record})
+
+    print(
+        f"Coil {coil_id}: {len(records)} defects over {report['length_px']:.0f} rows, "
+        f"{stats['frames']} frames in {elapsed:.1f}s ({report['processing_fps']:.1f} fps"
+        + (f", source {fps:.1f} fps" if fps else "")
+        + f"), inferred {stats['inferred_frames']} bands covering "
+        f"{stats['inferred_row_fraction'] * 100:.0f}% of decoded rows"
+    )
+    if cropper:
+        print(
+            f"Strip crop: {cropper.stats()['pixel_reduction'] * 100:.0f}% fewer pixels inferred "
+            f"({cropper.searches} edge searches)"
+        )
+    print(f"Defect list written to {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
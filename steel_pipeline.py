@@ -0,0 +1,197 @@
+import os
+
+import numpy as np
+
+from boxes import fuse_boxes, iou_matrix, nms, nms_matrix
+from detector import (
+    batch_size_for,
+    infer_batch,
+    load_detector,
+    make_predictions,
+    predictions_to_arrays,
+)
+from renderer import render_confidence
+from strip_crop import offset_predictions
+from tiling import infer_tiled
+
+# Detection thresholds shared by the steel scripts
+CONFIDENCE = 0.5
+IOU_THRESHOLD = 0.5
+
+# The GUIs keep every box above this score, before NMS, so the thresholds can be
+# changed afterwards without running inference again
+CANDIDATE_CONFIDENCE = float(os.getenv("STEEL_CANDIDATE_CONFIDENCE", "0.05"))
+# Largest candidate set whose pairwise IoU matrix is kept for re-filtering (16 MB)
+CANDIDATE_MATRIX_LIMIT = 2048
+
+# Tiled inference for images larger than the model input
+TILED = os.getenv("STEEL_TILED", "0") == "1"
+TILE_SIZE = int(os.getenv("STEEL_TILE_SIZE", "640"))
+TILE_OVERLAP = int(os.getenv("STEEL_TILE_OVERLAP", "128"))
+TILE_WORKERS = int(os.getenv("STEEL_TILE_WORKERS", "4"))
+TILE_MERGE = os.getenv("STEEL_TILE_MERGE", "nms")
+
+
+def load_model():
+    # Backend (roboflow, onnx or stub) is selected through DETECTOR_BACKEND
+    return load_detector()
+
+
+def detect_defects(
+    model,
+    frame,
+    tiled=None,
+    confidence=CONFIDENCE,
+    iou_threshold=IOU_THRESHOLD,
+    cropper=None,
+):
+    # Returns the predictions and, when the image was tiled, its TileStats. With a
+    # StripCropper only the strip region is inferred and boxes are mapped back.
+    if cropper is not None:
+        view, (x0, y0) = cropper.crop(frame)
+        predictions, tile_stats = detect_defects(model, view, tiled, confidence, iou_threshold)
+        return offset_predictions(predictions, x0, y0), tile_stats
+
+    tiled = TILED if tiled is None else tiled
+    if tiled and max(frame.shape[:2]) > TILE_SIZE:
+        return infer_tiled(
+            model,
+            frame,
+            tile_size=TILE_SIZE,
+            overlap=TILE_OVERLAP,
+            confidence=confidence,
+            iou_threshold=iou_threshold,
+            workers=TILE_WORKERS,
+            merge=TILE_MERGE,
+        )
+
+    results = model.infer(image=frame, confidence=confidence, iou_threshold=iou_threshold)
+    return results[0].predictions, None
+
+
+def detect_defects_batch(
+    model,
+    frames,
+    tiled=None,
+    confidence=CONFIDENCE,
+    iou_threshold=IOU_THRESHOLD,
+    cropper=None,
+):
+    # detect_defects for several images at once: untiled frames share batched
+    # forward passes, tiled ones are tiled one image at a time
+    tiled = TILED if tiled is None else tiled
+    if tiled:
+        return [
+            detect_defects(model, frame, True, confidence, iou_threshold, cropper)
+            for frame in frames
+        ]
+    offsets = [(0, 0)] * len(frames)
+    if cropper is not None:
+        frames, offsets = zip(*(cropper.crop(frame) for frame in frames))
+    results = infer_batch(
+        model, list(frames), confidence=confidence, iou_threshold=iou_threshold
+    )
+    return [
+        (offset_predictions(result.predictions, x0, y0), None)
+        for result, (x0, y0) in zip(results, offsets)
+    ]
+
+
+def detect_candidates_batch(model, frames, tiled=None, cropper=None):
+    # Every box above CANDIDATE_CONFIDENCE with NMS disabled (IoU 1.0), for CandidateFilter
+    return detect_defects_batch(model, frames, tiled, CANDIDATE_CONFIDENCE, 1.0, cropper)
+
+
+def candidate_merge(frame, tiled=None):
+    # How CandidateFilter merges overlapping candidates of this frame: tiled images
+    # use the seam merge of STEEL_TILE_MERGE, which IoU 1.0 left to the filter
+    tiled = TILED if tiled is None else tiled
+    return TILE_MERGE if tiled and max(frame.shape[:2]) > TILE_SIZE else "nms"
+
+
+class CandidateFilter:
+    # Raw candidates of one image sorted by score. filter() applies the score
+    # thresholds and class-aware NMS (or box fusion with merge="fuse"); after
+    # cache_overlaps() the pairwise IoU is computed once, so re-filtering the
+    # displayed image costs a few milliseconds.
+
+    def __init__(self, predictions, merge="nms"):
+        boxes, scores, class_ids, self.class_names = predictions_to_arrays(predictions)
+        order = np.argsort(-scores, kind="stable")
+        self.boxes, self.scores, self.class_ids = boxes[order], scores[order], class_ids[order]
+        self.merge = merge
+        self.iou = None
+
+    def __len__(self):
+        return len(self.scores)
+
+    def cache_overlaps(self):
+        # Boxes of different classes never overlap; very large sets keep using nms(),
+        # and fusion needs the boxes themselves
+        if self.merge == "nms" and self.iou is None and len(self) <= CANDIDATE_MATRIX_LIMIT:
+            self.iou = iou_matrix(self.boxes, self.boxes)
+            self.iou[self.class_ids[:, None] != self.class_ids[None, :]] = 0
+
+    def filter(self, confidence=CONFIDENCE, iou_threshold=IOU_THRESHOLD, class_confidence=None):
+        # class_confidence overrides the score threshold per class name
+        thresholds = np.full(len(self.class_names), confidence, dtype=np.float32)
+        for class_name, value in (class_confidence or {}).items():
+            if class_name in self.class_names:
+                thresholds[self.class_names.index(class_name)] = value
+        selected = np.flatnonzero(self.scores >= thresholds[self.class_ids])
+        if self.merge == "fuse":
+            boxes, scores, leaders = fuse_boxes(
+                self.boxes[selected],
+                self.scores[selected],
+                iou_threshold,
+                self.class_ids[selected],
+            )
+            return make_predictions(
+                boxes, scores, self.class_ids[selected][leaders], self.class_names
+            )
+        if self.iou is not None:
+            keep = selected[nms_matrix(self.iou[np.ix_(selected, selected)], iou_threshold)]
+        else:
+            keep = selected[
+                nms(
+                    self.boxes[selected],
+                    self.scores[selected],
+                    iou_threshold,
+                    self.class_ids[selected],
+                )
+            ]
+        return make_predictions(
+            self.boxes[keep], self.scores[keep], self.class_ids[keep], self.class_names
+        )
+
+
+def batch_chunks(model, paths):
+    # Splits selected files into groups of the model batch size, so only one
+    # group of full-resolution frames is held in memory at a time
+    size = batch_size_for(model) if len(paths) > 1 else 1
+    return [paths[start : start + size] for start in range(0, len(paths), size)], size
+
+
+def detection_variant(tiled=None, cropper=None):
+    # Settings besides model and thresholds that change the predictions, for cache keys
+    tiled = TILED if tiled is None else tiled
+    variant = f"tiled:{TILE_SIZE}:{TILE_OVERLAP}:{TILE_MERGE}" if tiled else "full"
+    if cropper is not None:
+        variant += f":strip{cropper.axes}:{cropper.margin}"
+    return variant
+
+
+def annotate_defects(frame, predictions):
+    # Plot image with bounding box and label, returns "class: confidence%" strings
+    return render_confidence(frame, predictions)
+
+
+def prediction_to_record(prediction):
+    return {
+        "class": prediction.class_name,
+        "confidence": round(float(prediction.confidence), 4),
+        "x": float(prediction.x),
+        "y": float(prediction.y),
+        "width": float(prediction.width),
+        "height": float(prediction.height),
+    }
@@ -0,0 +1,244 @@
+import os
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from detector import make_predictions, predictions_to_arrays
+
+# Crop steel images to the strip before inference (rollers, edges and background
+# are never sent to the model). STEEL_STRIP_CROP_REFRESH frames of one coil share
+# a region before it is searched again.
+STRIP_CROP = os.getenv("STEEL_STRIP_CROP", "0") == "1"
+STRIP_CROP_MARGIN = int(os.getenv("STEEL_STRIP_CROP_MARGIN", "16"))
+STRIP_CROP_REFRESH = int(os.getenv("STEEL_STRIP_CROP_REFRESH", "25"))
+# Whether the strip is brighter ("bright") or darker ("dark") than its background;
+# "auto" takes whichever side has one wide run clear of the frame edges
+STRIP_POLARITY = os.getenv("STEEL_STRIP_POLARITY", "bright")
+
+# Profile resolution, smallest strip-vs-background step (grey levels) worth
+# cropping and the narrowest strip accepted (fraction of the axis)
+PROFILE_SAMPLES = 512
+MIN_CONTRAST = 20
+MIN_STRIP_FRACTION = 0.2
+
+CropStats = namedtuple("CropStats", ["region", "ratio", "crop_ms", "searched"])
+
+
+def wide_runs(mask, gap):
+    # (start, end) of the runs of mask at least MIN_STRIP_FRACTION long, after
+    # closing narrow gaps, e.g. a streak along the strip darker than its surroundings
+    mask = cv2.morphologyEx(
+        mask.astype(np.uint8)[None], cv2.MORPH_CLOSE, np.ones((1, 2 * gap + 1), np.uint8)
+    )[0].astype(bool)
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], mask, [False])).astype(np.int8)))
+    return [
+        (int(start), int(end))
+        for start, end in zip(edges[::2], edges[1::2])
+        if end - start >= MIN_STRIP_FRACTION * len(mask)
+    ]
+
+
+def strip_span(profile, gap, polarity=STRIP_POLARITY):
+    # The one wide run of samples on the strip's side (polarity) of an Otsu split
+    # of the intensity profile, wherever it lies in the frame. None when there is
+    # no clear strip/background step or several runs could be the strip.
+    if np.ptp(profile) < MIN_CONTRAST:
+        return None
+    level = np.clip(profile, 0, 255).astype(np.uint8)[None]
+    _, bright = cv2.threshold(level, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if polarity == "auto":
+        runs = [
+            run
+            for side in (1, 0)
+            for run in wide_runs(bright[0] == side, gap)
+            if run[0] > 0 and run[1] < len(profile)
+        ]
+    else:
+        runs = wide_runs(bright[0] == (polarity == "bright"), gap)
+    if len(runs) != 1:
+        return None
+    start, end = runs[0]
+
+    # Snap each boundary to the strongest edge of the profile next to it
+    gradient = np.abs(np.diff(profile))
+    if start > 0:
+        window = slice(max(start - 3, 0), min(start + 2, len(gradient)))
+        start = window.start + int(gradient[window].argmax()) + 1
+    if end < len(profile):
+        window = slice(max(end - 3, 0), min(end + 2, len(gradient)))
+        end = window.start + int(gradient[window].argmax()) + 1
+    return start, end
+
+
+def edge_step(profile, boundary, width, sign):
+    # Intensity step across boundary (inside minus outside); sign is +1 when the
+    # strip lies after the boundary
+    before = profile[max(boundary - width, 0) : boundary].mean()
+    after = profile[boundary : boundary + width].mean()
+    return (after - before) * sign
+
+
+def axis_span(bands):
+    # bands: (3, samples) intensity profiles of three stripes across the frame.
+    # The strip is found on their average; a strip edge runs through the whole
+    # frame, so each kept boundary must also be a step in all three stripes (a
+    # large defect or a roller shadow only shows up in some of them).
+    samples = bands.shape[1]
+    gap = max(samples // 50, 1)
+    span = strip_span(bands.mean(axis=0), gap)
+    if span is None:
+        return None
+    start, end = span
+    if start == 0 and end == samples:
+        return None
+    whole = bands.mean(axis=0)
+    bounds = []
+    for boundary, sign, outer in ((start, 1, min), (end, -1, max)):
+        if boundary in (0, samples):
+            bounds.append(boundary)
+            continue
+        direction = np.sign(edge_step(whole, boundary, gap, sign))
+        steps = [direction * edge_step(profile, boundary, gap, sign) for profile in bands]
+        if min(steps) < MIN_CONTRAST / 2:
+            return None
+        # A skewed strip crosses each stripe at a slightly different place; keep
+        # the outermost, so no strip is cut off
+        window = slice(max(boundary - 2 * gap, 0), min(boundary + 2 * gap, samples - 1))
+        edges = np.abs(np.diff(bands, axis=1))[:, window].argmax(axis=1) + window.start + 1
+        bounds.append(outer(outer(edges), boundary))
+    return bounds[0], bounds[1]
+
+
+def profiles(frame, axis, samples):
+    # Average intensity of three stripes along axis (1 = columns, 0 = rows). A
+    # strided view thins the frame first, then an area resize goes straight to
+    # (3, samples), so no full-size grey copy is made.
+    length = frame.shape[axis]
+    samples = min(length, samples)
+    across = frame.shape[1 - axis]
+    steps = [1, 1]
+    steps[axis] = max(length // (2 * samples), 1)
+    steps[1 - axis] = max(across // 96, 1)
+    thinned = frame[:: steps[0], :: steps[1]]
+    size = (samples, 3) if axis == 1 else (3, samples)
+    small = cv2.resize(thinned, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+    if small.ndim == 3:
+        small = small.mean(axis=2)
+    return small if axis == 1 else small.T
+
+
+def find_strip(frame, axes="xy", margin=STRIP_CROP_MARGIN):
+    # (x0, y0, x1, y1) of the strip plus margin; axes without a clear edge keep
+    # their full extent
+    height, width = frame.shape[:2]
+    region = [0, 0, width, height]
+    for axis, name in ((1, "x"), (0, "y")):
+        if name not in axes:
+            continue
+        bands = profiles(frame, axis, PROFILE_SAMPLES)
+        span = axis_span(bands)
+        if span is None:
+            continue
+        length = frame.shape[axis]
+        scale = length / bands.shape[1]
+        start = max(int(span[0] * scale) - margin, 0)
+        end = min(int(np.ceil(span[1] * scale)) + margin, length)
+        region[1 - axis], region[3 - axis] = start, end
+    return tuple(region)
+
+
+def offset_predictions(predictions, x0, y0):
+    # Boxes found on a crop back in full-frame coordinates, as Prediction tuples
+    # whatever the backend returned (class ids are kept as the backend gave them)
+    if not x0 and not y0:
+        return predictions
+    boxes, scores, class_ids, class_names = predictions_to_arrays(predictions)
+    boxes += np.array([x0, y0, x0, y0], dtype=boxes.dtype)
+    return [
+        shifted._replace(class_id=getattr(prediction, "class_id", shifted.class_id))
+        for shifted, prediction in zip(
+            make_predictions(boxes, scores, class_ids, class_names), predictions
+        )
+    ]
+
+
+class StripCropper:
+    # Finds the strip region and reuses it for the next refresh - 1 frames of the
+    # same size, so consecutive frames of a coil skip the search. refresh=1
+    # searches every image (independent files may come from different coils).
+    # With axes="x" only the strip width is cropped and the row count may vary.
+
+    def __init__(self, axes="xy", margin=STRIP_CROP_MARGIN, refresh=1):
+        self.axes = axes
+        self.margin = margin
+        self.refresh = refresh
+        self.region = None
+        self.key = None
+        self.age = 0
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.searches = 0
+        self.pixels = 0
+        self.cropped_pixels = 0
+        self.last = None
+
+    def crop(self, frame):
+        # Returns the strip view (no copy) and its (x0, y0) offset
+        start_time = time.perf_counter()
+        height, width = frame.shape[:2]
+        key = width if self.axes == "x" else (height, width)
+        with self.lock:
+            searched = self.key != key or self.age >= self.refresh
+            if searched:
+                self.region = find_strip(frame, self.axes, self.margin)
+                self.key = key
+                self.age = 0
+                self.searches += 1
+            self.age += 1
+            x0, y0, x1, y1 = self.region
+        if self.axes == "x":
+            y0, y1 = 0, height
+
+        view = frame[y0:y1, x0:x1]
+        ratio = view.shape[0] * view.shape[1] / (height * width)
+        with self.lock:
+            self.frames += 1
+            self.pixels += height * width
+            self.cropped_pixels += view.shape[0] * view.shape[1]
+            self.last = CropStats(
+                (x0, y0, x1, y1), ratio, (time.perf_counter() - start_time) * 1000, searched
+            )
+        return view, (x0, y0)
+
+    def reset(self):
+        # Next frame searches again, e.g. at the start of a new coil
+        with self.lock:
+            self.key = None
+
+    def stats(self):
+        with self.lock:
+            return {
+                "frames": self.frames,
+                "searches": self.searches,
+                "pixel_ratio": round(self.cropped_pixels / self.pixels, 4) if self.pixels else 1.0,
+                "pixel_reduction": round(1 - self.cropped_pixels / self.pixels, 4)
+                if self.pixels
+                else 0.0,
+            }
+
+
+def make_cropper(axes="xy", refresh=1):
+    # None unless STEEL_STRIP_CROP=1
+    return StripCropper(axes, STRIP_CROP_MARGIN, refresh) if STRIP_CROP else None
+
+
+def format_crop(stats):
+    x0, y0, x1, y1 = stats.region
+    return (
+        f"Strip crop: {stats.ratio * 100:.0f}% of pixels to the model "
+        f"(x {x0}-{x1}, y {y0}-{y1}, {stats.crop_ms:.1f}ms"
+        + (")" if stats.searched else ", cached)")
+    )
@@ -0,0 +1,52 @@
+import numpy as np
+
+from boxes import iou_matrix, nms, nms_matrix
+
+
+def random_boxes(rng, count, scale=100.0, offset=0.0):
+    top_left = rng.uniform(0, scale, size=(count, 2)) + offset
+    size = rng.uniform(1, scale / 4, size=(count, 2))
+    return np.concatenate([top_left, top_left + size], axis=1).astype(np.float32)
+
+
+def test_nms_matrix_matches_nms_on_random_boxes():
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        boxes = random_boxes(rng, 60)
+        scores = rng.uniform(0, 1, size=60).astype(np.float32)
+        order = np.argsort(-scores, kind="stable")
+        for threshold in (0.3, 0.5, 0.7):
+            expected = np.sort(nms(boxes, scores, threshold))
+            keep = nms_matrix(iou_matrix(boxes[order], boxes[order]), threshold)
+            assert np.sort(order[keep]).tolist() == expected.tolist()
+
+
+def test_nms_keeps_best_of_overlapping_boxes():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [50, 50, 60, 60]], dtype=np.float32)
+    scores = np.array([0.8, 0.9, 0.7], dtype=np.float32)
+    assert nms(boxes, scores, 0.5).tolist() == [1, 2]
+    # IoU 1.0 keeps every candidate, best first
+    assert nms(boxes, scores, 1.0).tolist() == [1, 0, 2]
+
+
+def test_nms_classes_never_suppress_each_other_with_negative_coordinates():
+    # With an offset of max + 1 (0 here) the class 1 copy would land on the class 0 box
+    boxes = np.array([[-100, -100, -1, -1], [-100, -100, -1, -1]], dtype=np.float32)
+    scores = np.array([0.9, 0.8], dtype=np.float32)
+    assert nms(boxes, scores, 0.5).tolist() == [0]
+    assert nms(boxes, scores, 0.5, class_ids=[0, 1]).tolist() == [0, 1]
+
+
+def test_nms_class_offset_with_large_coordinates_and_class_ids():
+    rng = np.random.default_rng(1)
+    boxes = random_boxes(rng, 200, scale=20000.0, offset=-10000.0)
+    scores = rng.uniform(0, 1, size=200).astype(np.float32)
+    class_ids = rng.integers(0, 50, size=200) * 7
+
+    # Class-aware NMS must equal running plain NMS class by class
+    expected = []
+    for class_id in np.unique(class_ids):
+        members = np.flatnonzero(class_ids == class_id)
+        expected.extend(members[nms(boxes[members], scores[members], 0.5)].tolist())
+    kept = nms(boxes, scores, 0.5, class_ids=class_ids)
+    assert sorted(kept.tolist()) == sorted(expected)
@@ -0,0 +1,53 @@
+import numpy as np
+
+from evaluate import IOU_THRESHOLDS, average_precision, match_detections
+
+
+def test_match_detections_same_class_by_score():
+    gt_boxes = np.array([[0, 0, 10, 10], [20, 20, 30, 30]], dtype=np.float32)
+    gt_names = np.array(["scratch", "scratch"], dtype=object)
+    boxes = np.array([[0, 0, 10, 10], [50, 50, 60, 60], [20, 20, 30, 30], [0, 0, 10, 10]])
+    scores = np.array([0.9, 0.8, 0.7, 0.6], dtype=np.float32)
+    names = np.array(["scratch", "scratch", "scratch", "scratch"], dtype=object)
+
+    tp = match_detections(boxes, scores, names, gt_boxes, gt_names)
+
+    # The second box on the first ground truth is a duplicate, not a hit
+    assert tp.shape == (4, len(IOU_THRESHOLDS))
+    assert tp[:, 0].tolist() == [True, False, True, False]
+    assert tp.all(axis=0).sum() == 0
+
+
+def test_match_detections_class_and_threshold():
+    gt_boxes = np.array([[0, 0, 10, 10]], dtype=np.float32)
+    gt_names = np.array(["scratch"], dtype=object)
+    # IoU 0.6 with the ground truth: a hit at thresholds up to 0.6 only
+    boxes = np.array([[0, 0, 10, 6], [0, 0, 10, 10]], dtype=np.float32)
+    scores = np.array([0.9, 0.8], dtype=np.float32)
+    names = np.array(["scratch", "inclusion"], dtype=object)
+
+    tp = match_detections(boxes, scores, names, gt_boxes, gt_names)
+
+    assert tp[0].tolist() == (IOU_THRESHOLDS <= 0.6 + 1e-6).tolist()
+    assert not tp[1].any()
+
+
+def test_average_precision_hand_computed():
+    # Hit, miss, hit against two ground truths: precision 1, 1/2, 2/3 at recall
+    # 1/2, 1/2, 1. The envelope is 1 for the 51 recall points up to 0.5 and 2/3
+    # for the 50 above, so AP = (51 + 50 * 2/3) / 101.
+    tp = np.repeat(np.array([[True], [False], [True]]), len(IOU_THRESHOLDS), axis=1)
+    scores = np.array([0.9, 0.8, 0.7], dtype=np.float32)
+
+    ap = average_precision(tp, scores, gt_count=2)
+
+    np.testing.assert_allclose(ap, (51 + 50 * 2 / 3) / 101)
+
+
+def test_average_precision_sorts_by_score_and_handles_no_detections():
+    # Both hits outrank the miss once sorted, so every recall point has precision 1
+    tp = np.array([[False], [True], [True]])
+    scores = np.array([0.7, 0.8, 0.9], dtype=np.float32)
+    np.testing.assert_allclose(average_precision(tp, scores, gt_count=2), [1.0])
+
+    assert average_precision(np.zeros((0, 3), dtype=bool), np.zeros(0), 2).tolist() == [0, 0, 0]
@@ -0,0 +1,111 @@
+import tkinter as tk
+from tkinter import ttk
+
+from defect_table import ALL_CLASSES
+
+
+class ThresholdPanel(ttk.Frame):
+    # Confidence and IoU sliders for re-filtering the candidates of the last
+    # inference. The confidence applies to all classes unless a class is picked
+    # in the menu, which then gets its own threshold for the rest of the session.
+
+    def __init__(self, parent, confidence, iou_threshold, minimum_confidence, on_change=None):
+        super().__init__(parent)
+        self.confidence = confidence
+        self.iou_threshold = iou_threshold
+        self.class_confidence = {}
+        self.class_names = []
+        self.on_change = on_change
+
+        sliders = ttk.Frame(self)
+        sliders.pack(fill="x")
+        self.class_var = tk.StringVar(value=ALL_CLASSES)
+        self.class_menu = ttk.OptionMenu(sliders, self.class_var, ALL_CLASSES, ALL_CLASSES)
+        self.class_menu.pack(side="left", anchor="s")
+        self.confidence_scale = tk.Scale(
+            sliders,
+            label="Confidence",
+            from_=minimum_confidence,
+            to=1.0,
+            resolution=0.01,
+            orient="horizontal",
+            length=110,
+            command=self.confidence_changed,
+        )
+        self.confidence_scale.set(confidence)
+        self.confidence_scale.pack(side="left", padx=5)
+        self.iou_scale = tk.Scale(
+            sliders,
+            label="NMS IoU",
+            from_=0.05,
+            to=0.95,
+            resolution=0.05,
+            orient="horizontal",
+            length=90,
+            command=self.iou_changed,
+        )
+        self.iou_scale.set(iou_threshold)
+        self.iou_scale.pack(side="left", padx=5)
+        ttk.Button(sliders, text="Reset", width=6, command=self.reset).pack(side="left", anchor="s")
+
+        self.status = ttk.Label(self, text="", wraplength=380)
+        self.status.pack(anchor="w")
+        self.set_classes([])
+
+    def set_classes(self, class_names):
+        # Classes seen so far in the session, so per-class thresholds carry over
+        for class_name in class_names:
+            if class_name not in self.class_names:
+                self.class_names.append(class_name)
+        menu = self.class_menu["menu"]
+        menu.delete(0, "end")
+        for name in [ALL_CLASSES] + sorted(self.class_names):
+            menu.add_command(label=name, command=lambda n=name: self.choose_class(n))
+
+    def choose_class(self, name):
+        self.class_var.set(name)
+        # The slider shows the threshold of the chosen class; setting it to the
+        # same value is ignored by confidence_changed
+        self.confidence_scale.set(self.class_confidence.get(name, self.confidence))
+
+    def confidence_changed(self, value):
+        value = float(value)
+        class_name = self.class_var.get()
+        if class_name == ALL_CLASSES:
+            if value == self.confidence:
+                return
+            self.confidence = value
+        else:
+            if value == self.class_confidence.get(class_name, self.confidence):
+                return
+            self.class_confidence[class_name] = value
+        self.changed()
+
+    def iou_changed(self, value):
+        value = float(value)
+        if value != self.iou_threshold:
+            self.iou_threshold = value
+            self.changed()
+
+    def reset(self):
+        # Drops the per-class thresholds, the shared ones stay
+        self.class_confidence = {}
+        self.choose_class(ALL_CLASSES)
+        self.changed()
+
+    def values(self):
+        # Arguments for CandidateFilter.filter
+        return self.confidence, self.iou_threshold, dict(self.class_confidence)
+
+    def report(self, kept, candidates, elapsed_ms):
+        overrides = ", ".join(
+            f"{name} {value:.2f}" for name, value in sorted(self.class_confidence.items())
+        )
+        text = f"{kept} of {candidates} candidates kept ({elapsed_ms:.1f}ms)"
+        if overrides:
+            text += f"; per class: {overrides}"
+        self.status.config(text=text)
+
+    def changed(self):
+        if self.on_change:
+            self.on_change()
@@ -0,0 +1,213 @@
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from boxes import fuse_boxes, nms, overlap_matrix
+from detector import make_predictions, predictions_to_arrays
+
+TileStats = namedtuple("TileStats", ["tiles", "tile_ms", "merge_ms"])
+
+# Pieces of a defect cut by a tile border: a box within SEAM_MARGIN pixels of a
+# border its tile shares with a neighbour matches a box of another tile when the
+# intersection covers SEAM_OVERLAP of the smaller one (as CoilScanner matches bands),
+# over the whole boxes or over their parts inside the area both tiles cover
+SEAM_MARGIN = 2
+SEAM_OVERLAP = 0.6
+
+
+def tile_starts(length, tile_size, overlap):
+    # Evenly stepped starts with the last tile flush against the far edge
+    if length <= tile_size:
+        return [0]
+    step = max(tile_size - overlap, 1)
+    starts = list(range(0, length - tile_size, step))
+    starts.append(length - tile_size)
+    return starts
+
+
+def make_tiles(shape, tile_size, overlap):
+    height, width = shape[:2]
+    return [
+        (x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+        for y0 in tile_starts(height, tile_size, overlap)
+        for x0 in tile_starts(width, tile_size, overlap)
+    ]
+
+
+def merge_detections(boxes, scores, class_ids, iou_threshold, method="nms"):
+    # Collapse duplicates of the same defect found by neighbouring tiles
+    if method == "fuse":
+        return fuse_boxes(boxes, scores, iou_threshold, class_ids)
+    keep = nms(boxes, scores, iou_threshold, class_ids)
+    return boxes[keep], scores[keep], keep
+
+
+def seam_flags(boxes, tile_boxes, shape, margin=SEAM_MARGIN):
+    # Whether each box reaches a border of its tile that lies inside the image,
+    # where the defect may continue in the neighbouring tile
+    height, width = shape[:2]
+    x0, y0, x1, y1 = tile_boxes.T
+    return (
+        ((boxes[:, 0] <= x0 + margin) & (x0 > 0))
+        | ((boxes[:, 1] <= y0 + margin) & (y0 > 0))
+        | ((boxes[:, 2] >= x1 - margin) & (x1 < width))
+        | ((boxes[:, 3] >= y1 - margin) & (y1 < height))
+    )
+
+
+def shared_overlap(boxes_a, tiles_a, boxes_b, tiles_b):
+    # overlap_matrix of the parts of two boxes inside the area their tiles share.
+    # Two pieces cut at different borders overlap little as a whole, but both
+    # tiles saw the same part of the defect there.
+    region = np.concatenate(
+        [
+            np.maximum(tiles_a[:, None, :2], tiles_b[None, :, :2]),
+            np.minimum(tiles_a[:, None, 2:], tiles_b[None, :, 2:]),
+        ],
+        axis=2,
+    )
+
+    def clip(boxes):
+        top_left = np.maximum(boxes[..., :2], region[..., :2])
+        return np.concatenate([top_left, np.minimum(boxes[..., 2:], region[..., 2:])], axis=2)
+
+    def area(boxes):
+        return np.prod(np.clip(boxes[..., 2:] - boxes[..., :2], 0, None), axis=2)
+
+    parts_a, parts_b = clip(boxes_a[:, None, :]), clip(boxes_b[None, :, :])
+    top_left = np.maximum(parts_a[..., :2], parts_b[..., :2])
+    bottom_right = np.minimum(parts_a[..., 2:], parts_b[..., 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    smaller = np.minimum(area(parts_a), area(parts_b))
+    return np.where(smaller > 0, intersection / np.maximum(smaller, 1e-9), 0.0)
+
+
+def seam_matches(boxes, class_ids, tile_ids, tile_boxes, rows, columns, threshold):
+    # Same-class boxes of different tiles that overlap as described at SEAM_OVERLAP
+    same = (overlap_matrix(boxes[rows], boxes[columns]) >= threshold) | (
+        shared_overlap(boxes[rows], tile_boxes[rows], boxes[columns], tile_boxes[columns])
+        >= threshold
+    )
+    same &= class_ids[rows, None] == class_ids[None, columns]
+    same &= tile_ids[rows, None] != tile_ids[None, columns]
+    return same
+
+
+def merge_seams(
+    boxes, scores, class_ids, tile_ids, tile_boxes, at_seam, overlap_threshold=SEAM_OVERLAP
+):
+    # A clipped piece has a low IoU with the whole box (or another piece), so the
+    # IoU merge keeps both. Boxes of different tiles, one of them at a seam, are
+    # grouped by overlap instead; each group becomes the union of its boxes with
+    # the best score. Returns boxes, scores and each group's leading box index.
+    group = np.arange(len(boxes))
+    seam = np.flatnonzero(at_seam)
+    if len(seam):
+        everything = np.arange(len(boxes))
+        same = seam_matches(
+            boxes, class_ids, tile_ids, tile_boxes, seam, everything, overlap_threshold
+        )
+        # Only boxes matched by a seam box take part in the grouping
+        involved = np.union1d(seam, np.flatnonzero(same.any(axis=0)))
+        same = seam_matches(
+            boxes, class_ids, tile_ids, tile_boxes, involved, involved, overlap_threshold
+        )
+        same &= at_seam[involved, None] | at_seam[None, involved]
+
+        assigned = np.zeros(len(involved), dtype=bool)
+        for index in np.argsort(-scores[involved], kind="stable"):
+            if assigned[index]:
+                continue
+            members = (same[index] & ~assigned) | (np.arange(len(involved)) == index)
+            assigned |= members
+            group[involved[members]] = involved[index]
+
+    leaders, group = np.unique(group, return_inverse=True)
+    merged = np.empty((len(leaders), 4), dtype=np.float32)
+    merged[:, :2], merged[:, 2:] = np.inf, -np.inf
+    for axis in range(2):
+        np.minimum.at(merged[:, axis], group, boxes[:, axis])
+        np.maximum.at(merged[:, axis + 2], group, boxes[:, axis + 2])
+    best = np.full(len(leaders), -np.inf, dtype=np.float32)
+    np.maximum.at(best, group, scores)
+    return merged, best, leaders
+
+
+def infer_tiled(
+    model,
+    frame,
+    tile_size=640,
+    overlap=128,
+    confidence=0.5,
+    iou_threshold=0.5,
+    workers=4,
+    merge="nms",
+):
+    tiles = make_tiles(frame.shape, tile_size, overlap)
+
+    def run_tile(tile):
+        x0, y0, x1, y1 = tile
+        start_time = time.perf_counter()
+        results = model.infer(
+            image=frame[y0:y1, x0:x1],
+            confidence=confidence,
+            iou_threshold=iou_threshold,
+        )
+        tile_time = (time.perf_counter() - start_time) * 1000
+        return results[0].predictions, tile_time, dict(getattr(model, "timings", {}))
+
+    # Inference engines release the GIL, so tiles overlap on a thread pool
+    if workers > 1 and len(tiles) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(tiles))) as executor:
+            tile_results = list(executor.map(run_tile, tiles))
+    else:
+        tile_results = [run_tile(tile) for tile in tiles]
+
+    # Backend sub-stage timings summed over the tiles, as the caller's timings of
+    # this image for record_detector()
+    if hasattr(model, "timings"):
+        totals = {}
+        for _, _, timings in tile_results:
+            for stage, milliseconds in timings.items():
+                totals[stage] = totals.get(stage, 0.0) + milliseconds
+        model.timings = totals
+
+    merge_start = time.perf_counter()
+
+    # Map every tile's boxes back into full-image coordinates in one array
+    all_boxes, all_scores, all_names, all_tiles = [], [], [], []
+    for index, ((x0, y0, _, _), (predictions, _, _)) in enumerate(zip(tiles, tile_results)):
+        boxes, scores, class_ids, class_names = predictions_to_arrays(predictions)
+        all_boxes.append(boxes + np.array([x0, y0, x0, y0], dtype=np.float32))
+        all_scores.append(scores)
+        all_names.extend(class_names[class_id] for class_id in class_ids)
+        all_tiles.append(np.full(len(scores), index, dtype=np.int64))
+
+    boxes = np.concatenate(all_boxes) if all_boxes else np.empty((0, 4), np.float32)
+    scores = np.concatenate(all_scores) if all_scores else np.empty(0, np.float32)
+    tile_ids = np.concatenate(all_tiles) if all_tiles else np.empty(0, np.int64)
+    class_names, class_ids = np.unique(np.asarray(all_names, dtype=object), return_inverse=True)
+    tile_boxes = np.asarray(tiles, dtype=np.float32)[tile_ids]
+    at_seam = seam_flags(boxes, tile_boxes, frame.shape)
+
+    # Pieces cut by a tile border first, so the IoU merge cannot keep a piece over
+    # the whole box, then the duplicates from the tile overlap
+    boxes, scores, kept = merge_seams(boxes, scores, class_ids, tile_ids, tile_boxes, at_seam)
+    class_ids = class_ids[kept]
+    boxes, scores, kept = merge_detections(boxes, scores, class_ids, iou_threshold, merge)
+    predictions = make_predictions(boxes, scores, class_ids[kept], list(class_names))
+    predictions.sort(key=lambda prediction: -prediction.confidence)
+
+    merge_time = (time.perf_counter() - merge_start) * 1000
+    stats = TileStats(len(tiles), [tile_time for _, tile_time, _ in tile_results], merge_time)
+    return predictions, stats
+
+
+def format_tile_stats(stats):
+    tile_ms = np.asarray(stats.tile_ms)
+    return (
+        f"Tiles: {stats.tiles}, per-tile {tile_ms.mean():.1f}ms avg / "
+        f"{tile_ms.max():.1f}ms max, merge {stats.merge_ms:.1f}ms"
+    )
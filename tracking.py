@@ -0,0 +1,243 @@
+from collections import namedtuple
+from itertools import count
+
+import cv2
+import numpy as np
+
+from boxes import iou_matrix
+from detector import predictions_to_arrays
+
+# Prediction fields plus the ID that follows an object across frames
+TrackedPrediction = namedtuple(
+    "TrackedPrediction",
+    ["x", "y", "width", "height", "class_name", "confidence", "class_id", "track_id"],
+)
+
+
+class Track:
+    def __init__(self, track_id, box, class_name, class_id, confidence):
+        self.track_id = track_id
+        self.box = np.asarray(box, dtype=np.float32)
+        # Box of the last detection; velocity is measured between detections, not
+        # against the extrapolated box
+        self.detected_box = self.box.copy()
+        self.class_name = class_name
+        self.class_id = class_id
+        self.confidence = confidence
+        self.velocity = np.zeros(2, dtype=np.float32)
+        self.frames_since_update = 0
+        self.misses = 0
+
+    def to_prediction(self):
+        x0, y0, x1, y1 = self.box.tolist()
+        return TrackedPrediction(
+            (x0 + x1) / 2,
+            (y0 + y1) / 2,
+            x1 - x0,
+            y1 - y0,
+            self.class_name,
+            self.confidence,
+            self.class_id,
+            self.track_id,
+        )
+
+
+def match_boxes(boxes_a, boxes_b, iou_threshold):
+    # Greedy one-to-one matching on a vectorized IoU matrix, best pairs first
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return []
+    iou = iou_matrix(boxes_a, boxes_b)
+    rows, cols = np.nonzero(iou > iou_threshold)
+    order = np.argsort(-iou[rows, cols], kind="stable")
+    used_a, used_b, pairs = set(), set(), []
+    for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+        if row not in used_a and col not in used_b:
+            used_a.add(row)
+            used_b.add(col)
+            pairs.append((row, col))
+    return pairs
+
+
+class IouTracker:
+    # Carries boxes forward with a constant-velocity model between detector
+    # runs and keeps IDs by IoU matching when new detections arrive
+
+    def __init__(self, iou_threshold=0.3, max_misses=3, confidence_decay=0.9):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.confidence_decay = confidence_decay
+        self.tracks = []
+        self.track_ids = count(1)
+        self.frames_since_detection = 0
+
+    @property
+    def confidence(self):
+        # How much the carried-forward boxes can still be trusted, 1.0 right after a detection
+        return self.confidence_decay**self.frames_since_detection
+
+    def predictions(self):
+        return [track.to_prediction() for track in self.tracks]
+
+    def update(self, frame, predictions):
+        boxes, scores, class_ids, class_names = predictions_to_arrays(predictions)
+        track_boxes = np.array([track.box for track in self.tracks]).reshape(-1, 4)
+        pairs = match_boxes(track_boxes, boxes, self.iou_threshold)
+
+        matched_tracks = set()
+        matched_detections = set()
+        for track_index, detection_index in pairs:
+            track = self.tracks[track_index]
+            new_box = boxes[detection_index]
+            last_box = track.detected_box
+            shift = (new_box[:2] + new_box[2:]) / 2 - (last_box[:2] + last_box[2:]) / 2
+            # This frame counts too: detections N frames apart are N frames of motion
+            track.velocity = shift / (track.frames_since_update + 1)
+            track.box = new_box.copy()
+            track.detected_box = new_box.copy()
+            track.confidence = float(scores[detection_index])
+            track.frames_since_update = 0
+            track.misses = 0
+            matched_tracks.add(track_index)
+            matched_detections.add(detection_index)
+
+        # Tracks the detector no longer sees are kept for a few runs, then dropped
+        survivors = []
+        for index, track in enumerate(self.tracks):
+            if index not in matched_tracks:
+                track.misses += 1
+                track.velocity[:] = 0
+                if track.misses > self.max_misses:
+                    continue
+            survivors.append(track)
+        self.tracks = survivors
+
+        for index in range(len(boxes)):
+            if index not in matched_detections:
+                self.tracks.append(
+                    Track(
+                        next(self.track_ids),
+                        boxes[index],
+                        class_names[class_ids[index]],
+                        getattr(predictions[index], "class_id", int(class_ids[index])),
+                        float(scores[index]),
+                    )
+                )
+
+        self.frames_since_detection = 0
+        return self.predictions()
+
+    def hold(self):
+        # The scene has not changed since the last detection (see ChangeGate), so
+        # its boxes still apply: put them back and stop extrapolating
+        for track in self.tracks:
+            track.box = track.detected_box.copy()
+            track.velocity[:] = 0
+        self.frames_since_detection = 0
+        return self.predictions()
+
+    def track(self, frame):
+        for track in self.tracks:
+            track.box += np.tile(track.velocity, 2)
+            track.frames_since_update += 1
+        self.frames_since_detection += 1
+        return self.predictions()
+
+
+class FlowTracker(IouTracker):
+    # Moves each box by the mean Lucas-Kanade optical flow of feature points
+    # found inside it; confidence is the share of points still tracked
+
+    def __init__(self, iou_threshold=0.3, max_misses=3, scale=0.5, points_per_box=20):
+        super().__init__(iou_threshold=iou_threshold, max_misses=max_misses)
+        self.scale = scale
+        self.points_per_box = points_per_box
+        self.previous_gray = None
+        # Downscaled colour frame, two grey frames (previous and current) and the
+        # feature mask, reused from frame to frame
+        self.small = None
+        self.grays = []
+        self.mask = None
+        self.points = np.empty((0, 1, 2), dtype=np.float32)
+        self.owners = np.empty(0, dtype=np.int64)
+        self.seeded_points = 0
+
+    @property
+    def confidence(self):
+        if self.seeded_points == 0:
+            return 1.0 if not self.tracks else 0.0
+        return len(self.points) / self.seeded_points
+
+    def gray(self, frame):
+        # Downscaled before the colour conversion, into whichever grey buffer does
+        # not hold the previous frame
+        height, width = frame.shape[:2]
+        size = (max(round(width * self.scale), 1), max(round(height * self.scale), 1))
+        if self.small is None or self.small.shape[:2] != size[::-1]:
+            self.small = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            self.grays = [np.empty(size[::-1], dtype=np.uint8) for _ in range(2)]
+            self.mask = np.zeros(size[::-1], dtype=np.uint8)
+            self.previous_gray = None
+        cv2.resize(frame, size, dst=self.small, interpolation=cv2.INTER_AREA)
+        gray = self.grays[0] if self.previous_gray is not self.grays[0] else self.grays[1]
+        return cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=gray)
+
+    def update(self, frame, predictions):
+        super().update(frame, predictions)
+        self.previous_gray = self.gray(frame)
+
+        # Seed fresh feature points inside every track's box
+        points, owners = [], []
+        height, width = self.previous_gray.shape
+        for index, track in enumerate(self.tracks):
+            x0, y0, x1, y1 = np.clip(
+                (track.box * self.scale).astype(np.int32), 0, [width, height, width, height]
+            ).tolist()
+            if x1 - x0 < 2 or y1 - y0 < 2:
+                continue
+            self.mask[y0:y1, x0:x1] = 255
+            corners = cv2.goodFeaturesToTrack(
+                self.previous_gray, self.points_per_box, 0.01, 3, mask=self.mask
+            )
+            self.mask[y0:y1, x0:x1] = 0
+            if corners is not None:
+                points.append(corners.astype(np.float32))
+                owners.append(np.full(len(corners), index, dtype=np.int64))
+
+        self.points = np.concatenate(points) if points else np.empty((0, 1, 2), np.float32)
+        self.owners = np.concatenate(owners) if owners else np.empty(0, np.int64)
+        self.seeded_points = len(self.points)
+        return self.predictions()
+
+    def track(self, frame):
+        gray = self.gray(frame)
+        if self.previous_gray is not None and len(self.points):
+            moved, status, _ = cv2.calcOpticalFlowPyrLK(self.previous_gray, gray, self.points, None)
+            good = status.reshape(-1) == 1
+            shift = (moved - self.points).reshape(-1, 2)[good] / self.scale
+            owners = self.owners[good]
+
+            # Mean displacement per track in one pass
+            counts = np.bincount(owners, minlength=len(self.tracks))
+            for axis in range(2):
+                sums = np.bincount(owners, weights=shift[:, axis], minlength=len(self.tracks))
+                mean = np.divide(sums, counts, out=np.zeros(len(counts)), where=counts > 0)
+                for index, track in enumerate(self.tracks):
+                    track.box[axis] += mean[index]
+                    track.box[axis + 2] += mean[index]
+
+            self.points = moved[good]
+            self.owners = owners
+
+        for track in self.tracks:
+            track.frames_since_update += 1
+        self.frames_since_detection += 1
+        self.previous_gray = gray
+        return self.predictions()
+
+
+def make_tracker(name):
+    if name == "flow":
+        return FlowTracker()
+    if name == "iou":
+        return IouTracker()
+    raise ValueError(f"Unknown tracker: {name}")